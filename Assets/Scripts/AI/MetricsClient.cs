@@ -3,6 +3,7 @@ using UnityEngine.Networking;
 using System.Collections;
 using System;
 using System.Collections.Generic;
+using System.IO;
 
 [Serializable]
 public class CrearSesionRequest
@@ -41,6 +42,7 @@ public class RegistrarIntentoRequest
     public int zona;
     public int ronda;
     public int dificultad;
+    public int secuencia; // número creciente por sesión: el servidor descarta reenvíos
 }
 
 [Serializable]
@@ -55,6 +57,7 @@ public class RegistrarErrorRequest
     public int dificultad;
     public int intentos_previos;
     public string feedback_generado;
+    public int secuencia;
 }
 
 [Serializable]
@@ -70,6 +73,19 @@ public class RegistrarAjusteRequest
     public int ronda;
 }
 
+[Serializable]
+public class SimbolosRequest
+{
+    public string[] nombres;
+}
+
+[Serializable]
+public class SimbolosResponse
+{
+    public string version;
+    public string[] nombres;
+}
+
 [Serializable]
 public class ConfiguracionResponse
 {
@@ -103,6 +119,10 @@ public class MetricsClient : MonoBehaviour
     public int estudianteId = 1; // Configurable por sesión
     public string nombreEstudiante = "Estudiante VR";
     
+    [Header("Formato binario")]
+    [Tooltip("Envía intentos y errores en el formato binario compacto (ver ServicioWeb/formato_binario.py)")]
+    public bool usarFormatoBinario = false;
+    
     [Header("Estado")]
     [SerializeField] private int sesionActualId = -1;
     [SerializeField] private bool conectado = false;
@@ -123,11 +143,22 @@ public class MetricsClient : MonoBehaviour
     private Queue<IEnumerator> colaPeticiones = new Queue<IEnumerator>();
     private bool procesandoCola = false;
 
+    // Tabla de símbolos del servidor para el formato binario
+    private const string TipoContenidoBinario = "application/x-metricas-binario";
+    private static readonly string[] TiposError = { "confusion", "tiempo_agotado", "distractor" };
+    private Dictionary<string, int> simbolos = new Dictionary<string, int>();
+    private string versionSimbolos = null;
+    private HashSet<string> simbolosPorRegistrar = new HashSet<string>();
+
     // NUEVO: Cola de intentos pendientes (cuando la sesión aún no existe)
     private List<RegistrarIntentoRequest> intentosPendientes = new List<RegistrarIntentoRequest>();
+    private int siguienteSecuencia = 0; // compartida por intentos y errores de la sesión actual
     private List<RegistrarErrorRequest> erroresPendientes = new List<RegistrarErrorRequest>();
     private bool sesionEnCreacion = false;
 
+    // Identificador estable del dispositivo para el límite de tasa del servidor
+    private string clienteId;
+
     void Awake()
     {
         if (Instance != null && Instance != this)
@@ -138,6 +169,12 @@ public class MetricsClient : MonoBehaviour
         Instance = this;
         DontDestroyOnLoad(gameObject);
         
+        clienteId = SystemInfo.deviceUniqueIdentifier;
+        if (string.IsNullOrEmpty(clienteId) || clienteId == SystemInfo.unsupportedIdentifier)
+        {
+            clienteId = Guid.NewGuid().ToString("N");
+        }
+        
         Debug.Log($"[MetricsClient] Inicializado - URL: {urlServidor}");
     }
 
@@ -155,6 +192,7 @@ public class MetricsClient : MonoBehaviour
         
         using (UnityWebRequest request = UnityWebRequest.Get(urlServidor + "/health"))
         {
+            AgregarCabecerasCliente(request);
             request.timeout = 5;
             yield return request.SendWebRequest();
             
@@ -174,6 +212,10 @@ public class MetricsClient : MonoBehaviour
         if (conectado)
         {
             yield return CargarConfiguracionCoroutine();
+            if (usarFormatoBinario)
+            {
+                yield return CargarSimbolosCoroutine(null);
+            }
         }
         
         verificandoConexion = false;
@@ -239,6 +281,7 @@ public class MetricsClient : MonoBehaviour
             request.uploadHandler = new UploadHandlerRaw(bodyRaw);
             request.downloadHandler = new DownloadHandlerBuffer();
             request.SetRequestHeader("Content-Type", "application/json");
+            AgregarCabecerasCliente(request);
             request.timeout = 10;
 
             yield return request.SendWebRequest();
@@ -250,6 +293,7 @@ public class MetricsClient : MonoBehaviour
                 
                 var response = JsonUtility.FromJson<CrearSesionResponse>(responseText);
                 sesionActualId = response.sesion_id;
+                siguienteSecuencia = 0;
                 Debug.Log($"[MetricsClient] ✓ Sesión creada con ID: {sesionActualId}");
                 OnSesionCreada?.Invoke(sesionActualId);
                 
@@ -274,6 +318,7 @@ public class MetricsClient : MonoBehaviour
         foreach (var intento in intentosPendientes)
         {
             intento.sesion_id = sesionActualId; // Actualizar con el ID correcto
+            intento.secuencia = siguienteSecuencia++;
             EnviarPeticion(RegistrarIntentoCoroutine(intento));
         }
         intentosPendientes.Clear();
@@ -281,6 +326,7 @@ public class MetricsClient : MonoBehaviour
         foreach (var error in erroresPendientes)
         {
             error.sesion_id = sesionActualId; // Actualizar con el ID correcto
+            error.secuencia = siguienteSecuencia++;
             EnviarPeticion(RegistrarErrorCoroutine(error));
         }
         erroresPendientes.Clear();
@@ -331,6 +377,7 @@ public class MetricsClient : MonoBehaviour
             request.uploadHandler = new UploadHandlerRaw(bodyRaw);
             request.downloadHandler = new DownloadHandlerBuffer();
             request.SetRequestHeader("Content-Type", "application/json");
+            AgregarCabecerasCliente(request);
             request.timeout = 10;
 
             yield return request.SendWebRequest();
@@ -381,12 +428,21 @@ public class MetricsClient : MonoBehaviour
             return;
         }
 
+        datos.secuencia = siguienteSecuencia++;
         Debug.Log($"[MetricsClient] Registrando intento: {nombreSenal} - {(fueCorrecta ? "Correcto" : "Incorrecto")} - SesionID: {sesionActualId}");
         EnviarPeticion(RegistrarIntentoCoroutine(datos));
     }
 
     IEnumerator RegistrarIntentoCoroutine(RegistrarIntentoRequest datos)
     {
+        byte[] binario = usarFormatoBinario ? CodificarIntento(datos) : null;
+        if (binario != null)
+        {
+            bool enviado = false;
+            yield return EnviarBinarioCoroutine("/intentos", binario, ok => enviado = ok);
+            if (enviado) yield break;
+        }
+
         string json = JsonUtility.ToJson(datos);
         Debug.Log($"[MetricsClient] POST /intentos: {json}"); // NUEVO: Log detallado
         
@@ -396,6 +452,7 @@ public class MetricsClient : MonoBehaviour
             request.uploadHandler = new UploadHandlerRaw(bodyRaw);
             request.downloadHandler = new DownloadHandlerBuffer();
             request.SetRequestHeader("Content-Type", "application/json");
+            AgregarCabecerasCliente(request);
             request.timeout = 5;
 
             yield return request.SendWebRequest();
@@ -447,12 +504,21 @@ public class MetricsClient : MonoBehaviour
             return;
         }
 
+        datos.secuencia = siguienteSecuencia++;
         Debug.Log($"[MetricsClient] Registrando error: {nombreSenal} - {tipoError} - SesionID: {sesionActualId}");
         EnviarPeticion(RegistrarErrorCoroutine(datos));
     }
 
     IEnumerator RegistrarErrorCoroutine(RegistrarErrorRequest datos)
     {
+        byte[] binario = usarFormatoBinario ? CodificarError(datos) : null;
+        if (binario != null)
+        {
+            bool enviado = false;
+            yield return EnviarBinarioCoroutine("/errores", binario, ok => enviado = ok);
+            if (enviado) yield break;
+        }
+
         string json = JsonUtility.ToJson(datos);
         
         using (UnityWebRequest request = new UnityWebRequest(urlServidor + "/errores", "POST"))
@@ -461,6 +527,7 @@ public class MetricsClient : MonoBehaviour
             request.uploadHandler = new UploadHandlerRaw(bodyRaw);
             request.downloadHandler = new DownloadHandlerBuffer();
             request.SetRequestHeader("Content-Type", "application/json");
+            AgregarCabecerasCliente(request);
             request.timeout = 5;
 
             yield return request.SendWebRequest();
@@ -476,6 +543,164 @@ public class MetricsClient : MonoBehaviour
         }
     }
 
+    /// <summary>
+    /// X-Cliente-Id y X-Sesion-Id: el servidor limita la tasa por cliente y por sesión
+    /// (y solo acepta registros de símbolos desde una sesión abierta)
+    /// </summary>
+    void AgregarCabecerasCliente(UnityWebRequest request)
+    {
+        request.SetRequestHeader("X-Cliente-Id", clienteId);
+        if (sesionActualId >= 0)
+        {
+            request.SetRequestHeader("X-Sesion-Id", sesionActualId.ToString());
+        }
+    }
+
+    // ============== FORMATO BINARIO ==============
+
+    /// <summary>
+    /// Descarga la tabla de símbolos; si hay nombres nuevos los registra antes (POST /simbolos)
+    /// </summary>
+    IEnumerator CargarSimbolosCoroutine(string[] nuevos)
+    {
+        UnityWebRequest request;
+        if (nuevos != null && nuevos.Length > 0)
+        {
+            string json = JsonUtility.ToJson(new SimbolosRequest { nombres = nuevos });
+            request = new UnityWebRequest(urlServidor + "/simbolos", "POST");
+            request.uploadHandler = new UploadHandlerRaw(System.Text.Encoding.UTF8.GetBytes(json));
+            request.downloadHandler = new DownloadHandlerBuffer();
+            request.SetRequestHeader("Content-Type", "application/json");
+        }
+        else
+        {
+            request = UnityWebRequest.Get(urlServidor + "/simbolos");
+        }
+
+        using (request)
+        {
+            AgregarCabecerasCliente(request);
+            request.timeout = 5;
+            yield return request.SendWebRequest();
+
+            if (request.result == UnityWebRequest.Result.Success)
+            {
+                var tabla = JsonUtility.FromJson<SimbolosResponse>(request.downloadHandler.text);
+                simbolos.Clear();
+                for (int i = 0; i < tabla.nombres.Length; i++)
+                {
+                    simbolos[tabla.nombres[i]] = i;
+                }
+                versionSimbolos = tabla.version;
+                Debug.Log($"[MetricsClient] ✓ Tabla de símbolos cargada ({tabla.nombres.Length} nombres)");
+            }
+            else
+            {
+                versionSimbolos = null;
+                Debug.LogWarning($"[MetricsClient] ✗ Error cargando símbolos: {request.error}");
+            }
+        }
+    }
+
+    /// <summary>
+    /// ID del nombre en la tabla; si no está, lo anota para registrarlo y devuelve false
+    /// </summary>
+    bool BuscarSimbolo(string nombre, out int id)
+    {
+        if (simbolos.TryGetValue(nombre, out id)) return true;
+        simbolosPorRegistrar.Add(nombre);
+        return false;
+    }
+
+    void RegistrarSimbolosPendientes()
+    {
+        if (simbolosPorRegistrar.Count == 0) return;
+        string[] nuevos = new string[simbolosPorRegistrar.Count];
+        simbolosPorRegistrar.CopyTo(nuevos);
+        simbolosPorRegistrar.Clear();
+        EnviarPeticion(CargarSimbolosCoroutine(nuevos));
+    }
+
+    /// <summary>
+    /// Cabecera + un registro de 16 bytes; null si falta algún símbolo (se envía en JSON)
+    /// </summary>
+    byte[] CodificarRegistro(byte tipo, string nombreSenal, string respuesta, float tiempo,
+                              int sesionId, byte b0, byte b1, byte b2, byte b3)
+    {
+        if (versionSimbolos == null) return null;
+
+        bool conocida = BuscarSimbolo(nombreSenal, out int senal);
+        int idRespuesta = -1;
+        if (!string.IsNullOrEmpty(respuesta))
+        {
+            conocida &= BuscarSimbolo(respuesta, out idRespuesta);
+        }
+        if (!conocida)
+        {
+            RegistrarSimbolosPendientes();
+            return null;
+        }
+
+        using (var stream = new MemoryStream(24))
+        using (var writer = new BinaryWriter(stream))  // BinaryWriter siempre es little-endian
+        {
+            writer.Write((byte)'M'); writer.Write((byte)'B');
+            writer.Write((byte)1); writer.Write(tipo);
+            writer.Write((uint)1);
+            writer.Write((uint)sesionId);
+            writer.Write((ushort)senal);
+            writer.Write((short)idRespuesta);
+            writer.Write(tiempo);
+            writer.Write(b0); writer.Write(b1); writer.Write(b2); writer.Write(b3);
+            return stream.ToArray();
+        }
+    }
+
+    byte[] CodificarIntento(RegistrarIntentoRequest d)
+    {
+        return CodificarRegistro(1, d.nombre_senal, d.respuesta_usuario, d.tiempo_respuesta, d.sesion_id,
+                                 (byte)(d.fue_correcta ? 1 : 0), (byte)d.zona, (byte)d.ronda, (byte)d.dificultad);
+    }
+
+    byte[] CodificarError(RegistrarErrorRequest d)
+    {
+        int tipoError = Array.IndexOf(TiposError, d.tipo_error);
+        // El formato binario no lleva feedback_generado
+        if (tipoError < 0 || !string.IsNullOrEmpty(d.feedback_generado)) return null;
+        return CodificarRegistro(2, d.nombre_senal, d.respuesta_usuario, d.tiempo_respuesta, d.sesion_id,
+                                 (byte)tipoError, (byte)d.zona, (byte)d.dificultad, (byte)d.intentos_previos);
+    }
+
+    IEnumerator EnviarBinarioCoroutine(string ruta, byte[] cuerpo, Action<bool> alTerminar)
+    {
+        using (UnityWebRequest request = new UnityWebRequest(urlServidor + ruta, "POST"))
+        {
+            request.uploadHandler = new UploadHandlerRaw(cuerpo);
+            request.downloadHandler = new DownloadHandlerBuffer();
+            request.SetRequestHeader("Content-Type", TipoContenidoBinario);
+            request.SetRequestHeader("X-Simbolos-Version", versionSimbolos);
+            AgregarCabecerasCliente(request);
+            request.timeout = 5;
+
+            yield return request.SendWebRequest();
+
+            if (request.result == UnityWebRequest.Result.Success)
+            {
+                alTerminar(true);
+                yield break;
+            }
+
+            // 409: la tabla cambió en el servidor; se recarga y este evento va en JSON
+            if (request.responseCode == 409)
+            {
+                versionSimbolos = null;
+                EnviarPeticion(CargarSimbolosCoroutine(null));
+            }
+            Debug.LogWarning($"[MetricsClient] ✗ Envío binario a {ruta} falló ({request.responseCode}), reintentando en JSON");
+            alTerminar(false);
+        }
+    }
+
     // ============== AJUSTES DE DIFICULTAD ==============
 
     /// <summary>
@@ -512,6 +737,7 @@ public class MetricsClient : MonoBehaviour
             request.uploadHandler = new UploadHandlerRaw(bodyRaw);
             request.downloadHandler = new DownloadHandlerBuffer();
             request.SetRequestHeader("Content-Type", "application/json");
+            AgregarCabecerasCliente(request);
             request.timeout = 5;
 
             yield return request.SendWebRequest();
@@ -540,6 +766,7 @@ public class MetricsClient : MonoBehaviour
         
         using (UnityWebRequest request = UnityWebRequest.Get(urlServidor + "/configuracion"))
         {
+            AgregarCabecerasCliente(request);
             request.timeout = 5;
             yield return request.SendWebRequest();
 
@@ -0,0 +1,239 @@
+"""
+Límite de tasa y control de admisión por clase de ruta.
+
+Cada petición se clasifica por método y ruta (CLASES_RUTA):
+
+    prediccion  /predecir                                  prioridad 0
+    ingesta     /intentos, /errores, lotes, /ajustes,      prioridad 0
+                /sesiones/{id}/respaldo
+    general     el resto                                   prioridad 1
+    llm         /generar_feedback                          prioridad 1
+    analitica   /estadisticas, listados y exportaciones    prioridad 2
+
+1. Límite de tasa: un cubo de tokens por (clase, cliente) y otro por
+   (clase, sesión). El cliente es X-Cliente-Id o la IP; la sesión sale de la
+   ruta (/sesiones/{id}/...) o de X-Sesion-Id. El presupuesto de cada clase
+   se configura con LIMITE_<CLASE>="tokens_por_segundo,rafaga" ("0" lo
+   desactiva). Al agotarse: 429 con Retry-After.
+2. Admisión: como mucho ADMISION_CONCURRENCIA peticiones en curso. Con el
+   cupo lleno las de mayor prioridad esperan (hasta ADMISION_ESPERA_MAX_S)
+   y se atienden primero; la analítica no espera y además se rechaza en
+   cuanto la ocupación supera ADMISION_RESERVA_ANALITICA, para dejar sitio
+   a la jugabilidad. Rechazo por sobrecarga: 429 (analítica) o 503, ambos
+   con Retry-After.
+
+ADMISION_ACTIVA=0 lo desactiva todo (benchmarks de throughput).
+
+El estado es de cada proceso: con varios workers el límite efectivo es
+por worker.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import re
+import threading
+import time
+
+import instrumentacion
+
+# (método o None, patrón, clase)
+CLASES_RUTA = (
+    ("POST", re.compile(r"^/predecir$"), "prediccion"),
+    ("POST", re.compile(r"^/(intentos|errores)(/lote)?$|^/ajustes$|^/sesiones/\d+/respaldo$"), "ingesta"),
+    ("POST", re.compile(r"^/generar_feedback$"), "llm"),
+    ("GET", re.compile(r"^/estadisticas$|^/sesiones$|^/sesiones/\d+/(metricas|exportar)$|^/(confusion|tiempos)/"), "analitica"),
+)
+PRIORIDADES = {"prediccion": 0, "ingesta": 0, "general": 1, "llm": 1, "analitica": 2}
+
+# Diagnóstico y panel: siempre se atienden, aunque el servicio esté saturado
+# (/eventos es una conexión SSE de larga duración: no debe ocupar un cupo)
+RUTAS_EXENTAS = re.compile(r"^/(health|metrics|eventos|admin/.*|panel.*)?$")
+RUTA_SESION = re.compile(r"^/sesiones/(\d+)(/|$)")
+
+LIMITES_POR_DEFECTO = {
+    "prediccion": "5,20",
+    "ingesta": "50,200",
+    "llm": "0.2,3",
+    "analitica": "2,10",
+    "general": "20,60",
+}
+
+ACTIVA = os.getenv("ADMISION_ACTIVA", "1") != "0"
+CONCURRENCIA = int(os.getenv("ADMISION_CONCURRENCIA", "32"))
+ESPERA_MAXIMA = float(os.getenv("ADMISION_ESPERA_MAX_S", "2"))
+RESERVA_ANALITICA = float(os.getenv("ADMISION_RESERVA_ANALITICA", "0.5"))
+REINTENTO_SOBRECARGA = int(os.getenv("ADMISION_REINTENTO_S", "1"))
+
+instrumentacion.registro.describir("admision_rechazos_total", "counter", "Peticiones rechazadas por clase y motivo")
+instrumentacion.registro.describir("admision_espera_segundos", "histogram", "Espera en la cola de admisión por clase")
+
+
+def clasificar(metodo: str, ruta: str):
+    """Clase de la ruta, o None si está exenta"""
+    if not ACTIVA or metodo == "OPTIONS" or RUTAS_EXENTAS.match(ruta):
+        return None
+    for metodo_clase, patron, clase in CLASES_RUTA:
+        if (metodo_clase is None or metodo_clase == metodo) and patron.match(ruta):
+            return clase
+    return "general"
+
+
+def _leer_limites() -> dict:
+    limites = {}
+    for clase, defecto in LIMITES_POR_DEFECTO.items():
+        valor = os.getenv(f"LIMITE_{clase.upper()}", defecto)
+        if valor.strip() == "0":
+            limites[clase] = None
+            continue
+        tasa, rafaga = (float(x) for x in valor.split(","))
+        limites[clase] = (tasa, rafaga)
+    return limites
+
+
+# ============== LÍMITE DE TASA ==============
+
+class CuboTokens:
+    __slots__ = ("tokens", "actualizado")
+
+    def __init__(self, rafaga: float, ahora: float):
+        self.tokens = rafaga
+        self.actualizado = ahora
+
+    def rellenar(self, tasa: float, rafaga: float, ahora: float):
+        self.tokens = min(rafaga, self.tokens + (ahora - self.actualizado) * tasa)
+        self.actualizado = ahora
+
+    def espera(self, tasa: float) -> float:
+        """Segundos hasta tener un token (0 si ya lo hay)"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / tasa
+
+
+class LimitadorTasa:
+    """Cubos de tokens por (clase, cliente) y (clase, sesión)"""
+
+    def __init__(self, limites: dict = None, purga_cada: float = 60):
+        self.limites = limites if limites is not None else _leer_limites()
+        self._cubos = {}
+        self._lock = threading.Lock()
+        self._purga_cada = purga_cada
+        self._ultima_purga = time.monotonic()
+
+    def consumir(self, clase: str, claves: list) -> float:
+        """0 si se admite; si no, segundos a esperar. Solo consume si todas las claves tienen token"""
+        limite = self.limites.get(clase)
+        if limite is None:
+            return 0.0
+        tasa, rafaga = limite
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultima_purga > self._purga_cada:
+                self._purgar(ahora)
+            cubos = []
+            for clave in claves:
+                cubo = self._cubos.get((clase, clave))
+                if cubo is None:
+                    cubo = self._cubos[(clase, clave)] = CuboTokens(rafaga, ahora)
+                cubo.rellenar(tasa, rafaga, ahora)
+                cubos.append(cubo)
+            espera = max(cubo.espera(tasa) for cubo in cubos)
+            if not espera:
+                for cubo in cubos:
+                    cubo.tokens -= 1
+            return espera
+
+    def _purgar(self, ahora: float):
+        """Olvida los cubos que ya se habrían rellenado del todo"""
+        self._ultima_purga = ahora
+        for (clase, clave), cubo in list(self._cubos.items()):
+            limite = self.limites.get(clase)
+            if limite is None or cubo.tokens + (ahora - cubo.actualizado) * limite[0] >= limite[1]:
+                del self._cubos[(clase, clave)]
+
+    def __len__(self):
+        return len(self._cubos)
+
+
+# ============== CONTROL DE ADMISIÓN ==============
+
+class ControlAdmision:
+    """Semáforo con cola por prioridad (0 = más urgente); vive en el event loop"""
+
+    def __init__(self, capacidad: int = CONCURRENCIA, espera_maxima: float = ESPERA_MAXIMA,
+                 reserva_analitica: float = RESERVA_ANALITICA):
+        self.capacidad = capacidad
+        self.espera_maxima = espera_maxima
+        self.limite_analitica = max(1, int(capacidad * reserva_analitica))
+        self.en_curso = 0
+        self._cola = []                 # heap de (prioridad, orden, future)
+        self._orden = itertools.count()
+
+    async def entrar(self, clase: str) -> bool:
+        prioridad = PRIORIDADES[clase]
+        if prioridad >= PRIORIDADES["analitica"]:
+            if self.en_curso >= self.limite_analitica or self._cola:
+                return False
+        if self.en_curso < self.capacidad and not self._cola:
+            self.en_curso += 1
+            return True
+
+        futuro = asyncio.get_running_loop().create_future()
+        entrada = (prioridad, next(self._orden), futuro)
+        heapq.heappush(self._cola, entrada)
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(futuro), self.espera_maxima)
+            return True
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # El cliente se fue mientras esperaba: no quedarse con un cupo ya cedido
+            if futuro.done() and not futuro.cancelled():
+                self.salir()
+            self._abandonar(entrada)
+            raise
+        finally:
+            instrumentacion.registro.observar("admision_espera_segundos", (("clase", clase),),
+                                              time.perf_counter() - inicio)
+        if futuro.done():
+            # El cupo llegó justo al vencer el plazo: se usa
+            return True
+        self._abandonar(entrada)
+        return False
+
+    def _abandonar(self, entrada):
+        entrada[2].cancel()
+        if entrada in self._cola:
+            self._cola.remove(entrada)
+            heapq.heapify(self._cola)
+
+    def salir(self):
+        """Libera un cupo; si hay alguien esperando, se lo pasa al más prioritario"""
+        while self._cola:
+            _, _, futuro = heapq.heappop(self._cola)
+            if not futuro.done():
+                futuro.set_result(True)
+                return
+        self.en_curso -= 1
+
+
+def clave_cliente(request) -> str:
+    cliente = request.headers.get("x-cliente-id")
+    if cliente:
+        return f"c:{cliente}"
+    return f"ip:{request.client.host if request.client else 'desconocido'}"
+
+
+def clave_sesion(request):
+    coincidencia = RUTA_SESION.match(request.url.path)
+    sesion = coincidencia.group(1) if coincidencia else request.headers.get("x-sesion-id")
+    return f"s:{sesion}" if sesion else None
+
+
+def reintento(segundos: float) -> str:
+    return str(max(1, math.ceil(segundos)))
+
+
+limitador = LimitadorTasa()
+control = ControlAdmision()
@@ -0,0 +1,314 @@
+"""
+Benchmark y prueba de carga de la API con visores simulados.
+
+Cada visor simulado reproduce el flujo real de una sesión de Unity:
+
+    POST /sesiones
+    por cada ronda: N x POST /intentos (+ /errores y /generar_feedback si falla)
+                    POST /predecir y, si cambia la dificultad, POST /ajustes
+    PUT /sesiones/{id}
+
+El servicio corre en un directorio temporal con su propia base de datos,
+precargada con --tamano-db intentos, y el LLM se reemplaza por el proveedor
+"stub" (AI_PROVIDER=stub). Modos:
+
+    inproceso  la app FastAPI se llama en el mismo proceso (httpx.ASGITransport)
+    http       el servicio se levanta con uvicorn y se llama por HTTP local
+
+Se reportan p50/p95/p99 y peticiones por segundo por endpoint, y los
+resultados se guardan en JSON para comparar entre commits.
+
+Uso:
+    python benchmark_api.py [--modo ambos] [--sesiones 20] [--rondas 6] [--tamano-db 10000]
+
+Requiere httpx (no forma parte de requirements.txt del servicio).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+SENALES = [f"Senal_{i:02d}" for i in range(30)]
+ESTUDIANTES_SIMULADOS = 50
+
+
+# ============== PREPARACIÓN ==============
+
+def preparar_entorno(tamano_db: int) -> str:
+    """Crea el directorio de trabajo con el modelo y una base de datos precargada"""
+    temporal = tempfile.mkdtemp(prefix="benchmark_")
+    shutil.copy(os.path.join(DIRECTORIO, "modelo_dificultad.pkl"), temporal)
+    url = f"sqlite:///{os.path.join(temporal, 'metricas.db')}"
+
+    # El script de precarga corre en un proceso aparte para no fijar DATABASE_URL aquí
+    codigo = f"""
+import random, sys
+sys.path.insert(0, {DIRECTORIO!r})
+from sqlalchemy import insert
+from database import init_db, engine, Estudiante, Sesion, IntentoSenal
+init_db()
+random.seed(7)
+senales = {SENALES!r}
+with engine.begin() as c:
+    c.execute(insert(Estudiante), [
+        {{"nombre": f"Estudiante {{i}}", "identificador": f"bench_{{i:05d}}"}} for i in range({ESTUDIANTES_SIMULADOS})
+    ])
+    n_sesiones = max(1, {tamano_db} // 60)
+    c.execute(insert(Sesion), [{{"estudiante_id": 2 + i % {ESTUDIANTES_SIMULADOS}}} for i in range(n_sesiones)])
+    lote = []
+    for n in range({tamano_db}):
+        correcta = random.random() < 0.7
+        senal = random.choice(senales)
+        lote.append({{"sesion_id": 1 + n % n_sesiones, "nombre_senal": senal,
+                      "respuesta_usuario": senal if correcta else random.choice(senales),
+                      "fue_correcta": correcta, "tiempo_respuesta": random.uniform(1, 10),
+                      "zona": 1 + n % 4, "ronda": n % 6, "dificultad": n % 3}})
+        if len(lote) == 5000:
+            c.execute(insert(IntentoSenal), lote)
+            lote = []
+    if lote:
+        c.execute(insert(IntentoSenal), lote)
+"""
+    subprocess.run([sys.executable, "-c", codigo], cwd=temporal, check=True,
+                   env=dict(os.environ, DATABASE_URL=url), stdout=subprocess.DEVNULL)
+    return temporal
+
+
+def entorno_servicio(temporal: str) -> dict:
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(temporal, 'metricas.db')}",
+        "AI_PROVIDER": "stub",
+        "ADMISION_ACTIVA": "0",
+    }
+
+
+# ============== VISOR SIMULADO ==============
+
+class Registro:
+    """Latencias por endpoint (ruta normalizada)"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.fallidas = defaultdict(int)
+
+    async def llamar(self, cliente, metodo: str, ruta: str, nombre: str = None, **kwargs):
+        inicio = time.perf_counter()
+        respuesta = await cliente.request(metodo, ruta, **kwargs)
+        self.latencias[f"{metodo} {nombre or ruta}"].append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            self.fallidas[f"{metodo} {nombre or ruta}"] += 1
+        return respuesta
+
+
+async def visor(cliente, registro: Registro, rng: random.Random, rondas: int, senales_por_ronda: int):
+    """Una sesión completa de un visor"""
+    estudiante_id = 2 + rng.randrange(ESTUDIANTES_SIMULADOS)
+    habilidad = rng.uniform(0.4, 0.95)
+    dificultad = 0
+
+    r = await registro.llamar(cliente, "POST", "/sesiones", json={"estudiante_id": estudiante_id})
+    sesion_id = r.json()["sesion_id"]
+
+    aciertos_totales = errores_totales = 0
+    for ronda in range(rondas):
+        zona = 1 + ronda // 2
+        aciertos = 0
+        tiempos = []
+        for senal in rng.sample(SENALES, senales_por_ronda):
+            correcta = rng.random() < habilidad
+            tiempo = rng.uniform(1.0, 10.0)
+            respuesta = senal if correcta else rng.choice(SENALES)
+            tiempos.append(tiempo)
+
+            await registro.llamar(cliente, "POST", "/intentos", json={
+                "sesion_id": sesion_id, "nombre_senal": senal, "respuesta_usuario": respuesta,
+                "fue_correcta": correcta, "tiempo_respuesta": tiempo,
+                "zona": zona, "ronda": ronda, "dificultad": dificultad
+            })
+            if correcta:
+                aciertos += 1
+                continue
+
+            await registro.llamar(cliente, "POST", "/errores", json={
+                "sesion_id": sesion_id, "nombre_senal": senal, "respuesta_usuario": respuesta,
+                "tipo_error": "confusion", "tiempo_respuesta": tiempo,
+                "zona": zona, "dificultad": dificultad
+            })
+            await registro.llamar(cliente, "POST", "/generar_feedback", json={
+                "nombre_senal": senal, "respuesta_usuario": respuesta, "tiempo_respuesta": tiempo,
+                "nivel_dificultad": dificultad, "zona_actual": zona, "intentos_previos": 0
+            })
+
+        errores = senales_por_ronda - aciertos
+        aciertos_totales += aciertos
+        errores_totales += errores
+        r = await registro.llamar(cliente, "POST", "/predecir", json={
+            "zona": zona, "senales_mostradas": senales_por_ronda, "aciertos": aciertos,
+            "errores": errores, "tiempo_promedio": sum(tiempos) / len(tiempos)
+        })
+        nueva = r.json()["dificultad"]
+        if nueva != dificultad:
+            await registro.llamar(cliente, "POST", "/ajustes", json={
+                "sesion_id": sesion_id, "dificultad_anterior": dificultad, "dificultad_nueva": nueva,
+                "motivo": "benchmark", "tasa_aciertos": aciertos / senales_por_ronda,
+                "tiempo_promedio": sum(tiempos) / len(tiempos), "zona": zona, "ronda": ronda
+            })
+            dificultad = nueva
+
+    await registro.llamar(cliente, "PUT", f"/sesiones/{sesion_id}", nombre="/sesiones/{id}", json={
+        "total_aciertos": aciertos_totales, "total_errores": errores_totales,
+        "tiempo_promedio_respuesta": 5.0, "zonas_completadas": rondas // 2,
+        "zona_maxima_alcanzada": rondas // 2, "dificultad_final": dificultad
+    })
+
+
+async def ejecutar_visores(cliente, sesiones: int, rondas: int, senales_por_ronda: int, semilla: int):
+    registro = Registro()
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        visor(cliente, registro, random.Random(semilla + i), rondas, senales_por_ronda)
+        for i in range(sesiones)
+    ))
+    return registro, time.perf_counter() - inicio
+
+
+def resumir(registro: Registro, duracion: float) -> dict:
+    endpoints = {}
+    for nombre, latencias in sorted(registro.latencias.items()):
+        ms = np.array(latencias) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        endpoints[nombre] = {
+            "peticiones": len(latencias),
+            "fallidas": registro.fallidas.get(nombre, 0),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "rps": round(len(latencias) / duracion, 1),
+        }
+    total = sum(len(l) for l in registro.latencias.values())
+    return {"duracion_s": round(duracion, 3), "peticiones": total,
+            "rps_total": round(total / duracion, 1), "endpoints": endpoints}
+
+
+# ============== MODOS ==============
+
+async def modo_inproceso(temporal: str, args) -> dict:
+    import httpx
+
+    os.environ.update(entorno_servicio(temporal))
+    os.chdir(temporal)
+    sys.path.insert(0, DIRECTORIO)
+    import contextlib
+    import io
+    import warnings
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    with contextlib.redirect_stdout(io.StringIO()):
+        import servicio
+
+    transporte = httpx.ASGITransport(app=servicio.app)
+    async with servicio.app.router.lifespan_context(servicio.app):
+        async with httpx.AsyncClient(transport=transporte, base_url="http://benchmark") as cliente:
+            with contextlib.redirect_stdout(io.StringIO()):
+                registro, duracion = await ejecutar_visores(cliente, args.sesiones, args.rondas,
+                                                            args.senales, args.semilla)
+    return resumir(registro, duracion)
+
+
+async def modo_http(temporal: str, args) -> dict:
+    import httpx
+
+    entorno = dict(os.environ, **entorno_servicio(temporal), SERVICIO_PUERTO=str(args.puerto),
+                   SERVICIO_WORKERS=str(args.workers))
+    servidor = subprocess.Popen([sys.executable, os.path.join(DIRECTORIO, "servicio.py")], cwd=temporal,
+                                env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{args.puerto}"
+    try:
+        limites = httpx.Limits(max_connections=args.sesiones, max_keepalive_connections=args.sesiones)
+        async with httpx.AsyncClient(base_url=base, limits=limites, timeout=60) as cliente:
+            for _ in range(300):
+                try:
+                    if (await cliente.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.2)
+            else:
+                raise RuntimeError("El servicio no respondió a tiempo")
+
+            registro, duracion = await ejecutar_visores(cliente, args.sesiones, args.rondas,
+                                                        args.senales, args.semilla)
+        return resumir(registro, duracion)
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=15)
+
+
+def imprimir(modo: str, resultado: dict):
+    print(f"\n=== {modo} === {resultado['peticiones']} peticiones en {resultado['duracion_s']}s "
+          f"({resultado['rps_total']} req/s)")
+    print(f"{'Endpoint':<28} {'N':>6} {'Fall':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for nombre, e in resultado["endpoints"].items():
+        print(f"{nombre:<28} {e['peticiones']:>6} {e['fallidas']:>5} {e['p50_ms']:>9.2f} "
+              f"{e['p95_ms']:>9.2f} {e['p99_ms']:>9.2f} {e['rps']:>8.1f}")
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORIO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modo", choices=["inproceso", "http", "ambos"], default="ambos")
+    parser.add_argument("--sesiones", type=int, default=20, help="visores concurrentes")
+    parser.add_argument("--rondas", type=int, default=6)
+    parser.add_argument("--senales", type=int, default=5, help="señales por ronda")
+    parser.add_argument("--tamano-db", type=int, default=10_000, help="intentos precargados")
+    parser.add_argument("--workers", type=int, default=1, help="workers en modo http")
+    parser.add_argument("--puerto", type=int, default=8766)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default=os.path.join(DIRECTORIO, "resultados_benchmark"))
+    args = parser.parse_args()
+
+    commit = commit_actual()
+    resultados = {
+        "commit": commit,
+        "fecha": datetime.utcnow().isoformat(),
+        "parametros": {k: v for k, v in vars(args).items() if k != "salida"},
+        "modos": {},
+    }
+
+    # http primero: el modo en proceso cambia el directorio actual e importa el servicio
+    modos = ["http", "inproceso"] if args.modo == "ambos" else [args.modo]
+    for modo in modos:
+        temporal = preparar_entorno(args.tamano_db)
+        try:
+            ejecutar = modo_http if modo == "http" else modo_inproceso
+            resultados["modos"][modo] = asyncio.run(ejecutar(temporal, args))
+            imprimir(modo, resultados["modos"][modo])
+        finally:
+            os.chdir(DIRECTORIO)
+            shutil.rmtree(temporal, ignore_errors=True)
+
+    os.makedirs(args.salida, exist_ok=True)
+    ruta = os.path.join(args.salida, f"{commit}_{datetime.utcnow():%Y%m%d_%H%M%S}.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {ruta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark de la búsqueda de estudiantes del panel (GET /estudiantes/buscar).
+
+Crea una base SQLite temporal con N estudiantes de nombres en español
+(el índice FTS5 se llena con los triggers al insertar) y mide la latencia de
+buscar_estudiantes() para consultas de prefijo, con y sin tildes, y de
+identificador. Compara con el LIKE '%texto%' que habría sin índice.
+
+Uso:
+    python benchmark_busqueda.py [--estudiantes 100000] [--repeticiones 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+NOMBRES = ["José", "María", "Lucía", "Martín", "Sofía", "Andrés", "Inés", "Raúl", "Ángela", "Tomás",
+           "Valentina", "Mateo", "Camila", "Sebastián", "Isabel", "Joaquín", "Begoña", "Íñigo", "Nicolás", "Elena"]
+APELLIDOS = ["García", "Pérez", "Muñoz", "Rodríguez", "Fernández", "López", "Martínez", "Sánchez", "Gómez",
+             "Díaz", "Hernández", "Álvarez", "Ruiz", "Jiménez", "Núñez", "Ibáñez", "Castaño", "Peña", "Ortiz", "Ramírez"]
+CONSULTAS = ["jose", "José", "mar", "gar", "muñ", "nunez", "jose gar", "ang alv", "est-0123", "zzz"]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--estudiantes", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench_busqueda_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    from sqlalchemy import insert, text
+    from database import SessionLocal, Estudiante, buscar_estudiantes, init_db
+
+    init_db()
+    random.seed(42)
+    db = SessionLocal()
+    inicio = time.perf_counter()
+    filas = [
+        {"nombre": f"{random.choice(NOMBRES)} {random.choice(APELLIDOS)} {random.choice(APELLIDOS)}",
+         "identificador": f"EST-{i:06d}"}
+        for i in range(args.estudiantes)
+    ]
+    from datetime import datetime
+    ahora = datetime.utcnow()
+    for fila in filas:
+        fila["fecha_registro"] = ahora
+    db.execute(insert(Estudiante), filas)
+    db.commit()
+    print(f"Estudiantes insertados (con índice): {args.estudiantes} en {time.perf_counter() - inicio:.2f}s")
+
+    print(f"\n{'consulta':<12} {'total':>7} {'p50 ms':>8} {'p95 ms':>8} {'LIKE p50 ms':>12}")
+    for consulta in CONSULTAS:
+        tiempos = []
+        for _ in range(args.repeticiones):
+            t = time.perf_counter()
+            total, _ = buscar_estudiantes(db, consulta, limite=20)
+            tiempos.append((time.perf_counter() - t) * 1000)
+        tiempos_like = []
+        for _ in range(max(1, args.repeticiones // 20)):
+            t = time.perf_counter()
+            db.execute(text(
+                "SELECT id, nombre FROM estudiantes WHERE nombre LIKE :p OR identificador LIKE :p LIMIT 20"
+            ), {"p": f"%{consulta}%"}).all()
+            db.execute(text(
+                "SELECT count(*) FROM estudiantes WHERE nombre LIKE :p OR identificador LIKE :p"
+            ), {"p": f"%{consulta}%"}).scalar()
+            tiempos_like.append((time.perf_counter() - t) * 1000)
+        print(f"{consulta:<12} {total:>7} {statistics.median(tiempos):>8.2f} {percentil(tiempos, 0.95):>8.2f} "
+              f"{statistics.median(tiempos_like):>12.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
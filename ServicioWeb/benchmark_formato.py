@@ -0,0 +1,94 @@
+"""
+Benchmark del formato binario frente a JSON en la ingesta de intentos.
+
+Genera lotes de intentos aleatorios y compara, para cada tamaño de lote:
+- bytes en el cable (sin comprimir y con gzip)
+- tiempo de parseo + validación: LoteIntentos.model_validate_json (Pydantic)
+  frente a formato_binario.decodificar (struct.iter_unpack + validación de rangos)
+
+Uso:
+    python benchmark_formato.py [--lotes 1 10 100 1000] [--repeticiones 2000]
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import random
+import time
+import warnings
+
+import numpy as np
+
+import formato_binario
+from simbolos import codigos
+
+SENALES = [f"Senal_{i:02d}" for i in range(30)]
+
+
+def generar(n: int, rng: random.Random) -> list:
+    intentos = []
+    for _ in range(n):
+        senal = rng.choice(SENALES)
+        correcta = rng.random() < 0.7
+        intentos.append({
+            "sesion_id": rng.randint(1, 5000),
+            "nombre_senal": senal,
+            "respuesta_usuario": senal if correcta else rng.choice(SENALES),
+            "fue_correcta": correcta,
+            "tiempo_respuesta": round(rng.uniform(0.5, 8.0), 3),
+            "zona": rng.randint(0, 4),
+            "ronda": rng.randint(0, 5),
+            "dificultad": rng.randint(0, 2),
+        })
+    return intentos
+
+
+def medir(funcion, repeticiones: int) -> np.ndarray:
+    tiempos = np.empty(repeticiones)
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos[i] = time.perf_counter() - inicio
+    return tiempos * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lotes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Los modelos Pydantic viven en servicio.py; importarlo sin ruido de arranque
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    warnings.filterwarnings("ignore")
+    with contextlib.redirect_stdout(io.StringIO()):
+        from servicio import LoteIntentos
+
+    for nombre in SENALES:
+        codigos.id(nombre)
+    version = formato_binario.version_tabla()
+    rng = random.Random(42)
+
+    print(f"{'lote':>6} {'json B':>9} {'bin B':>8} {'json gz':>8} {'bin gz':>7} "
+          f"{'json µs p50':>12} {'bin µs p50':>11} {'x':>6}")
+    for n in args.lotes:
+        intentos = generar(n, rng)
+        cuerpo_json = json.dumps({"intentos": intentos}).encode("utf-8")
+        cuerpo_bin = formato_binario.codificar(intentos, formato_binario.INTENTO)
+        assert formato_binario.decodificar(cuerpo_bin, formato_binario.INTENTO, version)[0]["nombre_senal"] \
+            == intentos[0]["nombre_senal"]
+
+        repeticiones = max(args.repeticiones // max(n // 10, 1), 20)
+        t_json = medir(lambda: LoteIntentos.model_validate_json(cuerpo_json), repeticiones)
+        t_bin = medir(lambda: formato_binario.decodificar(cuerpo_bin, formato_binario.INTENTO, version), repeticiones)
+        p50_json, p50_bin = np.percentile(t_json, 50), np.percentile(t_bin, 50)
+
+        print(f"{n:>6} {len(cuerpo_json):>9} {len(cuerpo_bin):>8} "
+              f"{len(gzip.compress(cuerpo_json)):>8} {len(gzip.compress(cuerpo_bin)):>7} "
+              f"{p50_json:>12.1f} {p50_bin:>11.1f} {p50_json / p50_bin:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
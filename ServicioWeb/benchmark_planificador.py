@@ -0,0 +1,66 @@
+"""
+Benchmark del planificador de repaso espaciado.
+
+Puebla el planificador con N estudiantes x M señales, aplica una ráfaga de
+intentos aleatorios (que generan entradas obsoletas en los heaps) y mide la
+latencia de planificador.siguientes(k).
+
+Uso:
+    python benchmark_planificador.py [--estudiantes 10000] [--senales 100] [--k 5]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from planificador import Planificador
+from simbolos import senales
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--estudiantes", type=int, default=10_000)
+    parser.add_argument("--senales", type=int, default=100)
+    parser.add_argument("--intentos", type=int, default=500_000)
+    parser.add_argument("--consultas", type=int, default=100_000)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    nombres = [f"Senal_{i:03d}" for i in range(args.senales)]
+    for nombre in nombres:
+        senales.id(nombre)
+
+    planificador = Planificador()
+
+    inicio = time.perf_counter()
+    for estudiante in range(args.estudiantes):
+        planificador.siguientes(estudiante, 1)
+    print(f"Colas creadas: {args.estudiantes} x {args.senales} en {time.perf_counter() - inicio:.2f}s")
+
+    ahora = time.time()
+    inicio = time.perf_counter()
+    for n in range(args.intentos):
+        planificador.registrar_intento(
+            random.randrange(args.estudiantes), random.choice(nombres),
+            random.random() < 0.7, ahora + n * 0.01
+        )
+    duracion = time.perf_counter() - inicio
+    print(f"Intentos registrados: {args.intentos} en {duracion:.2f}s "
+          f"({duracion / args.intentos * 1e6:.1f} µs/intento)")
+
+    latencias = np.empty(args.consultas)
+    for n in range(args.consultas):
+        estudiante = random.randrange(args.estudiantes)
+        t0 = time.perf_counter()
+        planificador.siguientes(estudiante, args.k)
+        latencias[n] = time.perf_counter() - t0
+
+    p50, p95, p99 = np.percentile(latencias * 1e6, [50, 95, 99])
+    print(f"siguientes(k={args.k}): p50={p50:.1f} µs  p95={p95:.1f} µs  p99={p99:.1f} µs  "
+          f"max={latencias.max() * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""
+Bitácora de eventos de ingesta: registro binario, append-only y segmentado.
+
+Cada intento, error, ajuste de dificultad y cambio de sesión aceptado se
+anota en la bitácora. Las tablas de database.py pasan a ser proyecciones:
+se pueden reconstruir (o derivar otras nuevas, como la matriz de confusión)
+reproduciendo la bitácora sin consultar la BD en caliente.
+
+Escritura: anotar() solo serializa y agrega al buffer en memoria; un hilo
+vuelca el buffer cada BITACORA_FSYNC_MS con una única escritura secuencial
+y un fsync (fsync por lotes). Al superar BITACORA_SEGMENTO_MB se abre un
+segmento nuevo.
+
+La ingesta la usa como registro previo (write-ahead): anota los eventos
+aceptados y espera con confirmar() a que estén en disco antes de escribirlos
+en la BD, así que toda fila guardada está en la bitácora. Quien espera
+adelanta el volcado, y las peticiones concurrentes comparten el fsync.
+
+Cada evento de ingesta lleva un evento_id y, con el resultado de la BD, se
+anota una marca EV_CONFIRMADO o EV_ANULADO con los ids. La reproducción
+omite los anulados. Si el proceso muere antes de la marca (o el resultado es
+incierto: conexión perdida con el escritor, petición cancelada) el evento
+queda en duda: con secuencia se reproduce y la proyección SQL descarta la
+copia por (sesion_id, secuencia); sin secuencia (ajustes, intentos sin
+secuencia) se omite, porque el cliente pudo reenviarlo como evento nuevo.
+
+Los cambios de sesión no son registro previo (el id lo asigna la BD): se
+anotan tras el commit y se espera su fsync antes de responder. Si el proceso
+muere entre ambos la sesión queda solo en la BD, pero el cliente nunca
+recibió su id y no puede haber eventos que la usen.
+
+Cada proceso escribe su propio flujo de segmentos
+"<inicio_ms>-<pid>-<número>.seg" (con varios workers no se comparten
+archivos); la lectura mezcla los flujos por instante.
+
+Segmento: cabecera de 8 bytes (magia b"BITA", versión) y registros
+
+    I  longitud de los datos
+    I  crc32 de instante + tipo + datos
+    d  instante (epoch, segundos)
+    B  tipo de evento (EV_*)
+       datos: JSON (orjson) con los campos del evento
+
+La lectura usa mmap y se detiene en el primer registro incompleto o con crc
+inválido (la cola de un segmento que se estaba escribiendo).
+
+Uso:
+    python bitacora.py resumen
+    python bitacora.py reconstruir --destino sqlite:///reconstruida.db
+    python bitacora.py confusion --salida confusion_bitacora.npz
+"""
+import argparse
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import instrumentacion
+from respuestas import a_json
+
+try:
+    import orjson
+    _cargar_json = orjson.loads
+except ImportError:
+    _cargar_json = json.loads
+
+MAGIA = b"BITA"
+VERSION = 1
+CABECERA_SEGMENTO = struct.Struct("<4sBxxx")
+CABECERA_REGISTRO = struct.Struct("<IIdB")     # longitud, crc32, instante, tipo
+_CRC_DESDE = 8                                  # el crc cubre desde el instante
+
+EV_INTENTO, EV_ERROR, EV_AJUSTE, EV_SESION_INICIO, EV_SESION_FIN = 1, 2, 3, 4, 5
+EV_CONFIRMADO, EV_ANULADO = 6, 7               # marcas: {"eventos": [evento_id, ...]}
+NOMBRES = {EV_INTENTO: "intento", EV_ERROR: "error", EV_AJUSTE: "ajuste",
+           EV_SESION_INICIO: "sesion_inicio", EV_SESION_FIN: "sesion_fin",
+           EV_CONFIRMADO: "confirmado", EV_ANULADO: "anulado"}
+MARCAS = (EV_CONFIRMADO, EV_ANULADO)
+
+ACTIVA = os.getenv("BITACORA_ACTIVA", "1") != "0"
+DIRECTORIO = os.getenv("BITACORA_DIR", "bitacora")
+SEGMENTO_BYTES = int(float(os.getenv("BITACORA_SEGMENTO_MB", "64")) * 1024 * 1024)
+INTERVALO_FSYNC = float(os.getenv("BITACORA_FSYNC_MS", "50")) / 1000
+
+instrumentacion.registro.describir("bitacora_eventos_total", "counter", "Eventos anotados en la bitácora por tipo")
+instrumentacion.registro.describir("bitacora_volcado_segundos", "histogram", "Escritura + fsync de cada volcado")
+
+
+def como_fila(objeto) -> dict:
+    """Columnas de una fila ORM como dict (para eventos de sesión)"""
+    return {c.name: getattr(objeto, c.name) for c in objeto.__table__.columns}
+
+
+# ============== ESCRITURA ==============
+
+class Bitacora:
+    def __init__(self, directorio: str = DIRECTORIO, segmento_bytes: int = SEGMENTO_BYTES,
+                 intervalo_fsync: float = INTERVALO_FSYNC):
+        self.directorio = directorio
+        self.segmento_bytes = segmento_bytes
+        self.intervalo_fsync = intervalo_fsync
+        self.flujo = None
+        self.abierta = False
+        self._pendiente = bytearray()
+        self._anotados = 0        # bytes anotados desde que se abrió
+        self._en_disco = 0        # de ellos, ya con fsync
+        self._lock = threading.Lock()
+        self._volcado = threading.Condition()
+        self._urgente = threading.Event()
+        self._fd = None
+        self._numero = 0
+        self._tamano = 0
+        self._ids = itertools.count(1)
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def abrir(self):
+        if self.abierta or not ACTIVA:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        self.flujo = f"{int(time.time() * 1000):013d}-{os.getpid()}"
+        self._rotar()
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="bitacora", daemon=True)
+        self._hilo.start()
+        self.abierta = True
+
+    def anotar(self, tipo: int, datos: dict) -> int:
+        """Agrega el evento al buffer; devuelve la posición que recibe confirmar()"""
+        if not self.abierta:
+            return 0
+        cuerpo = a_json(datos)
+        instante = time.time()
+        cola = CABECERA_REGISTRO.pack(len(cuerpo), 0, instante, tipo)[_CRC_DESDE:]
+        crc = zlib.crc32(cuerpo, zlib.crc32(cola))
+        with self._lock:
+            self._pendiente += CABECERA_REGISTRO.pack(len(cuerpo), crc, instante, tipo)
+            self._pendiente += cuerpo
+            self._anotados += CABECERA_REGISTRO.size + len(cuerpo)
+            posicion = self._anotados
+        instrumentacion.registro.incrementar("bitacora_eventos_total", (("tipo", NOMBRES[tipo]),))
+        return posicion
+
+    def nuevo_id(self) -> str:
+        """evento_id único entre flujos (el flujo ya incluye instante y pid)"""
+        return f"{self.flujo}-{next(self._ids)}"
+
+    def resolver(self, ids: list, aplicados: bool):
+        """Marca el resultado en la BD de eventos anotados antes de escribirlos"""
+        if ids and self.abierta:
+            self.anotar(EV_CONFIRMADO if aplicados else EV_ANULADO, {"eventos": ids})
+
+    def confirmar(self, posicion: int, espera_maxima: float = 10.0):
+        """Bloquea hasta que lo anotado hasta 'posicion' tenga fsync"""
+        if not self.abierta:
+            return
+        limite = time.monotonic() + espera_maxima
+        with self._volcado:
+            while self._en_disco < posicion:
+                restante = limite - time.monotonic()
+                if restante <= 0 or not self.abierta:
+                    raise RuntimeError("La bitácora no pudo confirmar la escritura en disco")
+                self._urgente.set()
+                self._volcado.wait(min(restante, self.intervalo_fsync))
+
+    def cerrar(self):
+        if not self.abierta:
+            return
+        self._detener.set()
+        self._urgente.set()
+        self._hilo.join()
+        self._volcar()
+        os.close(self._fd)
+        self._fd = None
+        self.abierta = False
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            # Se adelanta cuando alguien espera en confirmar()
+            self._urgente.wait(self.intervalo_fsync)
+            self._urgente.clear()
+            try:
+                self._volcar()
+            except Exception as e:
+                print(f"[bitacora] Error al volcar: {e}")
+
+    def _volcar(self):
+        """Una escritura secuencial y un fsync por lote; solo la llama el hilo de la bitácora"""
+        with self._lock:
+            datos, self._pendiente = self._pendiente, bytearray()
+            hasta = self._anotados
+        if not datos:
+            return
+        inicio = time.perf_counter()
+        vista = memoryview(datos)
+        while vista:
+            vista = vista[os.write(self._fd, vista):]
+        os.fsync(self._fd)
+        with self._volcado:
+            self._en_disco = hasta
+            self._volcado.notify_all()
+        instrumentacion.registro.observar("bitacora_volcado_segundos", (), time.perf_counter() - inicio)
+        self._tamano += len(datos)
+        if self._tamano >= self.segmento_bytes:
+            self._rotar()
+
+    def _rotar(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._numero += 1
+        ruta = os.path.join(self.directorio, f"{self.flujo}-{self._numero:06d}.seg")
+        self._fd = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        os.write(self._fd, CABECERA_SEGMENTO.pack(MAGIA, VERSION))
+        self._tamano = CABECERA_SEGMENTO.size
+
+    def resumen(self) -> dict:
+        return {"activa": self.abierta, "flujo": self.flujo, "segmento": self._numero,
+                "bytes_segmento": self._tamano, "bytes_pendientes": len(self._pendiente)}
+
+
+# ============== LECTURA ==============
+
+def segmentos(directorio: str = DIRECTORIO) -> dict:
+    """{flujo: [rutas en orden]}"""
+    flujos = {}
+    if not os.path.isdir(directorio):
+        return flujos
+    for nombre in sorted(os.listdir(directorio)):
+        if nombre.endswith(".seg"):
+            flujo = nombre.rsplit("-", 1)[0]
+            flujos.setdefault(flujo, []).append(os.path.join(directorio, nombre))
+    return flujos
+
+
+def leer_segmento(ruta: str):
+    """(instante, tipo, datos crudos) de un segmento, vía mmap"""
+    with open(ruta, "rb") as f:
+        tamano = os.fstat(f.fileno()).st_size
+        if tamano <= CABECERA_SEGMENTO.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            magia, version = CABECERA_SEGMENTO.unpack_from(mapa)
+            if magia != MAGIA or version != VERSION:
+                raise ValueError(f"{ruta}: no es un segmento de bitácora v{VERSION}")
+            pos = CABECERA_SEGMENTO.size
+            while pos + CABECERA_REGISTRO.size <= tamano:
+                longitud, crc, instante, tipo = CABECERA_REGISTRO.unpack_from(mapa, pos)
+                fin = pos + CABECERA_REGISTRO.size + longitud
+                if fin > tamano or zlib.crc32(mapa[pos + _CRC_DESDE:fin]) != crc:
+                    print(f"[bitacora] {os.path.basename(ruta)}: registro incompleto en el byte {pos}; se ignora el resto")
+                    return
+                yield instante, tipo, mapa[pos + CABECERA_REGISTRO.size:fin]
+                pos = fin
+
+
+def _leer_flujo(rutas: list, desde: float):
+    for ruta in rutas:
+        for instante, tipo, crudo in leer_segmento(ruta):
+            if instante >= desde:
+                yield instante, tipo, crudo
+
+
+def leer(directorio: str = DIRECTORIO, desde: float = 0.0, tipos=None):
+    """(instante, tipo, datos) de todos los flujos, mezclados por instante"""
+    flujos = [_leer_flujo(rutas, desde) for rutas in segmentos(directorio).values()]
+    for instante, tipo, crudo in heapq.merge(*flujos, key=lambda r: r[0]):
+        if tipos is None or tipo in tipos:
+            yield instante, tipo, _cargar_json(crudo)
+
+
+# ============== PROYECCIONES ==============
+
+def _fechas(modelo, datos: dict) -> dict:
+    """Las columnas DateTime llegan como texto ISO en el JSON"""
+    for columna in modelo.__table__.columns:
+        valor = datos.get(columna.name)
+        if isinstance(valor, str) and columna.type.python_type is datetime:
+            datos[columna.name] = datetime.fromisoformat(valor)
+    return datos
+
+
+class ProyeccionSQL:
+    """Reconstruye sesiones, intentos_senal, errores_detallados y ajustes_dificultad
+    con inserciones por lotes (los eventos llevan el instante como timestamp).
+    Un evento repetido con la misma (sesion_id, secuencia) se omite"""
+
+    def __init__(self, db, tamano_lote: int = 5000):
+        from database import Sesion, IntentoSenal, ErrorDetallado, AjusteDificultad
+        self.db = db
+        self.tamano_lote = tamano_lote
+        self.Sesion = Sesion
+        self.modelos = {EV_INTENTO: IntentoSenal, EV_ERROR: ErrorDetallado, EV_AJUSTE: AjusteDificultad}
+        self._sesiones = {}
+        self._filas = {tipo: [] for tipo in self.modelos}
+        self._columnas = {tipo: {c.name for c in m.__table__.columns} - {"id"} for tipo, m in self.modelos.items()}
+        self.eventos = 0
+
+    def aplicar(self, instante: float, tipo: int, datos: dict):
+        self.eventos += 1
+        if tipo in (EV_SESION_INICIO, EV_SESION_FIN):
+            # La última foto de cada sesión gana
+            self._sesiones[datos["id"]] = _fechas(self.Sesion, datos)
+        else:
+            fila = {k: v for k, v in datos.items() if k in self._columnas[tipo]}
+            fila["timestamp"] = datetime.utcfromtimestamp(instante)
+            self._filas[tipo].append(fila)
+        if self.eventos % self.tamano_lote == 0:
+            self._volcar()
+
+    def _volcar(self):
+        from sqlalchemy import insert
+        from database import upsert, insertar_omitiendo
+        if self._sesiones:
+            upsert(self.db, self.Sesion, list(self._sesiones.values()), ["id"])
+            self._sesiones = {}
+        for tipo, filas in self._filas.items():
+            if not filas:
+                continue
+            # Sentencias de Core sobre la tabla: executemany directo, sin el camino ORM por fila
+            tabla = self.modelos[tipo].__table__
+            if "secuencia" in tabla.columns:
+                insertar_omitiendo(self.db, tabla, filas, ["sesion_id", "secuencia"])
+            else:
+                self.db.connection().execute(insert(tabla), filas)
+            filas.clear()
+
+    def terminar(self):
+        self._volcar()
+        self.db.commit()
+
+
+class ProyeccionConfusion:
+    """Matriz de confusión calculada solo desde la bitácora"""
+
+    def __init__(self, ruta: str):
+        from confusion import MatrizConfusion
+        self.ruta = ruta
+        self.matriz = MatrizConfusion()
+
+    def aplicar(self, instante: float, tipo: int, datos: dict):
+        if tipo == EV_INTENTO:
+            self.matriz.registrar(datos["nombre_senal"], datos.get("respuesta_usuario"), datos["fue_correcta"],
+                                  datos.get("dificultad", 0), datos.get("zona", 0))
+
+    def terminar(self):
+        self.matriz.guardar_snapshot(self.ruta)
+
+
+def resoluciones(directorio: str = DIRECTORIO, desde: float = 0.0) -> tuple:
+    """(confirmados, anulados): evento_id de las marcas"""
+    confirmados, anulados = set(), set()
+    for _, tipo, datos in leer(directorio, desde, MARCAS):
+        (confirmados if tipo == EV_CONFIRMADO else anulados).update(datos["eventos"])
+    return confirmados, anulados
+
+
+def reproducir(proyecciones: list, directorio: str = DIRECTORIO, desde: float = 0.0) -> int:
+    """Aplica los eventos a las proyecciones; omite los anulados y los que
+    quedaron en duda sin secuencia (ver el docstring del módulo)"""
+    confirmados, anulados = resoluciones(directorio, desde)
+    eventos = omitidos = 0
+    for instante, tipo, datos in leer(directorio, desde):
+        if tipo in MARCAS:
+            continue
+        evento_id = datos.get("evento_id")
+        if evento_id is not None and evento_id not in confirmados and (
+                evento_id in anulados or datos.get("secuencia") is None):
+            omitidos += 1
+            continue
+        for proyeccion in proyecciones:
+            proyeccion.aplicar(instante, tipo, datos)
+        eventos += 1
+    for proyeccion in proyecciones:
+        proyeccion.terminar()
+    if omitidos:
+        print(f"[bitacora] {omitidos} eventos anulados o en duda sin secuencia omitidos")
+    return eventos
+
+
+def reconstruir(destino: str, directorio: str = DIRECTORIO) -> int:
+    """Reproduce la bitácora en una BD nueva (las tablas de eventos deben estar vacías)"""
+    from sqlalchemy import create_engine, func
+    from sqlalchemy.orm import sessionmaker
+    from database import Base, Sesion, IntentoSenal
+
+    motor = create_engine(destino)
+    Base.metadata.create_all(motor)
+    db = sessionmaker(bind=motor)()
+    try:
+        if db.query(func.count(Sesion.id)).scalar() or db.query(func.count(IntentoSenal.id)).scalar():
+            raise SystemExit(f"{destino} ya tiene sesiones o intentos; use una base nueva")
+        return reproducir([ProyeccionSQL(db)], directorio)
+    finally:
+        db.close()
+
+
+def resumen_directorio(directorio: str = DIRECTORIO) -> dict:
+    por_tipo, primero, ultimo, total_bytes = {}, None, None, 0
+    flujos = segmentos(directorio)
+    for rutas in flujos.values():
+        for ruta in rutas:
+            total_bytes += os.path.getsize(ruta)
+            for instante, tipo, _ in leer_segmento(ruta):
+                por_tipo[NOMBRES.get(tipo, tipo)] = por_tipo.get(NOMBRES.get(tipo, tipo), 0) + 1
+                primero = instante if primero is None else min(primero, instante)
+                ultimo = instante if ultimo is None else max(ultimo, instante)
+    return {
+        "flujos": len(flujos),
+        "segmentos": sum(len(r) for r in flujos.values()),
+        "bytes": total_bytes,
+        "eventos": por_tipo,
+        "desde": datetime.utcfromtimestamp(primero).isoformat() if primero else None,
+        "hasta": datetime.utcfromtimestamp(ultimo).isoformat() if ultimo else None,
+    }
+
+
+bitacora = Bitacora()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("accion", choices=("resumen", "reconstruir", "confusion"))
+    parser.add_argument("--dir", default=DIRECTORIO)
+    parser.add_argument("--destino", help="URL de SQLAlchemy de la BD a reconstruir")
+    parser.add_argument("--salida", default="confusion_bitacora.npz")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.accion == "resumen":
+        print(json.dumps(resumen_directorio(args.dir), indent=2, ensure_ascii=False))
+        return
+    if args.accion == "reconstruir":
+        if not args.destino:
+            parser.error("reconstruir necesita --destino")
+        eventos = reconstruir(args.destino, args.dir)
+    else:
+        eventos = reproducir([ProyeccionConfusion(args.salida)], args.dir)
+    duracion = time.perf_counter() - inicio
+    print(f"{eventos} eventos reproducidos en {duracion:.2f}s ({eventos / max(duracion, 1e-9):,.0f} eventos/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Canal WebSocket persistente por sesión (un visor = una conexión).
+
+Protocolo (mensajes JSON):
+
+    visor -> servidor  {"id": "<id de petición>", "tipo": "...", "datos": {...}}
+    servidor -> visor  {"id": "<id>", "tipo": "...", "datos": {...}}
+
+Los eventos de telemetría (intento, error, ajuste) no se responden uno a
+uno: se acumulan y cada ACK_INTERVALO_MS se guardan en una sola transacción
+y se confirman con un único {"tipo": "ack", "ids": [...]}. Si el guardado
+falla se envía {"tipo": "nack", "ids": [...], "detalle": ...} y el visor
+puede reenviarlos.
+
+El servidor también empuja mensajes sin petición previa (por ejemplo la
+configuración cuando cambia), que llegan con "id": null.
+"""
+import asyncio
+import os
+import threading
+
+from fastapi.encoders import jsonable_encoder
+
+import instrumentacion
+
+ACK_INTERVALO = float(os.getenv("WS_ACK_INTERVALO_MS", "50")) / 1000
+ACK_MAXIMO = int(os.getenv("WS_ACK_MAXIMO", "200"))
+
+instrumentacion.registro.describir("ws_conexiones", "gauge", "Visores conectados por WebSocket")
+instrumentacion.registro.describir("ws_mensajes_total", "counter", "Mensajes WebSocket recibidos por tipo")
+
+
+class ConexionVisor:
+    """Cola de salida y eventos pendientes de confirmar de una conexión"""
+
+    def __init__(self, websocket, sesion_id: int, estudiante_id: int):
+        self.websocket = websocket
+        self.sesion_id = sesion_id
+        self.estudiante_id = estudiante_id
+        self.salida = asyncio.Queue()
+        self.pendientes = []   # [(id de petición, tipo, datos)]
+        self._hay_pendientes = asyncio.Event()
+        self._tareas = set()   # peticiones lentas en curso (feedback)
+
+    def enviar(self, mensaje: dict):
+        self.salida.put_nowait(mensaje)
+
+    def lanzar(self, corrutina):
+        """Atiende una petición en una tarea aparte; la referencia la mantiene viva
+        hasta terminar y cerrar() la cancela si el visor se desconecta antes"""
+        tarea = asyncio.create_task(corrutina)
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        return tarea
+
+    def cerrar(self):
+        for tarea in list(self._tareas):
+            tarea.cancel()
+
+    def encolar_evento(self, id_peticion, tipo: str, datos):
+        self.pendientes.append((id_peticion, tipo, datos))
+        self._hay_pendientes.set()
+
+    async def bucle_envio(self):
+        """Único escritor del socket: serializa los envíos de todas las tareas"""
+        while True:
+            mensaje = await self.salida.get()
+            await self.websocket.send_json(jsonable_encoder(mensaje))
+
+    async def bucle_confirmaciones(self, guardar):
+        """Agrupa eventos durante ACK_INTERVALO y los guarda con guardar(conexion, eventos)"""
+        while True:
+            await self._hay_pendientes.wait()
+            if len(self.pendientes) < ACK_MAXIMO:
+                await asyncio.sleep(ACK_INTERVALO)
+            await self.vaciar(guardar)
+
+    async def vaciar(self, guardar):
+        self._hay_pendientes.clear()
+        eventos, self.pendientes = self.pendientes, []
+        if not eventos:
+            return
+        ids = [e[0] for e in eventos]
+        try:
+            registros = await asyncio.to_thread(guardar, self, eventos)
+        except Exception as e:
+            print(f"[ws] Error guardando {len(eventos)} eventos de la sesión {self.sesion_id}: {e}")
+            self.enviar({"id": None, "tipo": "nack", "ids": ids, "detalle": str(e)})
+            return
+        self.enviar({"id": None, "tipo": "ack", "ids": ids, "registros": registros})
+
+
+class RegistroConexiones:
+    """Conexiones activas por sesión; difundir() puede llamarse desde cualquier hilo"""
+
+    def __init__(self):
+        self._conexiones = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def agregar(self, conexion: ConexionVisor):
+        """Registra la conexión; devuelve la anterior de la misma sesión, si había"""
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            anterior = self._conexiones.get(conexion.sesion_id)
+            self._conexiones[conexion.sesion_id] = conexion
+        if anterior is None:
+            instrumentacion.registro.incrementar("ws_conexiones")
+        return anterior
+
+    def quitar(self, conexion: ConexionVisor):
+        with self._lock:
+            if self._conexiones.get(conexion.sesion_id) is not conexion:
+                return
+            del self._conexiones[conexion.sesion_id]
+        instrumentacion.registro.incrementar("ws_conexiones", valor=-1)
+
+    def difundir(self, mensaje: dict):
+        with self._lock:
+            conexiones = list(self._conexiones.values())
+        if not conexiones or self._loop is None:
+            return
+        for conexion in conexiones:
+            self._loop.call_soon_threadsafe(conexion.enviar, mensaje)
+
+    def __len__(self):
+        return len(self._conexiones)
+
+
+conexiones = RegistroConexiones()
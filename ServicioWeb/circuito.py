@@ -0,0 +1,130 @@
+"""
+Interruptor de circuito (circuit breaker) para dependencias externas lentas o caídas.
+
+    cerrado     las llamadas pasan; se anotan éxito/fallo y latencia en una
+                ventana de VENTANA_S segundos. Con al menos MINIMO llamadas y
+                una proporción de fallos >= UMBRAL_ERRORES, se abre. Una
+                llamada más lenta que UMBRAL_LATENCIA_S cuenta como fallo
+                aunque haya respondido.
+    abierto     no se llama al proveedor durante ABIERTO_S segundos.
+    semiabierto pasado ese tiempo se dejan pasar hasta SONDAS llamadas de
+                prueba: si una sale bien se cierra, si falla se vuelve a abrir.
+                Una sonda cancelada se devuelve con liberar() sin anotar nada.
+
+Configuración por variables de entorno con el prefijo dado (p. ej. LLM_CIRCUITO_*).
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import instrumentacion
+
+CERRADO, SEMIABIERTO, ABIERTO = "cerrado", "semiabierto", "abierto"
+VALOR_ESTADO = {CERRADO: 0, SEMIABIERTO: 1, ABIERTO: 2}
+
+instrumentacion.registro.describir("circuito_estado", "gauge", "Estado del circuito (0 cerrado, 1 semiabierto, 2 abierto)")
+instrumentacion.registro.describir("circuito_aperturas_total", "counter", "Veces que se abrió el circuito")
+instrumentacion.registro.describir("circuito_rechazos_total", "counter", "Llamadas no realizadas por circuito abierto")
+
+
+class Circuito:
+    def __init__(self, nombre: str, prefijo: str):
+        def config(clave, defecto):
+            return float(os.getenv(f"{prefijo}_{clave}", defecto))
+
+        self.nombre = nombre
+        self.umbral_errores = config("UMBRAL_ERRORES", "0.5")
+        self.umbral_latencia = config("UMBRAL_LATENCIA_S", "5")
+        self.minimo = int(config("MINIMO", "5"))
+        self.ventana = config("VENTANA_S", "60")
+        self.abierto_s = config("ABIERTO_S", "30")
+        self.sondas = int(config("SONDAS", "1"))
+
+        self.estado = CERRADO
+        self.aperturas = 0
+        self._llamadas = deque()   # (instante, fallo)
+        self._abierto_hasta = 0.0
+        self._sondas_en_curso = 0
+        self._ultimo_error = None
+        self._lock = threading.Lock()
+        instrumentacion.registro.incrementar("circuito_estado", (("circuito", nombre),), 0)
+
+    def permitir(self) -> bool:
+        """True si se puede llamar al proveedor; en semiabierto reserva una sonda"""
+        with self._lock:
+            if self.estado == ABIERTO:
+                if time.monotonic() < self._abierto_hasta:
+                    instrumentacion.registro.incrementar("circuito_rechazos_total", (("circuito", self.nombre),))
+                    return False
+                # Cada período semiabierto empieza sin sondas (las de uno anterior ya no cuentan)
+                self._sondas_en_curso = 0
+                self._cambiar(SEMIABIERTO)
+            if self.estado == SEMIABIERTO:
+                if self._sondas_en_curso >= self.sondas:
+                    instrumentacion.registro.incrementar("circuito_rechazos_total", (("circuito", self.nombre),))
+                    return False
+                self._sondas_en_curso += 1
+            return True
+
+    def liberar(self):
+        """Devuelve la sonda reservada por permitir() sin anotar resultado
+        (la llamada se canceló antes de saber si el proveedor responde)"""
+        with self._lock:
+            if self.estado == SEMIABIERTO:
+                self._sondas_en_curso = max(0, self._sondas_en_curso - 1)
+
+    def registrar(self, exito: bool, duracion: float, error: str = None):
+        fallo = not exito or duracion > self.umbral_latencia
+        ahora = time.monotonic()
+        with self._lock:
+            if fallo:
+                self._ultimo_error = error or f"latencia {duracion:.1f}s"
+            if self.estado == SEMIABIERTO:
+                self._sondas_en_curso = max(0, self._sondas_en_curso - 1)
+                if fallo:
+                    self._abrir(ahora)
+                else:
+                    self._llamadas.clear()
+                    self._cambiar(CERRADO)
+                return
+
+            self._llamadas.append((ahora, fallo))
+            self._descartar_viejas(ahora)
+            fallos = sum(f for _, f in self._llamadas)
+            if (self.estado == CERRADO and len(self._llamadas) >= self.minimo
+                    and fallos / len(self._llamadas) >= self.umbral_errores):
+                self._abrir(ahora)
+
+    def _abrir(self, ahora: float):
+        self._abierto_hasta = ahora + self.abierto_s
+        self._llamadas.clear()
+        self.aperturas += 1
+        instrumentacion.registro.incrementar("circuito_aperturas_total", (("circuito", self.nombre),))
+        print(f"[circuito:{self.nombre}] Abierto durante {self.abierto_s:.0f}s ({self._ultimo_error})")
+        self._cambiar(ABIERTO)
+
+    def _cambiar(self, estado: str):
+        instrumentacion.registro.incrementar("circuito_estado", (("circuito", self.nombre),),
+                                             VALOR_ESTADO[estado] - VALOR_ESTADO[self.estado])
+        self.estado = estado
+
+    def _descartar_viejas(self, ahora: float):
+        while self._llamadas and self._llamadas[0][0] < ahora - self.ventana:
+            self._llamadas.popleft()
+
+    def resumen(self) -> dict:
+        with self._lock:
+            self._descartar_viejas(time.monotonic())
+            llamadas = len(self._llamadas)
+            fallos = sum(f for _, f in self._llamadas)
+            resumen = {
+                "estado": self.estado,
+                "aperturas": self.aperturas,
+                "llamadas_en_ventana": llamadas,
+                "tasa_fallos": round(fallos / llamadas, 3) if llamadas else 0.0,
+                "ultimo_error": self._ultimo_error,
+            }
+            if self.estado == ABIERTO:
+                resumen["reintento_en_s"] = round(max(0.0, self._abierto_hasta - time.monotonic()), 1)
+            return resumen
@@ -0,0 +1,209 @@
+"""
+Matriz de confusión señal x respuesta por dificultad y zona.
+
+Los conteos viven en un arreglo NumPy denso de forma
+(dificultades, zonas, señales, respuestas). Las filas se indexan con la
+tabla global de señales (simbolos.py) y las columnas con una tabla propia de
+respuestas, que además incluye "Tiempo agotado" y "Sin respuesta".
+
+Se actualiza de forma incremental con cada intento registrado y se guarda
+periódicamente en un snapshot .npz; con varios workers cada uno guarda solo
+sus conteos en una parte propia que se funde al cargar (ver snapshots.py).
+Si no hay snapshot se reconstruye una única vez desde intentos_senal.
+"""
+import os
+import threading
+
+import numpy as np
+
+import snapshots
+from simbolos import senales, TablaSimbolos
+
+N_DIFICULTADES = 3
+SIN_RESPUESTA = "Sin respuesta"
+RUTA_SNAPSHOT = os.getenv("CONFUSION_SNAPSHOT", "confusion_snapshot.npz")
+
+
+class MatrizConfusion:
+    """Conteos densos de (dificultad, zona, señal, respuesta)"""
+
+    def __init__(self, zonas: int = 5, capacidad_senales: int = 32):
+        self.respuestas = TablaSimbolos()
+        self.conteos = np.zeros((N_DIFICULTADES, zonas, capacidad_senales, capacidad_senales), dtype=np.int64)
+        self.cambios = 0  # intentos registrados desde el último snapshot
+        self._base = None  # conteos ya persistidos por la base o por otros procesos
+        self._lock = threading.Lock()
+
+    def _asegurar(self, zona: int, fila: int, columna: int):
+        _, z, f, c = self.conteos.shape
+        if zona < z and fila < f and columna < c:
+            return
+        nueva = np.zeros((N_DIFICULTADES,
+                          z if zona < z else zona + 1,
+                          f if fila < f else (fila + 1) * 2,
+                          c if columna < c else (columna + 1) * 2), dtype=np.int64)
+        nueva[:, :z, :f, :c] = self.conteos
+        self.conteos = nueva
+
+    def registrar(self, nombre_senal: str, respuesta_usuario, fue_correcta: bool,
+                  dificultad: int = 0, zona: int = 0, cantidad: int = 1):
+        """Suma un intento a la celda correspondiente"""
+        if respuesta_usuario is None:
+            respuesta_usuario = nombre_senal if fue_correcta else SIN_RESPUESTA
+        dificultad = min(max(dificultad, 0), N_DIFICULTADES - 1)
+        zona = max(zona, 0)
+
+        fila = senales.id(nombre_senal)
+        columna = self.respuestas.id(respuesta_usuario)
+        with self._lock:
+            self._asegurar(zona, fila, columna)
+            self.conteos[dificultad, zona, fila, columna] += cantidad
+            self.cambios += 1
+
+    def _vista(self, dificultad: int = None, zona: int = None) -> np.ndarray:
+        """Matriz (señales x respuestas) agregada sobre las dimensiones no filtradas"""
+        with self._lock:
+            conteos = self.conteos
+            n_filas = min(len(senales), conteos.shape[2])
+            n_columnas = min(len(self.respuestas), conteos.shape[3])
+            if dificultad is not None:
+                conteos = conteos[dificultad:dificultad + 1]
+            if zona is not None:
+                conteos = conteos[:, zona:zona + 1]
+            return conteos[:, :, :n_filas, :n_columnas].sum(axis=(0, 1))
+
+    def _sin_diagonal(self, matriz: np.ndarray) -> np.ndarray:
+        """Copia de la matriz sin las respuestas correctas (señal == respuesta)"""
+        matriz = matriz.copy()
+        for fila in range(matriz.shape[0]):
+            columna = self.respuestas.buscar(senales.nombre(fila))
+            if columna is not None and columna < matriz.shape[1]:
+                matriz[fila, columna] = 0
+        return matriz
+
+    def top_confusiones(self, k: int = 10, dificultad: int = None, zona: int = None) -> list:
+        """Los k pares (señal, respuesta incorrecta) más frecuentes"""
+        if zona is not None and zona >= self.conteos.shape[1]:
+            return []
+        matriz = self._vista(dificultad, zona)
+        if matriz.size == 0:
+            return []
+        totales = matriz.sum(axis=1)
+        errores = self._sin_diagonal(matriz)
+
+        plano = errores.ravel()
+        k = min(k, int(np.count_nonzero(plano)))
+        if k == 0:
+            return []
+        indices = np.argpartition(plano, -k)[-k:]
+        indices = indices[np.argsort(plano[indices])[::-1]]
+
+        resultado = []
+        for indice in indices:
+            fila, columna = divmod(int(indice), errores.shape[1])
+            resultado.append({
+                "senal": senales.nombre(fila),
+                "respuesta": self.respuestas.nombre(columna),
+                "cantidad": int(errores[fila, columna]),
+                "tasa": round(float(errores[fila, columna] / totales[fila]), 3),
+            })
+        return resultado
+
+    def fila_normalizada(self, nombre_senal: str, dificultad: int = None, zona: int = None) -> dict:
+        """Distribución de respuestas dadas para una señal"""
+        fila = senales.buscar(nombre_senal)
+        if fila is None or (zona is not None and zona >= self.conteos.shape[1]):
+            return {"total": 0, "respuestas": {}}
+        matriz = self._vista(dificultad, zona)
+        if fila >= matriz.shape[0]:
+            return {"total": 0, "respuestas": {}}
+
+        conteos = matriz[fila]
+        total = int(conteos.sum())
+        if total == 0:
+            return {"total": 0, "respuestas": {}}
+        orden = np.flatnonzero(conteos)
+        orden = orden[np.argsort(conteos[orden])[::-1]]
+        return {
+            "total": total,
+            "respuestas": {self.respuestas.nombre(c): round(float(conteos[c] / total), 3) for c in orden},
+        }
+
+    def errores_por_senal(self, k: int = 5) -> list:
+        """Señales con más respuestas incorrectas (reemplaza el GROUP BY de /estadisticas)"""
+        errores = self._sin_diagonal(self._vista()).sum(axis=1)
+        orden = [int(f) for f in np.argsort(errores)[::-1][:k] if errores[f] > 0]
+        return [(senales.nombre(f), int(errores[f])) for f in orden]
+
+    # ---------- Persistencia ----------
+
+    def guardar_snapshot(self, ruta: str = RUTA_SNAPSHOT):
+        """Escribe todos los conteos (la base compartida)"""
+        with self._lock:
+            conteos = self.conteos.copy()
+            self.cambios = 0
+        self._escribir(ruta, conteos)
+
+    def guardar_parte(self, ruta: str = RUTA_SNAPSHOT):
+        """Escribe en la parte de este proceso lo sumado desde que cargó"""
+        with self._lock:
+            conteos = self.conteos.copy()
+            self.cambios = 0
+        if self._base is not None:
+            _, z, f, c = self._base.shape
+            conteos[:, :z, :f, :c] -= self._base
+        self._escribir(snapshots.ruta_parte(ruta), conteos)
+
+    def _escribir(self, ruta: str, conteos: np.ndarray):
+        """Escritura atómica: archivo temporal + os.replace"""
+        nombres_senales = np.array(senales.nombres()[:conteos.shape[2]], dtype=str)
+        nombres_respuestas = np.array(self.respuestas.nombres()[:conteos.shape[3]], dtype=str)
+        n_f, n_c = len(nombres_senales), len(nombres_respuestas)
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            np.savez(f, conteos=conteos[:, :, :n_f, :n_c], senales=nombres_senales, respuestas=nombres_respuestas)
+        os.replace(temporal, ruta)
+
+    def cargar_snapshot(self, ruta: str = RUTA_SNAPSHOT, reconstruir=None) -> bool:
+        """Base + partes de todos los procesos; sin base llama a reconstruir()"""
+        return snapshots.cargar(self, ruta, reconstruir)
+
+    def _leer(self, ruta: str):
+        """Conteos del archivo con los IDs reasignados a las tablas de símbolos actuales"""
+        with np.load(ruta) as datos:
+            conteos = datos["conteos"]
+            filas = [senales.id(str(n)) for n in datos["senales"]]
+            columnas = [self.respuestas.id(str(n)) for n in datos["respuestas"]]
+        return conteos, filas, columnas
+
+    def _sumar_archivo(self, datos):
+        conteos, filas, columnas = datos
+        with self._lock:
+            if filas and columnas:
+                self._asegurar(conteos.shape[1] - 1, max(filas), max(columnas))
+                f = np.array(filas)[:, None]
+                c = np.array(columnas)[None, :]
+                self.conteos[:, :conteos.shape[1], f, c] += conteos
+
+    def _fijar_base(self):
+        with self._lock:
+            self._base = self.conteos.copy()
+            self.cambios = 0
+
+    def reconstruir(self, db):
+        """Reconstrucción inicial desde intentos_senal con un único GROUP BY"""
+        from sqlalchemy import func
+        from database import IntentoSenal
+
+        filas = db.query(
+            IntentoSenal.nombre_senal, IntentoSenal.respuesta_usuario, IntentoSenal.fue_correcta,
+            IntentoSenal.dificultad, IntentoSenal.zona, func.count(IntentoSenal.id)
+        ).group_by(
+            IntentoSenal.nombre_senal, IntentoSenal.respuesta_usuario, IntentoSenal.fue_correcta,
+            IntentoSenal.dificultad, IntentoSenal.zona
+        ).all()
+        for nombre, respuesta, correcta, dificultad, zona, cantidad in filas:
+            self.registrar(nombre, respuesta, correcta, dificultad or 0, zona or 0, cantidad)
+
+
+confusion = MatrizConfusion()
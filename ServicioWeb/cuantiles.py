@@ -0,0 +1,260 @@
+"""
+Percentiles de tiempo de respuesta con sketches DDSketch fusionables.
+
+Cada tiempo se cuenta en una cubeta logarítmica: la cubeta i cubre
+(γ^(i-1), γ^i] con γ = (1 + α) / (1 - α), así que cualquier percentil se
+estima con error relativo ≤ α (CUANTILES_PRECISION, 1 % por defecto) entre
+CUANTILES_MINIMO_S y CUANTILES_MAXIMO_S. Dos sketches se fusionan sumando
+sus conteos, de modo que cualquier agrupación (todas las zonas, varias
+señales, una dificultad...) es una suma de arreglos y su costo no depende
+de cuántos intentos haya.
+
+    global        arreglo denso (dificultades, zonas, señales, cubetas), como
+                  la matriz de confusión; filtrar = recortar ejes y sumar
+    por estudiante  conteos dispersos {estudiante: {señal: {cubeta: n}}}
+
+Se actualiza con cada intento registrado y se guarda periódicamente en un
+snapshot .npz (los conteos por estudiante, aplanados en columnas); con
+varios workers cada uno guarda solo sus conteos en una parte propia que se
+funde al cargar (ver snapshots.py). Si no hay snapshot se reconstruye una
+única vez desde intentos_senal.
+"""
+import math
+import os
+import threading
+
+import numpy as np
+
+import snapshots
+from simbolos import senales
+
+N_DIFICULTADES = 3
+ALFA = float(os.getenv("CUANTILES_PRECISION", "0.01"))
+MINIMO = float(os.getenv("CUANTILES_MINIMO_S", "0.001"))
+MAXIMO = float(os.getenv("CUANTILES_MAXIMO_S", "3600"))
+RUTA_SNAPSHOT = os.getenv("CUANTILES_SNAPSHOT", "cuantiles_snapshot.npz")
+
+GAMMA = (1 + ALFA) / (1 - ALFA)
+_LOG_GAMMA = math.log(GAMMA)
+_INDICE_MIN = math.ceil(math.log(MINIMO) / _LOG_GAMMA)
+N_CUBETAS = math.ceil(math.log(MAXIMO) / _LOG_GAMMA) - _INDICE_MIN + 1
+# Valor que representa cada cubeta (el de menor error relativo dentro de ella)
+VALORES = 2 * GAMMA ** (np.arange(N_CUBETAS) + _INDICE_MIN) / (GAMMA + 1)
+
+
+def cubeta(segundos: float) -> int:
+    segundos = min(max(segundos, MINIMO), MAXIMO)
+    return math.ceil(math.log(segundos) / _LOG_GAMMA) - _INDICE_MIN
+
+
+def cubetas(segundos: np.ndarray) -> np.ndarray:
+    """cubeta() vectorizada"""
+    segundos = np.clip(segundos, MINIMO, MAXIMO)
+    return (np.ceil(np.log(segundos) / _LOG_GAMMA) - _INDICE_MIN).astype(np.int64)
+
+
+def percentiles(conteos: np.ndarray, cuantiles: list) -> dict:
+    """{q: segundos} desde un vector de conteos por cubeta (None si está vacío)"""
+    acumulado = np.cumsum(conteos)
+    total = int(acumulado[-1]) if acumulado.size else 0
+    if total == 0:
+        return {q: None for q in cuantiles}
+    return {q: round(float(VALORES[np.searchsorted(acumulado, q * (total - 1), side="right")]), 4)
+            for q in cuantiles}
+
+
+class SketchesTiempos:
+    def __init__(self, zonas: int = 5, capacidad_senales: int = 32):
+        self.conteos = np.zeros((N_DIFICULTADES, zonas, capacidad_senales, N_CUBETAS), dtype=np.int64)
+        self.por_estudiante = {}   # estudiante_id -> {señal: {cubeta: n}}
+        self.cambios = 0
+        # Lo sumado desde la carga, para la parte de este proceso
+        self._base = None
+        self._nuevos_por_estudiante = {}
+        self._lock = threading.Lock()
+
+    def _asegurar(self, zona: int, fila: int):
+        _, z, f, _ = self.conteos.shape
+        if zona < z and fila < f:
+            return
+        nueva = np.zeros((N_DIFICULTADES, max(z, zona + 1), f if fila < f else (fila + 1) * 2, N_CUBETAS),
+                         dtype=np.int64)
+        nueva[:, :z, :f] = self.conteos
+        self.conteos = nueva
+
+    def registrar(self, estudiante_id: int, nombre_senal: str, zona: int, dificultad: int,
+                  tiempo_respuesta: float, cantidad: int = 1):
+        if not tiempo_respuesta or tiempo_respuesta <= 0:
+            return
+        dificultad = min(max(dificultad, 0), N_DIFICULTADES - 1)
+        zona = max(zona, 0)
+        fila = senales.id(nombre_senal)
+        indice = cubeta(tiempo_respuesta)
+        with self._lock:
+            self._asegurar(zona, fila)
+            self.conteos[dificultad, zona, fila, indice] += cantidad
+            self._sumar(estudiante_id, fila, indice, cantidad)
+            self._sumar(estudiante_id, fila, indice, cantidad, self._nuevos_por_estudiante)
+            self.cambios += 1
+
+    def _sumar(self, estudiante_id: int, fila: int, indice: int, cantidad: int, destino: dict = None):
+        destino = self.por_estudiante if destino is None else destino
+        sketch = destino.setdefault(estudiante_id, {}).setdefault(fila, {})
+        sketch[indice] = sketch.get(indice, 0) + cantidad
+
+    # ---------- Consultas ----------
+
+    def _global(self, senal=None, zona=None, dificultad=None) -> np.ndarray:
+        """Conteos (señales x cubetas) fusionados sobre las dimensiones no filtradas"""
+        with self._lock:
+            conteos = self.conteos
+            if dificultad is not None:
+                conteos = conteos[dificultad:dificultad + 1]
+            if zona is not None:
+                conteos = conteos[:, zona:zona + 1]
+            if senal is not None:
+                conteos = conteos[:, :, senal:senal + 1]
+            return conteos.sum(axis=(0, 1))
+
+    def consultar(self, cuantiles: list, nombre_senal: str = None, zona: int = None,
+                  dificultad: int = None, estudiante_id: int = None) -> dict:
+        fila = None
+        if nombre_senal is not None:
+            fila = senales.buscar(nombre_senal)
+            if fila is None or fila >= self.conteos.shape[2]:
+                return {"n": 0, "percentiles": percentiles(np.zeros(0), cuantiles)}
+        if zona is not None and zona >= self.conteos.shape[1]:
+            return {"n": 0, "percentiles": percentiles(np.zeros(0), cuantiles)}
+
+        if estudiante_id is None:
+            conteos = self._global(fila, zona, dificultad).sum(axis=0)
+        else:
+            conteos = np.zeros(N_CUBETAS, dtype=np.int64)
+            with self._lock:
+                for senal, sketch in self.por_estudiante.get(estudiante_id, {}).items():
+                    if fila is None or senal == fila:
+                        conteos[list(sketch)] += list(sketch.values())
+        return {"n": int(conteos.sum()), "percentiles": percentiles(conteos, cuantiles)}
+
+    def por_senal(self, cuantiles: list, zona: int = None, dificultad: int = None) -> list:
+        """Percentiles de todas las señales con datos, en una sola pasada"""
+        if zona is not None and zona >= self.conteos.shape[1]:
+            return []
+        conteos = self._global(None, zona, dificultad)[:len(senales)]
+        acumulado = np.cumsum(conteos, axis=1)
+        totales = acumulado[:, -1]
+        resultado = []
+        for fila in np.flatnonzero(totales):
+            rangos = [q * (totales[fila] - 1) for q in cuantiles]
+            indices = np.searchsorted(acumulado[fila], rangos, side="right")
+            resultado.append({
+                "senal": senales.nombre(int(fila)),
+                "n": int(totales[fila]),
+                "percentiles": {q: round(float(VALORES[i]), 4) for q, i in zip(cuantiles, indices)},
+            })
+        return resultado
+
+    # ---------- Persistencia ----------
+
+    def guardar_snapshot(self, ruta: str = RUTA_SNAPSHOT):
+        """Escribe todos los conteos (la base compartida)"""
+        with self._lock:
+            conteos = self.conteos.copy()
+            filas = self._aplanar(self.por_estudiante)
+            self.cambios = 0
+        self._escribir(ruta, conteos, filas)
+
+    def guardar_parte(self, ruta: str = RUTA_SNAPSHOT):
+        """Escribe en la parte de este proceso lo sumado desde que cargó"""
+        with self._lock:
+            conteos = self.conteos.copy()
+            filas = self._aplanar(self._nuevos_por_estudiante)
+            self.cambios = 0
+        if self._base is not None:
+            _, z, f, _ = self._base.shape
+            conteos[:, :z, :f] -= self._base
+        self._escribir(snapshots.ruta_parte(ruta), conteos, filas)
+
+    @staticmethod
+    def _aplanar(por_estudiante: dict) -> list:
+        return [(e, s, c, n) for e, por_senal in por_estudiante.items()
+                for s, sketch in por_senal.items() for c, n in sketch.items()]
+
+    def _escribir(self, ruta: str, conteos: np.ndarray, filas: list):
+        """Escritura atómica: archivo temporal + os.replace"""
+        nombres = np.array(senales.nombres()[:conteos.shape[2]], dtype=str)
+        columnas = np.array(filas, dtype=np.int64).reshape(-1, 4)
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            np.savez_compressed(f, alfa=ALFA, minimo=MINIMO, conteos=conteos[:, :, :len(nombres)],
+                                senales=nombres, estudiantes=columnas)
+        os.replace(temporal, ruta)
+
+    def cargar_snapshot(self, ruta: str = RUTA_SNAPSHOT, reconstruir=None) -> bool:
+        """Base + partes de todos los procesos; sin base (o con otra precisión)
+        llama a reconstruir()"""
+        return snapshots.cargar(self, ruta, reconstruir)
+
+    def _leer(self, ruta: str):
+        """Conteos del archivo con los IDs de señal reasignados; None si se hizo
+        con otra precisión"""
+        with np.load(ruta) as datos:
+            if float(datos["alfa"]) != ALFA or float(datos["minimo"]) != MINIMO:
+                print(f"Snapshot de cuantiles con otra precisión: {ruta}")
+                return None
+            conteos = datos["conteos"]
+            filas = np.array([senales.id(str(n)) for n in datos["senales"]], dtype=np.int64)
+            estudiantes = datos["estudiantes"]
+        return conteos, filas, estudiantes
+
+    def _sumar_archivo(self, datos):
+        conteos, filas, estudiantes = datos
+        with self._lock:
+            if len(filas):
+                self._asegurar(conteos.shape[1] - 1, int(filas.max()))
+                self.conteos[:, :conteos.shape[1], filas] += conteos
+            for estudiante, senal, indice, cantidad in estudiantes.tolist():
+                self._sumar(estudiante, int(filas[senal]), indice, cantidad)
+
+    def _fijar_base(self):
+        with self._lock:
+            self._base = self.conteos.copy()
+            self._nuevos_por_estudiante = {}
+            self.cambios = 0
+
+    def reconstruir(self, db, tamano_lote: int = 20000):
+        """Reconstrucción inicial recorriendo intentos_senal por lotes"""
+        from database import IntentoSenal, Sesion
+
+        consulta = db.query(
+            Sesion.estudiante_id, IntentoSenal.nombre_senal, IntentoSenal.zona,
+            IntentoSenal.dificultad, IntentoSenal.tiempo_respuesta
+        ).join(Sesion, Sesion.id == IntentoSenal.sesion_id).filter(
+            IntentoSenal.tiempo_respuesta > 0
+        ).yield_per(tamano_lote)
+
+        lote = []
+        for fila in consulta:
+            lote.append(fila)
+            if len(lote) >= tamano_lote:
+                self._registrar_lote(lote)
+                lote = []
+        if lote:
+            self._registrar_lote(lote)
+
+    def _registrar_lote(self, lote: list):
+        estudiantes = np.array([f[0] for f in lote], dtype=np.int64)
+        filas = np.array([senales.id(f[1]) for f in lote], dtype=np.int64)
+        zonas = np.maximum(np.array([f[2] or 0 for f in lote], dtype=np.int64), 0)
+        dificultades = np.clip(np.array([f[3] or 0 for f in lote], dtype=np.int64), 0, N_DIFICULTADES - 1)
+        indices = cubetas(np.array([f[4] for f in lote], dtype=np.float64))
+        with self._lock:
+            self._asegurar(int(zonas.max()), int(filas.max()))
+            np.add.at(self.conteos, (dificultades, zonas, filas, indices), 1)
+            claves, cantidades = np.unique(np.stack([estudiantes, filas, indices]), axis=1, return_counts=True)
+            for (estudiante, fila, indice), cantidad in zip(claves.T.tolist(), cantidades.tolist()):
+                self._sumar(estudiante, fila, indice, cantidad)
+            self.cambios += len(lote)
+
+
+tiempos = SketchesTiempos()
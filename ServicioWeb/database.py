@@ -1,14 +1,79 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, event, func, insert, inspect, or_, select, text, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Index, UniqueConstraint
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import os
+import re
 
-DATABASE_URL = "sqlite:///./metricas.db"
+# ============== CONFIGURACIÓN DEL MOTOR ==============
+# DATABASE_URL admite cualquier URL de SQLAlchemy (sqlite, postgresql, ...).
+# ASYNC_DATABASE_URL es opcional: si no se define se deriva de DATABASE_URL
+# con el driver asíncrono correspondiente (aiosqlite / asyncpg).
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./metricas.db")
+
+DRIVERS_ASYNC = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _es_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _opciones_motor(url) -> dict:
+    """Argumentos de create_engine según el backend"""
+    if _es_sqlite(url):
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_pre_ping": True,
+    }
+
+
+def _url_async(url) -> str:
+    url = make_url(url)
+    driver = DRIVERS_ASYNC.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No hay driver asíncrono conocido para '{url.get_backend_name()}'")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def _configurar_sqlite(conexion, _):
+    """WAL permite lecturas concurrentes mientras el escritor confirma"""
+    cursor = conexion.cursor()
+    # Solo tiene efecto en bases nuevas (antes de crear tablas); permite a
+    # retencion.py liberar páginas con incremental_vacuum sin un VACUUM completo
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_opciones_motor(DATABASE_URL))
+if _es_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _configurar_sqlite)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Motor asíncrono (opcional: requiere aiosqlite o asyncpg instalados)
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _url_async(DATABASE_URL)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_opciones_motor(ASYNC_DATABASE_URL))
+    if _es_sqlite(ASYNC_DATABASE_URL):
+        event.listen(async_engine.sync_engine, "connect", _configurar_sqlite)
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+except Exception as e:
+    async_engine = None
+    AsyncSessionLocal = None
+    print(f"Advertencia: motor asíncrono no disponible: {e}")
+
 # ============== MODELOS ==============
 
 class Estudiante(Base):
@@ -58,9 +123,12 @@ class Sesion(Base):
 
 class IntentoSenal(Base):
     __tablename__ = "intentos_senal"
+    # Los NULL no chocan entre sí: los clientes sin número de secuencia no se deduplican
+    __table_args__ = (Index("ix_intentos_senal_sesion_secuencia", "sesion_id", "secuencia", unique=True),)
     
     id = Column(Integer, primary_key=True, index=True)
     sesion_id = Column(Integer, ForeignKey("sesiones.id"), nullable=False)
+    secuencia = Column(Integer, nullable=True)  # número creciente asignado por el visor
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     nombre_senal = Column(String(100), nullable=False)
@@ -78,9 +146,11 @@ class IntentoSenal(Base):
 
 class ErrorDetallado(Base):
     __tablename__ = "errores_detallados"
+    __table_args__ = (Index("ix_errores_detallados_sesion_secuencia", "sesion_id", "secuencia", unique=True),)
     
     id = Column(Integer, primary_key=True, index=True)
     sesion_id = Column(Integer, ForeignKey("sesiones.id"), nullable=False)
+    secuencia = Column(Integer, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     nombre_senal = Column(String(100), nullable=False)
@@ -146,6 +216,41 @@ class ConfiguracionEvaluacion(Base):
     url_servidor_ml = Column(String(200), default="http://127.0.0.1:8000")  # NUEVO
 
 
+class MaestriaSenal(Base):
+    """Estado de dominio por estudiante y señal (persistencia de maestria.py)"""
+    __tablename__ = "maestria_senal"
+    __table_args__ = (UniqueConstraint("estudiante_id", "nombre_senal"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    estudiante_id = Column(Integer, ForeignKey("estudiantes.id"), nullable=False, index=True)
+    nombre_senal = Column(String(100), nullable=False)
+    
+    precision = Column(Float, default=0.5)        # Precisión con decaimiento exponencial
+    tiempo_promedio = Column(Float, default=0)    # Tiempo de respuesta con decaimiento exponencial
+    intentos = Column(Integer, default=0)
+    ultima_actualizacion = Column(DateTime, default=datetime.utcnow)
+
+
+class ResumenSenalSesion(Base):
+    """Resumen compacto por sesión y señal de los eventos ya archivados (retencion.py)"""
+    __tablename__ = "resumen_senal_sesion"
+    __table_args__ = (UniqueConstraint("sesion_id", "nombre_senal"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sesion_id = Column(Integer, ForeignKey("sesiones.id"), nullable=False, index=True)
+    nombre_senal = Column(String(100), nullable=False)
+    
+    intentos = Column(Integer, default=0)
+    aciertos = Column(Integer, default=0)
+    errores = Column(Integer, default=0)
+    tiempo_total = Column(Float, default=0)
+    tiempo_minimo = Column(Float, nullable=True)
+    tiempo_maximo = Column(Float, nullable=True)
+    errores_detallados = Column(Integer, default=0)
+    primer_evento = Column(DateTime, nullable=True)
+    ultimo_evento = Column(DateTime, nullable=True)
+
+
 # ============== FUNCIONES DE UTILIDAD ==============
 
 def get_db():
@@ -157,9 +262,244 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency para obtener sesión asíncrona de base de datos"""
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Motor asíncrono no disponible (instala aiosqlite o asyncpg)")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _completar_defaults(modelo, filas: list) -> list:
+    """Agrega a cada fila los valores por defecto declarados en el modelo"""
+    defaults = {}
+    for columna in modelo.__table__.columns:
+        if columna.default is None or columna.name in filas[0]:
+            continue
+        arg = columna.default.arg
+        defaults[columna.name] = arg(None) if columna.default.is_callable else arg
+    return [{**defaults, **f} for f in filas]
+
+
+async def insertar_en_bloque(db: "AsyncSession", modelo, filas: list, confirmar: bool = True) -> int:
+    """
+    Inserta muchas filas en una sola operación.
+    En PostgreSQL con asyncpg usa COPY; en el resto, executemany.
+    Con confirmar=False el commit queda a cargo del llamador.
+    """
+    if not filas:
+        return 0
+    
+    conexion = await db.connection()
+    if conexion.dialect.name == "postgresql" and conexion.dialect.driver == "asyncpg":
+        # COPY no aplica los valores por defecto de Python (p. ej. timestamp)
+        filas = _completar_defaults(modelo, filas)
+        columnas = list(filas[0].keys())
+        crudo = await conexion.get_raw_connection()
+        await crudo.driver_connection.copy_records_to_table(
+            modelo.__tablename__,
+            records=[tuple(f[c] for c in columnas) for f in filas],
+            columns=columnas
+        )
+    else:
+        await db.execute(insert(modelo), filas)
+    
+    if confirmar:
+        await db.commit()
+    return len(filas)
+
+
+def _insert_dialecto(db, modelo):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+    else:
+        from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+    return insert_dialecto(modelo)
+
+
+def upsert(db, modelo, filas: list, claves: list, actualizar=None):
+    """INSERT ... ON CONFLICT (claves) DO UPDATE para SQLite y PostgreSQL.
+    
+    Por defecto el conflicto reemplaza las columnas con los valores nuevos;
+    'actualizar(sentencia)' puede devolver otro SET (p. ej. acumular sobre
+    el valor guardado). Si ese SET usa bindparam() propios, pasar la tabla
+    (modelo.__table__): el INSERT del ORM descarta las claves que no son columnas."""
+    if not filas:
+        return
+    
+    sentencia = _insert_dialecto(db, modelo)
+    if actualizar is None:
+        asignaciones = {c: sentencia.excluded[c] for c in filas[0] if c not in claves}
+    else:
+        asignaciones = actualizar(sentencia)
+    db.execute(sentencia.on_conflict_do_update(index_elements=claves, set_=asignaciones), filas)
+
+
+def insertar_omitiendo(db, modelo, filas: list, claves: list):
+    """INSERT ... ON CONFLICT (claves) DO NOTHING para SQLite y PostgreSQL"""
+    if not filas:
+        return
+    
+    db.execute(_insert_dialecto(db, modelo).on_conflict_do_nothing(index_elements=claves), filas)
+
+
+def consulta_secuencias(modelo, filas: list):
+    """SELECT (sesion_id, secuencia, id) de las filas ya guardadas con las mismas secuencias"""
+    con_secuencia = [f for f in filas if f.get("secuencia") is not None]
+    return select(modelo.sesion_id, modelo.secuencia, modelo.id).where(
+        modelo.sesion_id.in_({f["sesion_id"] for f in con_secuencia}),
+        modelo.secuencia.in_({f["secuencia"] for f in con_secuencia})
+    )
+
+
+def separar_duplicados(filas: list, existentes) -> tuple:
+    """Divide filas en (nuevas, duplicadas) según (sesion_id, secuencia).
+    
+    'existentes' son las filas de consulta_secuencias; también se descartan
+    las repetidas dentro del mismo lote. Cada duplicada se devuelve como
+    (fila, id existente o None)."""
+    vistos = {(sesion_id, secuencia): id_fila for sesion_id, secuencia, id_fila in existentes}
+    nuevas, duplicadas = [], []
+    for fila in filas:
+        clave = (fila["sesion_id"], fila.get("secuencia"))
+        if clave[1] is None:
+            nuevas.append(fila)
+        elif clave in vistos:
+            duplicadas.append((fila, vistos[clave]))
+        else:
+            vistos[clave] = None
+            nuevas.append(fila)
+    return nuevas, duplicadas
+
+
+def _migrar():
+    """Agrega columnas nulables e índices nuevos a tablas ya existentes
+    (create_all solo crea las tablas que faltan)"""
+    inspector = inspect(engine)
+    tablas = set(inspector.get_table_names())
+    # Cada paso en su propia transacción: con varios workers arrancando a la vez
+    # otro proceso puede haberlo hecho primero
+    for tabla in Base.metadata.sorted_tables:
+        if tabla.name not in tablas:
+            continue
+        existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+        for columna in tabla.columns:
+            if columna.name in existentes or not columna.nullable:
+                continue
+            tipo = columna.type.compile(engine.dialect)
+            try:
+                with engine.begin() as conexion:
+                    conexion.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo}"))
+                print(f"Columna agregada: {tabla.name}.{columna.name}")
+            except Exception as e:
+                print(f"No se pudo agregar {tabla.name}.{columna.name}: {e}")
+        for indice in tabla.indexes:
+            try:
+                indice.create(engine, checkfirst=True)
+            except Exception as e:
+                print(f"No se pudo crear el índice {indice.name}: {e}")
+
+
+# ============== BÚSQUEDA DE ESTUDIANTES ==============
+# En SQLite: índice FTS5 de contenido externo sobre estudiantes (nombre e
+# identificador), sin tildes (remove_diacritics) y con índices de prefijo,
+# mantenido por triggers. "-" y "." separan palabras, así "lopez" encuentra
+# "García-López"; un identificador como "EST-0012" se busca como frase
+# ("est" seguido de "0012"*), que también exige el orden de sus partes.
+# En otros motores se busca con ILIKE.
+
+BUSQUEDA_MAX_RANKING = int(os.getenv("BUSQUEDA_MAX_RANKING", "2000"))
+
+TOKENIZADOR_BUSQUEDA = "unicode61 remove_diacritics 2 tokenchars '_'"
+
+_DDL_BUSQUEDA = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS estudiantes_fts USING fts5(
+        nombre, identificador, content='estudiantes', content_rowid='id',
+        tokenize="{TOKENIZADOR_BUSQUEDA}", prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS estudiantes_fts_ai AFTER INSERT ON estudiantes BEGIN
+        INSERT INTO estudiantes_fts(rowid, nombre, identificador) VALUES (new.id, new.nombre, new.identificador);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS estudiantes_fts_ad AFTER DELETE ON estudiantes BEGIN
+        INSERT INTO estudiantes_fts(estudiantes_fts, rowid, nombre, identificador)
+        VALUES ('delete', old.id, old.nombre, old.identificador);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS estudiantes_fts_au AFTER UPDATE OF nombre, identificador ON estudiantes BEGIN
+        INSERT INTO estudiantes_fts(estudiantes_fts, rowid, nombre, identificador)
+        VALUES ('delete', old.id, old.nombre, old.identificador);
+        INSERT INTO estudiantes_fts(rowid, nombre, identificador) VALUES (new.id, new.nombre, new.identificador);
+    END""",
+)
+
+
+def _crear_indice_busqueda():
+    if engine.dialect.name != "sqlite":
+        return
+    try:
+        with engine.begin() as conexion:
+            ddl = conexion.execute(text(
+                "SELECT sql FROM sqlite_master WHERE name = 'estudiantes_fts'"
+            )).scalar()
+            existia = ddl is not None and TOKENIZADOR_BUSQUEDA in ddl
+            if ddl is not None and not existia:
+                # Índice de una versión anterior con otro tokenizador: se rehace
+                conexion.execute(text("DROP TABLE estudiantes_fts"))
+            for sentencia in _DDL_BUSQUEDA:
+                conexion.execute(text(sentencia))
+            if not existia:
+                # Base con estudiantes previos al índice: indexarlos una vez
+                conexion.execute(text("INSERT INTO estudiantes_fts(estudiantes_fts) VALUES ('rebuild')"))
+                print("Índice de búsqueda de estudiantes creado")
+    except Exception as e:
+        print(f"No se pudo crear el índice de búsqueda de estudiantes: {e}")
+
+
+def _terminos(texto: str) -> list:
+    # Un término con "-" o "." ("garcía-lópez", "est-0012") se busca como frase
+    return [t for t in re.findall(r"[\w.-]+", texto.lower()) if re.search(r"\w", t)]
+
+
+def buscar_estudiantes(db, texto: str, limite: int = 20, desde: int = 0) -> tuple:
+    """(total, filas) de estudiantes cuyo nombre o identificador contiene palabras
+    que empiezan por cada término; ordenadas por relevancia (bm25, pesa más el nombre)
+    salvo que haya más de BUSQUEDA_MAX_RANKING coincidencias"""
+    terminos = _terminos(texto)
+    if not terminos:
+        total = db.query(func.count(Estudiante.id)).scalar()
+        filas = db.query(Estudiante.id, Estudiante.nombre, Estudiante.identificador, Estudiante.fecha_registro) \
+            .order_by(Estudiante.id.desc()).offset(desde).limit(limite).all()
+        return total, filas
+
+    if db.bind.dialect.name == "sqlite":
+        consulta = " ".join(f'"{t}"*' for t in terminos)
+        total = db.execute(text(
+            "SELECT count(*) FROM estudiantes_fts WHERE estudiantes_fts MATCH :q"
+        ), {"q": consulta}).scalar()
+        # bm25 puntúa cada coincidencia: con consultas muy amplias ("ma") cuesta
+        # decenas de ms y el orden no aporta, así que se listan las más recientes
+        orden = "bm25(estudiantes_fts, 10.0, 1.0)" if total <= BUSQUEDA_MAX_RANKING else "estudiantes_fts.rowid DESC"
+        filas = db.execute(text(f"""
+            SELECT e.id, e.nombre, e.identificador, e.fecha_registro
+            FROM estudiantes_fts JOIN estudiantes e ON e.id = estudiantes_fts.rowid
+            WHERE estudiantes_fts MATCH :q
+            ORDER BY {orden}
+            LIMIT :limite OFFSET :desde
+        """).columns(Estudiante.id, Estudiante.nombre, Estudiante.identificador, Estudiante.fecha_registro),
+            {"q": consulta, "limite": limite, "desde": desde}).all()
+        return total, filas
+
+    condiciones = [or_(Estudiante.nombre.ilike(f"{t}%"), Estudiante.nombre.ilike(f"% {t}%"),
+                       Estudiante.nombre.ilike(f"%-{t}%"), Estudiante.identificador.ilike(f"{t}%"))
+                   for t in terminos]
+    consulta = db.query(Estudiante.id, Estudiante.nombre, Estudiante.identificador, Estudiante.fecha_registro) \
+        .filter(*condiciones)
+    return consulta.count(), consulta.order_by(Estudiante.nombre).offset(desde).limit(limite).all()
+
+
 def init_db():
     """Inicializa la base de datos y crea las tablas"""
     Base.metadata.create_all(bind=engine)
+    _migrar()
+    _crear_indice_busqueda()
     
     # Crear configuración por defecto si no existe
     db = SessionLocal()
@@ -0,0 +1,205 @@
+"""
+Difusión en vivo para el panel del instructor (Server-Sent Events).
+
+La ingesta llama a difusor.publicar(tipo, datos) desde cualquier hilo; si no
+hay nadie suscrito no cuesta nada. Los eventos se agrupan durante
+DIFUSION_INTERVALO_MS y se emite una trama SSE por tipo con la lista de
+deltas acumulados:
+
+    id: 42
+    event: intentos
+    data: [{"sesion_id": 7, "senal": "Pare", "correcta": true, ...}, ...]
+
+Cada trama se serializa una sola vez y se reparte, ya en bytes, a todos los
+suscriptores. Las últimas DIFUSION_HISTORIAL tramas se guardan para que un
+EventSource que se reconecta con Last-Event-ID reciba lo que se perdió; si
+ya no están, recibe un evento "reinicio" y recarga todo.
+
+Un suscriptor lento (cola llena) se desconecta y se recupera de la misma
+forma, sin frenar a los demás.
+
+Con varios workers (conectar(), con el escritor activo) cada worker envía sus
+deltas agrupados al escritor, que los numera y los reenvía a todos: el panel
+recibe la ingesta de todos los workers aunque su EventSource esté en uno
+solo, y los ids (y por tanto Last-Event-ID) son los mismos en todos. Si se
+corta la conexión con el escritor, al volver se emite "reinicio".
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import instrumentacion
+from respuestas import a_json
+
+INTERVALO = float(os.getenv("DIFUSION_INTERVALO_MS", "100")) / 1000
+HISTORIAL = int(os.getenv("DIFUSION_HISTORIAL", "500"))
+COLA_MAXIMA = int(os.getenv("DIFUSION_COLA_MAXIMA", "256"))
+LATIDO = float(os.getenv("DIFUSION_LATIDO_S", "15"))
+
+instrumentacion.registro.describir("difusion_suscriptores", "gauge", "Suscriptores del flujo de eventos del panel")
+instrumentacion.registro.describir("difusion_tramas_total", "counter", "Tramas SSE emitidas por tipo")
+instrumentacion.registro.describir("difusion_desbordes_total", "counter", "Suscriptores desconectados por cola llena")
+
+
+def trama(id_trama, tipo: str, datos) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (id_trama, tipo.encode(), a_json(datos))
+
+
+class Difusor:
+    def __init__(self, intervalo: float = INTERVALO, historial: int = HISTORIAL, cola_maxima: int = COLA_MAXIMA):
+        self.intervalo = intervalo
+        self.cola_maxima = cola_maxima
+        self._suscriptores = set()
+        self._pendientes = {}               # tipo -> [datos, ...]
+        self._historial = deque(maxlen=historial)   # (id, trama)
+        self._ultimo_id = 0
+        self._hueco = None                  # último id emitido antes de descartar eventos sin suscriptores
+        self._lock = threading.Lock()
+        self._tarea = None
+        self._remoto = None                 # ClienteEscritor en modo multi-worker
+        self._loop = None
+
+    def conectar(self, cliente):
+        """Modo multi-worker: los deltas se reparten a través del escritor (ver escritor.py)"""
+        self._remoto = cliente
+        self._loop = asyncio.get_running_loop()
+        threading.Thread(target=self._enviar_remoto, name="difusion-envio", daemon=True).start()
+        threading.Thread(target=self._escuchar_remoto, name="difusion-escucha", daemon=True).start()
+
+    def publicar(self, tipo: str, datos: dict):
+        # Con el escritor siempre se publica: puede haber suscriptores en otro worker
+        if self._remoto is None and not self._suscriptores:
+            self._hueco = self._ultimo_id
+            return
+        with self._lock:
+            self._pendientes.setdefault(tipo, []).append(datos)
+
+    def suscribir(self, ultimo_id: str = None):
+        """Devuelve (cola, tramas a reenviar) y arranca el reparto si hacía falta"""
+        cola = asyncio.Queue(maxsize=self.cola_maxima)
+        self._suscriptores.add(cola)
+        instrumentacion.registro.incrementar("difusion_suscriptores")
+        if self._remoto is None and (self._tarea is None or self._tarea.done()):
+            self._tarea = asyncio.get_running_loop().create_task(self._repartir())
+        return cola, self._reenviar(ultimo_id)
+
+    def cancelar(self, cola):
+        if cola in self._suscriptores:
+            self._suscriptores.discard(cola)
+            instrumentacion.registro.incrementar("difusion_suscriptores", valor=-1)
+
+    def _reenviar(self, ultimo_id) -> list:
+        if ultimo_id is None:
+            return []
+        try:
+            ultimo_id = int(ultimo_id)
+        except ValueError:
+            return [trama(self._ultimo_id, "reinicio", {})]
+        # Reinicio si el servidor se reinició, si hubo eventos sin nadie escuchando
+        # después de ultimo_id o si lo perdido ya no está en el historial
+        if ultimo_id > self._ultimo_id or (self._hueco is not None and ultimo_id <= self._hueco):
+            return [trama(self._ultimo_id, "reinicio", {})]
+        if ultimo_id == self._ultimo_id:
+            return []
+        if not self._historial or ultimo_id < self._historial[0][0] - 1:
+            return [trama(self._ultimo_id, "reinicio", {})]
+        return [t for i, t in self._historial if i > ultimo_id]
+
+    async def _repartir(self):
+        while self._suscriptores:
+            await asyncio.sleep(self.intervalo)
+            with self._lock:
+                pendientes, self._pendientes = self._pendientes, {}
+            for tipo, datos in pendientes.items():
+                self._emitir(self._ultimo_id + 1, tipo, datos)
+
+    def _emitir(self, id_trama: int, tipo: str, datos: list):
+        self._ultimo_id = id_trama
+        t = trama(id_trama, tipo, datos)
+        self._historial.append((id_trama, t))
+        instrumentacion.registro.incrementar("difusion_tramas_total", (("tipo", tipo),))
+        for cola in list(self._suscriptores):
+            self._entregar(cola, t)
+
+    def _entregar(self, cola, t: bytes):
+        try:
+            cola.put_nowait(t)
+        except asyncio.QueueFull:
+            # Se desconecta; al reconectar con Last-Event-ID recupera lo perdido
+            instrumentacion.registro.incrementar("difusion_desbordes_total")
+            # (se vacía entera para que su Last-Event-ID sea lo último que recibió de verdad)
+            self.cancelar(cola)
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait(None)
+
+    # ---------- Modo multi-worker ----------
+
+    def _enviar_remoto(self):
+        """Hilo: cada intervalo manda al escritor los deltas de este worker"""
+        while True:
+            time.sleep(self.intervalo)
+            with self._lock:
+                pendientes, self._pendientes = self._pendientes, {}
+            if pendientes:
+                self._remoto.difundir(a_json({"difundir": list(pendientes.items())}) + b"\n")
+
+    def _escuchar_remoto(self):
+        """Hilo: recibe las tramas numeradas por el escritor y las emite en el loop"""
+        primera = True
+        while True:
+            try:
+                sock, lector = self._remoto.suscribir()
+            except OSError:
+                time.sleep(1)
+                continue
+            try:
+                if not primera:
+                    self._loop.call_soon_threadsafe(self._perdida)
+                primera = False
+                for linea in lector:
+                    m = json.loads(linea)
+                    self._loop.call_soon_threadsafe(self._emitir, m["id"], m["tipo"], m["datos"])
+            except OSError:
+                pass
+            except RuntimeError:
+                return  # el loop ya se cerró
+            finally:
+                lector.close()
+                sock.close()
+            time.sleep(1)
+
+    def _perdida(self):
+        """Se cortó la conexión con el escritor: lo publicado entre medias no llegó"""
+        self._hueco = self._ultimo_id
+        t = trama(self._ultimo_id, "reinicio", {})
+        for cola in list(self._suscriptores):
+            self._entregar(cola, t)
+
+    async def flujo(self, ultimo_id: str = None):
+        """Generador de bytes para una StreamingResponse text/event-stream"""
+        cola, reenviar = self.suscribir(ultimo_id)
+        try:
+            yield b"retry: 2000\n\n"
+            for t in reenviar:
+                yield t
+            while True:
+                try:
+                    t = await asyncio.wait_for(cola.get(), LATIDO)
+                except asyncio.TimeoutError:
+                    yield b": latido\n\n"
+                    continue
+                if t is None:
+                    return
+                yield t
+        finally:
+            self.cancelar(cola)
+
+    def __len__(self):
+        return len(self._suscriptores)
+
+
+difusor = Difusor()
@@ -0,0 +1,319 @@
+"""
+Proceso escritor único para el modo multi-worker.
+
+Con varios workers de uvicorn, cada proceso que escribe en SQLite compite
+por el bloqueo del archivo. En este modo los workers envían las escrituras
+de métricas (intentos, errores y ajustes) por un socket Unix a un único
+proceso escritor, que las agrupa y confirma en una sola transacción
+(group commit) antes de responder con los IDs asignados.
+
+Protocolo: una línea JSON por petición y una por respuesta.
+
+    {"tabla": ..., "datos": {...}}              -> {"id": ..., "duplicado": ...} o {"error": ...}
+    {"filas": [{"tabla": ..., "datos": ...}]}   -> {"ids": [...], "duplicados": [...]}
+
+Una fila con la misma (sesion_id, secuencia) que otra ya guardada no se
+inserta: se marca como duplicada y recibe el ID de la original.
+
+La segunda forma (ingesta en lote, respaldos) se confirma entera en la
+misma transacción: o se guardan todas las filas o ninguna.
+
+El mismo socket reparte los deltas del panel (difusion.py) entre workers:
+
+    {"difundir": [[tipo, [datos, ...]], ...]}   -> (sin respuesta)
+    {"suscribir": true}                         -> {"id": ..., "tipo": ..., "datos": [...]} por cada delta
+
+El escritor numera las tramas (desde el instante de arranque en ms, así los
+ids siguen creciendo si se reinicia) y las reenvía a todas las conexiones
+suscritas, de modo que cada worker ve los deltas de todos y un EventSource
+puede reconectar con Last-Event-ID contra cualquiera.
+"""
+import json
+import multiprocessing
+import os
+import queue
+import select
+import socket
+import socketserver
+import threading
+import time
+
+SOCKET_POR_DEFECTO = "./escritor.sock"
+MAX_LOTE = 256
+
+
+class _Pendiente:
+    __slots__ = ("filas", "listo", "ids", "duplicados", "error")
+
+    def __init__(self, filas: list):
+        self.filas = filas              # [(tabla, datos)]
+        self.listo = threading.Event()
+        self.ids = [None] * len(filas)
+        self.duplicados = [False] * len(filas)
+        self.error = None
+
+
+def _bucle_escritura(cola: "queue.Queue[_Pendiente]"):
+    """Hilo único que vacía la cola y confirma lotes en la base de datos"""
+    from database import (SessionLocal, IntentoSenal, ErrorDetallado, AjusteDificultad,
+                          consulta_secuencias, separar_duplicados)
+
+    modelos = {
+        IntentoSenal.__tablename__: IntentoSenal,
+        ErrorDetallado.__tablename__: ErrorDetallado,
+        AjusteDificultad.__tablename__: AjusteDificultad,
+    }
+
+    while True:
+        lote = [cola.get()]
+        filas_lote = len(lote[0].filas)
+        while filas_lote < MAX_LOTE:
+            try:
+                lote.append(cola.get_nowait())
+            except queue.Empty:
+                break
+            filas_lote += len(lote[-1].filas)
+
+        db = SessionLocal()
+        try:
+            # (pendiente, índice, datos) por tabla
+            por_tabla = {}
+            for pendiente in lote:
+                invalidas = [t for t, _ in pendiente.filas if t not in modelos]
+                if invalidas:
+                    pendiente.error = f"Tabla no permitida: {invalidas[0]}"
+                    continue
+                for indice, (tabla, datos) in enumerate(pendiente.filas):
+                    por_tabla.setdefault(tabla, []).append((pendiente, indice, datos))
+
+            filas = []
+            for tabla, destinos in por_tabla.items():
+                modelo = modelos[tabla]
+                datos = [d for _, _, d in destinos]
+                existentes = []
+                if hasattr(modelo, "secuencia") and any(d.get("secuencia") is not None for d in datos):
+                    existentes = db.execute(consulta_secuencias(modelo, datos)).all()
+                nuevas, duplicadas = separar_duplicados(datos, existentes)
+
+                # Un reintento (misma sesión y secuencia) recibe el ID de la fila original
+                por_datos = {id(d): (p, i) for p, i, d in destinos}
+                por_clave = {}
+                for d in nuevas:
+                    fila = modelo(**d)
+                    db.add(fila)
+                    filas.append((*por_datos[id(d)], fila))
+                    por_clave[(d["sesion_id"], d.get("secuencia"))] = fila
+                for d, id_existente in duplicadas:
+                    pendiente, indice = por_datos[id(d)]
+                    pendiente.duplicados[indice] = True
+                    if id_existente is not None:
+                        pendiente.ids[indice] = id_existente
+                    else:
+                        filas.append((pendiente, indice, por_clave[(d["sesion_id"], d["secuencia"])]))
+            db.commit()
+            for pendiente, indice, fila in filas:
+                pendiente.ids[indice] = fila.id
+        except Exception as e:
+            db.rollback()
+            for pendiente in lote:
+                pendiente.error = pendiente.error or str(e)
+        finally:
+            db.close()
+            for pendiente in lote:
+                pendiente.listo.set()
+
+
+class _Concentrador:
+    """Reparte los deltas publicados por cualquier worker a todos los suscritos"""
+
+    def __init__(self):
+        self._suscritos = set()
+        self._ultimo_id = int(time.time() * 1000)
+        self._lock = threading.Lock()
+
+    def suscribir(self, wfile):
+        with self._lock:
+            self._suscritos.add(wfile)
+
+    def cancelar(self, wfile):
+        with self._lock:
+            self._suscritos.discard(wfile)
+
+    def difundir(self, deltas: list):
+        with self._lock:
+            for tipo, datos in deltas:
+                self._ultimo_id += 1
+                linea = (json.dumps({"id": self._ultimo_id, "tipo": tipo, "datos": datos}) + "\n").encode()
+                for wfile in list(self._suscritos):
+                    try:
+                        wfile.write(linea)
+                        wfile.flush()
+                    except OSError:
+                        self._suscritos.discard(wfile)
+
+
+class _ManejadorEscritura(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            self._atender()
+        finally:
+            self.server.concentrador.cancelar(self.wfile)
+
+    def _atender(self):
+        cola = self.server.cola
+        for linea in self.rfile:
+            try:
+                mensaje = json.loads(linea)
+                if "difundir" in mensaje:
+                    # Sin respuesta ni siquiera de error: quien difunde no la lee
+                    try:
+                        self.server.concentrador.difundir(mensaje["difundir"])
+                    except (ValueError, TypeError):
+                        pass
+                    continue
+                if "suscribir" in mensaje:
+                    self.server.concentrador.suscribir(self.wfile)
+                    continue
+                en_lote = "filas" in mensaje
+                filas = ([(f["tabla"], f["datos"]) for f in mensaje["filas"]] if en_lote
+                         else [(mensaje["tabla"], mensaje["datos"])])
+            except (ValueError, KeyError, TypeError) as e:
+                self.wfile.write((json.dumps({"error": f"Mensaje inválido: {e}"}) + "\n").encode())
+                continue
+
+            pendiente = _Pendiente(filas)
+            if filas:
+                cola.put(pendiente)
+                pendiente.listo.wait()
+
+            if pendiente.error:
+                respuesta = {"error": pendiente.error}
+            elif en_lote:
+                respuesta = {"ids": pendiente.ids, "duplicados": pendiente.duplicados}
+            else:
+                respuesta = {"id": pendiente.ids[0], "duplicado": pendiente.duplicados[0]}
+            self.wfile.write((json.dumps(respuesta) + "\n").encode())
+
+
+class _ServidorEscritura(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def ejecutar_escritor(ruta_socket: str = SOCKET_POR_DEFECTO):
+    """Punto de entrada del proceso escritor"""
+    from database import init_db
+    init_db()
+
+    if os.path.exists(ruta_socket):
+        os.unlink(ruta_socket)
+
+    cola = queue.Queue()
+    threading.Thread(target=_bucle_escritura, args=(cola,), daemon=True).start()
+
+    with _ServidorEscritura(ruta_socket, _ManejadorEscritura) as servidor:
+        servidor.cola = cola
+        servidor.concentrador = _Concentrador()
+        print(f"[ESCRITOR] Escuchando en {ruta_socket}")
+        servidor.serve_forever()
+
+
+def iniciar_proceso_escritor(ruta_socket: str = SOCKET_POR_DEFECTO) -> multiprocessing.Process:
+    """Lanza el escritor en un proceso aparte y espera a que el socket exista"""
+    proceso = multiprocessing.Process(target=ejecutar_escritor, args=(ruta_socket,), daemon=True)
+    proceso.start()
+
+    evento = threading.Event()
+    while not os.path.exists(ruta_socket) and proceso.is_alive():
+        evento.wait(0.05)
+    return proceso
+
+
+class ClienteEscritor:
+    """Cliente usado por los workers; una conexión persistente por hilo"""
+
+    def __init__(self, ruta_socket: str = None):
+        self.ruta_socket = ruta_socket or os.getenv("ESCRITOR_SOCKET")
+        self._local = threading.local()
+
+    @property
+    def activo(self) -> bool:
+        return bool(self.ruta_socket)
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is not None and select.select([conexion[0]], [], [], 0)[0]:
+            # Inactiva pero legible: el escritor la cerró (EOF); no escribir en ella
+            self._cerrar()
+            conexion = None
+        if conexion is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.ruta_socket)
+            conexion = (sock, sock.makefile("rb"))
+            self._local.conexion = conexion
+        return conexion
+
+    def _cerrar(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion:
+            conexion[1].close()
+            conexion[0].close()
+        self._local.conexion = None
+
+    def _enviar(self, mensaje: dict) -> dict:
+        mensaje = (json.dumps(mensaje) + "\n").encode()
+
+        # Solo se reintenta si el mensaje no llegó a enviarse: una vez enviado el
+        # escritor pudo aplicarlo, y repetirlo duplicaría ajustes y filas sin secuencia.
+        # Si falla después, el error sube y la bitácora deja el evento en duda
+        for intento in range(2):
+            try:
+                sock, lector = self._conexion()
+                sock.sendall(mensaje)
+                break
+            except OSError:
+                self._cerrar()
+                if intento == 1:
+                    raise
+        try:
+            linea = lector.readline()
+            if not linea:
+                raise ConnectionError("El escritor cerró la conexión")
+        except OSError:
+            self._cerrar()
+            raise
+
+        respuesta = json.loads(linea)
+        if "error" in respuesta:
+            raise RuntimeError(respuesta["error"])
+        return respuesta
+
+    def difundir(self, linea: bytes):
+        """Publica deltas del panel (línea {"difundir": ...} ya serializada); sin respuesta.
+        Si el escritor no está, los deltas se pierden: el panel se recupera al recargar"""
+        try:
+            sock, _ = self._conexion()
+            sock.sendall(linea)
+        except OSError:
+            self._cerrar()
+
+    def suscribir(self):
+        """Conexión dedicada que recibe los deltas de todos los workers; devuelve (socket, lector)"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.ruta_socket)
+        sock.sendall(b'{"suscribir": true}\n')
+        return sock, sock.makefile("rb")
+
+    def insertar(self, tabla: str, datos: dict) -> tuple:
+        """Envía una fila al escritor. Devuelve (id, duplicado); si es un
+        reintento ya guardado, el ID es el de la fila original"""
+        respuesta = self._enviar({"tabla": tabla, "datos": datos})
+        return respuesta["id"], respuesta["duplicado"]
+
+    def insertar_lote(self, filas: list) -> tuple:
+        """Envía [(tabla, datos)] para confirmarlas en una sola transacción.
+        Devuelve (ids, duplicados): duplicados[i] indica que la fila i ya
+        estaba guardada (misma sesión y secuencia) e ids[i] es la original"""
+        if not filas:
+            return [], []
+        respuesta = self._enviar({"filas": [{"tabla": t, "datos": d} for t, d in filas]})
+        return respuesta["ids"], respuesta["duplicados"]
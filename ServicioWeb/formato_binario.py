@@ -0,0 +1,162 @@
+"""
+Formato binario compacto para la telemetría de Unity.
+
+Alternativa a JSON en los endpoints de ingesta (/intentos, /errores y sus
+versiones /lote), elegida con Content-Type: application/x-metricas-binario.
+Los nombres de señal y de respuesta viajan como IDs enteros de la tabla de
+símbolos que publica GET /simbolos; el cliente envía en X-Simbolos-Version
+la versión ("n-crc32") de la tabla que usó para codificar. Esa tabla es
+simbolos.codigos: incluye las señales vistas por la ingesta y los nombres
+registrados con POST /simbolos, sin mezclar las respuestas en senales, y se
+comparte entre workers a través de su archivo.
+
+Cabecera (8 bytes, little-endian):
+
+    2s  magia b"MB"
+    B   versión del formato (1)
+    B   tipo de registro (1 = intento, 2 = error)
+    I   cantidad de registros
+
+Registros de 16 bytes, uno tras otro:
+
+    intento: sesion_id u32, senal u16, respuesta i16 (-1 = sin respuesta),
+             tiempo_respuesta f32, fue_correcta u8, zona u8, ronda u8, dificultad u8
+    error:   sesion_id u32, senal u16, respuesta i16, tiempo_respuesta f32,
+             tipo_error u8 (índice en TIPOS_ERROR), zona u8, dificultad u8,
+             intentos_previos u8
+
+Los registros se desempaquetan con struct.iter_unpack y se validan por
+rangos, sin pasar cada evento por Pydantic.
+"""
+import math
+import struct
+import threading
+
+from simbolos import senales, codigos, TablaLlena
+
+TIPO_CONTENIDO = "application/x-metricas-binario"
+MAGIA = b"MB"
+VERSION = 1
+CABECERA = struct.Struct("<2sBBI")
+
+INTENTO = 1
+ERROR = 2
+TIPOS_ERROR = ("confusion", "tiempo_agotado", "distractor")
+
+# Ambos tipos comparten la misma disposición; cambia el significado de los últimos bytes
+REGISTRO = struct.Struct("<IHhfBBBB")
+CAMPOS = {
+    INTENTO: ("sesion_id", "nombre_senal", "respuesta_usuario", "tiempo_respuesta",
+              "fue_correcta", "zona", "ronda", "dificultad"),
+    ERROR: ("sesion_id", "nombre_senal", "respuesta_usuario", "tiempo_respuesta",
+            "tipo_error", "zona", "dificultad", "intentos_previos"),
+}
+
+
+class ErrorFormato(ValueError):
+    """Cuerpo binario mal formado o con IDs fuera de rango"""
+
+
+class TablaDesactualizada(ErrorFormato):
+    """El cliente codificó con una tabla de símbolos que no coincide con la del servidor"""
+
+
+_sincronizadas = 0
+_lock_sincronizar = threading.Lock()
+
+
+def sincronizar():
+    """Agrega a los códigos las señales que aparecieron en la ingesta"""
+    global _sincronizadas
+    if _sincronizadas >= len(senales):
+        return
+    with _lock_sincronizar:
+        total = len(senales)
+        try:
+            for nombre in senales.nombres()[_sincronizadas:total]:
+                codigos.id(nombre)
+                _sincronizadas += 1
+        except TablaLlena as e:
+            print(f"[simbolos] {e}; las señales nuevas solo se aceptan en JSON")
+            _sincronizadas = total
+
+
+def version_tabla() -> str:
+    codigos.actualizar()
+    sincronizar()
+    n = len(codigos)
+    return f"{n}-{codigos.huella(n):08x}"
+
+
+def verificar_version(version: str):
+    """La tabla del cliente es válida si es un prefijo de la del servidor"""
+    try:
+        n, huella = version.split("-")
+        n, huella = int(n), int(huella, 16)
+    except (AttributeError, ValueError):
+        raise TablaDesactualizada("Falta o es inválida la cabecera X-Simbolos-Version")
+    if n > len(codigos):
+        # Quizás otro worker registró nombres que este aún no cargó
+        codigos.actualizar()
+    if n > len(codigos) or codigos.huella(n) != huella:
+        raise TablaDesactualizada("Tabla de símbolos desactualizada; vuelva a descargar /simbolos")
+    return n
+
+
+def decodificar(cuerpo: bytes, tipo: int, version: str) -> list:
+    """Lista de dicts con los mismos campos que IntentoCreate / ErrorCreate"""
+    n_simbolos = verificar_version(version)
+    if len(cuerpo) < CABECERA.size:
+        raise ErrorFormato("Cuerpo demasiado corto")
+    magia, version_formato, tipo_cuerpo, cantidad = CABECERA.unpack_from(cuerpo)
+    if magia != MAGIA or version_formato != VERSION:
+        raise ErrorFormato("Cabecera binaria no reconocida")
+    if tipo_cuerpo != tipo:
+        raise ErrorFormato(f"Tipo de registro {tipo_cuerpo} no válido para este endpoint")
+
+    if len(cuerpo) != CABECERA.size + cantidad * REGISTRO.size:
+        raise ErrorFormato(f"Se esperaban {cantidad} registros de {REGISTRO.size} bytes")
+
+    # struct.iter_unpack desempaqueta en C; en Python solo quedan la
+    # validación de rangos y el paso de IDs a nombres
+    nombres = codigos.nombres()[:n_simbolos]
+    filas = []
+    for sesion_id, senal, respuesta, tiempo, a, zona, b, c in REGISTRO.iter_unpack(memoryview(cuerpo)[CABECERA.size:]):
+        if senal >= n_simbolos or not -1 <= respuesta < n_simbolos:
+            raise ErrorFormato("ID de señal o respuesta fuera de la tabla de símbolos")
+        if not math.isfinite(tiempo):
+            raise ErrorFormato("tiempo_respuesta no es un número finito")
+        fila = {
+            "sesion_id": sesion_id,
+            "nombre_senal": nombres[senal],
+            "respuesta_usuario": nombres[respuesta] if respuesta >= 0 else None,
+            "tiempo_respuesta": tiempo,
+            "zona": zona,
+            "dificultad": c if tipo == INTENTO else b,
+        }
+        if tipo == INTENTO:
+            fila["fue_correcta"] = bool(a)
+            fila["ronda"] = b
+        else:
+            if a >= len(TIPOS_ERROR):
+                raise ErrorFormato("tipo_error desconocido")
+            fila["tipo_error"] = TIPOS_ERROR[a]
+            fila["intentos_previos"] = c
+            fila["feedback_generado"] = None
+        filas.append(fila)
+    return filas
+
+
+def codificar(filas: list, tipo: int) -> bytes:
+    """Inverso de decodificar (para benchmarks y clientes en Python)"""
+    partes = [CABECERA.pack(MAGIA, VERSION, tipo, len(filas))]
+    for fila in filas:
+        respuesta = fila.get("respuesta_usuario")
+        partes.append(REGISTRO.pack(*(
+            codigos.id(fila[campo]) if campo == "nombre_senal"
+            else (codigos.id(respuesta) if respuesta else -1) if campo == "respuesta_usuario"
+            else TIPOS_ERROR.index(fila[campo]) if campo == "tipo_error"
+            else fila.get(campo, 0)
+            for campo in CAMPOS[tipo]
+        )))
+    return b"".join(partes)
@@ -0,0 +1,226 @@
+"""
+Alta masiva de estudiantes (POST /estudiantes/importar).
+
+El cuerpo es un CSV con cabecera (nombre,identificador; separador ',' o ';')
+o JSON: un array de objetos o un objeto por línea (NDJSON). Se recibe en un
+archivo temporal (en memoria hasta IMPORTACION_MEMORIA_BYTES, luego en
+disco) y se lee fila a fila, así que la memoria no depende del tamaño del
+archivo. Las filas se procesan en lotes de IMPORTACION_LOTE: por lote, una
+sola consulta IN (...) averigua qué identificadores ya existen y un solo
+INSERT (executemany) escribe el lote.
+
+Modos para identificadores que ya existen:
+
+    actualizar  se actualiza el nombre (upsert); cada lote en su transacción
+    omitir      se dejan como están; cada lote en su transacción
+    fallar      todo o nada: cualquier conflicto o fila inválida deshace la
+                importación completa (un solo commit al final)
+
+Devuelve un informe con los contadores y los primeros errores por línea.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+
+from sqlalchemy import insert, select
+
+from database import SessionLocal, Estudiante, upsert, insertar_omitiendo
+
+MODOS = ("actualizar", "omitir", "fallar")
+TAMANO_LOTE = int(os.getenv("IMPORTACION_LOTE", "1000"))
+MAX_BYTES = int(os.getenv("IMPORTACION_MAX_BYTES", str(50 * 1024 * 1024)))
+MEMORIA_BYTES = int(os.getenv("IMPORTACION_MEMORIA_BYTES", str(1024 * 1024)))
+MAX_ERRORES = int(os.getenv("IMPORTACION_MAX_ERRORES", "100"))
+MAX_ELEMENTO_JSON = 64 * 1024
+
+LARGO_NOMBRE = Estudiante.__table__.c.nombre.type.length
+LARGO_IDENTIFICADOR = Estudiante.__table__.c.identificador.type.length
+
+
+class ImportacionRechazada(Exception):
+    """Archivo ilegible (400) o modo 'fallar' con errores (409). El informe
+    dice cuánto quedó escrito: nada en 'fallar', los lotes ya confirmados en
+    los otros modos"""
+
+    def __init__(self, informe: dict, estado: int):
+        super().__init__(informe.get("error", "Importación rechazada"))
+        self.informe = informe
+        self.estado = estado
+
+
+# ============== LECTURA ==============
+
+def detectar_formato(tipo_contenido: str, archivo) -> str:
+    """'json' o 'csv' según Content-Type o, si no lo dice, el primer carácter"""
+    tipo = (tipo_contenido or "").split(";")[0].strip().lower()
+    if tipo in ("application/json", "application/x-ndjson", "application/jsonl"):
+        return "json"
+    if tipo in ("text/csv", "application/csv"):
+        return "csv"
+    inicio = archivo.read(64).lstrip(codecs.BOM_UTF8).lstrip()
+    archivo.seek(0)
+    return "json" if inicio[:1] in (b"[", b"{") else "csv"
+
+
+def filas_csv(archivo):
+    """(línea, fila) de un CSV con cabecera"""
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    cabecera = texto.readline()
+    separador = ";" if cabecera.count(";") > cabecera.count(",") else ","
+    columnas = [c.strip().lower() for c in next(csv.reader([cabecera], delimiter=separador), [])]
+    if "nombre" not in columnas or "identificador" not in columnas:
+        raise ValueError("El CSV necesita una cabecera con las columnas 'nombre' e 'identificador'")
+    lector = csv.reader(texto, delimiter=separador)
+    for valores in lector:
+        if not any(v.strip() for v in valores):
+            continue
+        yield lector.line_num + 1, dict(zip(columnas, valores))
+
+
+def filas_json(archivo, tamano_lectura: int = 64 * 1024):
+    """(número de elemento, objeto) de un array JSON o de JSON por líneas,
+    decodificando un elemento a la vez"""
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig")
+    decodificador = json.JSONDecoder()
+    buffer, pos, numero, en_array = "", 0, 0, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            buffer, pos = texto.read(tamano_lectura), 0
+            if not buffer:
+                if en_array:
+                    raise ValueError("Array JSON sin cerrar")
+                return
+            continue
+        if buffer[pos] == "[" and not en_array and numero == 0:
+            en_array, pos = True, pos + 1
+            continue
+        if buffer[pos] == "]" and en_array:
+            return
+        try:
+            objeto, fin = decodificador.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Elemento partido entre dos lecturas
+            mas = texto.read(tamano_lectura)
+            if not mas or len(buffer) - pos > MAX_ELEMENTO_JSON:
+                raise ValueError(f"JSON inválido en el elemento {numero + 1}")
+            buffer, pos = buffer[pos:] + mas, 0
+            continue
+        numero += 1
+        yield numero, objeto
+        pos = fin
+
+
+# ============== ESCRITURA ==============
+
+def _validar(fila):
+    """(nombre, identificador) o un motivo de rechazo"""
+    if not isinstance(fila, dict):
+        return None, "no es un objeto"
+    nombre = str(fila.get("nombre") or "").strip()
+    identificador = str(fila.get("identificador") or "").strip()
+    if not nombre or not identificador:
+        return None, "faltan nombre o identificador"
+    if len(nombre) > LARGO_NOMBRE or len(identificador) > LARGO_IDENTIFICADOR:
+        return None, f"nombre (máx. {LARGO_NOMBRE}) o identificador (máx. {LARGO_IDENTIFICADOR}) demasiado largo"
+    return (nombre, identificador), None
+
+
+def _anotar_error(informe: dict, linea: int, motivo: str, identificador: str = None):
+    if len(informe["errores"]) < MAX_ERRORES:
+        informe["errores"].append({"linea": linea, "identificador": identificador, "motivo": motivo})
+
+
+def _lotes(filas, tamano: int):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def importar(db, filas, modo: str, tamano_lote: int = TAMANO_LOTE) -> dict:
+    informe = {"modo": modo, "filas": 0, "creados": 0, "actualizados": 0, "omitidos": 0,
+               "invalidos": 0, "conflictos": 0, "lotes": 0, "errores": []}
+    try:
+        for lote in _lotes(filas, tamano_lote):
+            validas = {}    # identificador -> (línea, nombre); dentro del lote gana la última
+            for linea, fila in lote:
+                informe["filas"] += 1
+                datos, motivo = _validar(fila)
+                if motivo:
+                    informe["invalidos"] += 1
+                    _anotar_error(informe, linea, motivo)
+                    continue
+                nombre, identificador = datos
+                if identificador in validas:
+                    if modo == "fallar":
+                        informe["conflictos"] += 1
+                        _anotar_error(informe, linea, "identificador repetido en el archivo", identificador)
+                        continue
+                    if modo == "omitir":
+                        informe["omitidos"] += 1
+                        continue
+                    informe["actualizados"] += 1
+                validas[identificador] = (linea, nombre)
+
+            existentes = set(db.execute(
+                select(Estudiante.identificador).where(Estudiante.identificador.in_(list(validas)))
+            ).scalars()) if validas else set()
+            filas_lote = [{"nombre": nombre, "identificador": identificador}
+                          for identificador, (_, nombre) in validas.items()]
+            informe["lotes"] += 1
+
+            if modo == "fallar":
+                for identificador in existentes:
+                    informe["conflictos"] += 1
+                    _anotar_error(informe, validas[identificador][0], "el identificador ya existe", identificador)
+                if informe["conflictos"] or informe["invalidos"]:
+                    continue    # se sigue leyendo solo para informar todos los errores
+                if filas_lote:
+                    db.execute(insert(Estudiante), filas_lote)
+                informe["creados"] += len(filas_lote)
+                continue
+
+            if modo == "actualizar":
+                upsert(db, Estudiante, filas_lote, ["identificador"])
+                informe["actualizados"] += len(existentes)
+                informe["creados"] += len(filas_lote) - len(existentes)
+            else:
+                insertar_omitiendo(db, Estudiante, [f for f in filas_lote if f["identificador"] not in existentes],
+                                   ["identificador"])
+                informe["omitidos"] += len(existentes)
+                informe["creados"] += len(filas_lote) - len(existentes)
+            db.commit()
+
+        if modo == "fallar" and (informe["conflictos"] or informe["invalidos"]):
+            db.rollback()
+            informe["creados"] = 0
+            raise ImportacionRechazada(informe, 409)
+        db.commit()
+    except (ValueError, csv.Error) as e:
+        db.rollback()
+        if modo == "fallar":
+            informe["creados"] = 0
+        informe["error"] = str(e)
+        raise ImportacionRechazada(informe, 400)
+    except Exception:
+        db.rollback()
+        raise
+    return informe
+
+
+def importar_archivo(archivo, formato: str, modo: str) -> dict:
+    """Importa un archivo ya recibido; se ejecuta en un hilo (BD síncrona)"""
+    filas = filas_json(archivo) if formato == "json" else filas_csv(archivo)
+    db = SessionLocal()
+    try:
+        return importar(db, filas, modo)
+    finally:
+        db.close()
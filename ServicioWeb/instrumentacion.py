@@ -0,0 +1,159 @@
+"""
+Métricas internas del servicio en formato de texto de Prometheus.
+
+Contadores e histogramas con buckets fijos. Cada hilo escribe en su propio
+fragmento (threading.local), así que registrar una observación no toma
+ningún lock; /metrics suma los fragmentos al momento de exponerlos.
+
+Además, cada petición lleva en un ContextVar el tiempo acumulado por
+categoría (db, modelo, llm) para armar la cabecera Server-Timing.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tiempos por categoría de la petición en curso: {"db": s, "modelo": s, ...}
+tiempos_peticion: ContextVar[dict] = ContextVar("tiempos_peticion", default=None)
+
+
+class RegistroMetricas:
+    """Contadores e histogramas fragmentados por hilo"""
+
+    def __init__(self, buckets=BUCKETS_SEGUNDOS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._fragmentos = []
+        self._lock = threading.Lock()   # solo al registrar un hilo nuevo
+        self._ayuda = {}
+        self._tipos = {}
+
+    def describir(self, nombre: str, tipo: str, ayuda: str):
+        self._tipos[nombre] = tipo
+        self._ayuda[nombre] = ayuda
+
+    def _fragmento(self) -> dict:
+        fragmento = getattr(self._local, "datos", None)
+        if fragmento is None:
+            fragmento = self._local.datos = {}
+            with self._lock:
+                self._fragmentos.append(fragmento)
+        return fragmento
+
+    def incrementar(self, nombre: str, etiquetas: tuple = (), valor: float = 1):
+        fragmento = self._fragmento()
+        clave = (nombre, etiquetas)
+        fragmento[clave] = fragmento.get(clave, 0) + valor
+
+    def observar(self, nombre: str, etiquetas: tuple, segundos: float):
+        fragmento = self._fragmento()
+        clave = (nombre, etiquetas)
+        datos = fragmento.get(clave)
+        if datos is None:
+            # [conteo por bucket..., +Inf, suma]
+            datos = fragmento[clave] = [0] * (len(self.buckets) + 2)
+        datos[bisect.bisect_left(self.buckets, segundos)] += 1
+        datos[-1] += segundos
+
+    def _agregar(self) -> dict:
+        total = {}
+        with self._lock:
+            fragmentos = list(self._fragmentos)
+        for fragmento in fragmentos:
+            for clave, valor in list(fragmento.items()):
+                if isinstance(valor, list):
+                    acumulado = total.setdefault(clave, [0] * len(valor))
+                    for i, v in enumerate(valor):
+                        acumulado[i] += v
+                else:
+                    total[clave] = total.get(clave, 0) + valor
+        return total
+
+    def exponer(self) -> str:
+        """Texto en formato de exposición de Prometheus"""
+        por_nombre = {}
+        for (nombre, etiquetas), valor in self._agregar().items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+
+        lineas = []
+        for nombre in sorted(por_nombre):
+            if nombre in self._ayuda:
+                lineas.append(f"# HELP {nombre} {self._ayuda[nombre]}")
+                lineas.append(f"# TYPE {nombre} {self._tipos[nombre]}")
+            for etiquetas, valor in sorted(por_nombre[nombre]):
+                if isinstance(valor, list):
+                    acumulado = 0
+                    for limite, conteo in zip(self.buckets + ("+Inf",), valor[:-1]):
+                        acumulado += conteo
+                        lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', limite),))} {acumulado}")
+                    lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {valor[-1]:.6f}")
+                    lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {acumulado}")
+                else:
+                    lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas(etiquetas: tuple) -> str:
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas:
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+registro = RegistroMetricas()
+registro.describir("http_peticiones_total", "counter", "Peticiones HTTP por ruta, método y estado")
+registro.describir("http_peticiones_en_curso", "gauge", "Peticiones HTTP en curso")
+registro.describir("http_duracion_segundos", "histogram", "Latencia de las peticiones HTTP por ruta")
+registro.describir("db_consulta_segundos", "histogram", "Duración de las sentencias SQL")
+registro.describir("modelo_inferencia_segundos", "histogram", "Duración de la inferencia del modelo de dificultad")
+registro.describir("llm_llamada_segundos", "histogram", "Duración de las llamadas al proveedor de IA")
+
+HISTOGRAMAS_CATEGORIA = {
+    "db": "db_consulta_segundos",
+    "modelo": "modelo_inferencia_segundos",
+    "llm": "llm_llamada_segundos",
+}
+
+
+def acumular(categoria: str, segundos: float):
+    """Registra el tiempo en el histograma de la categoría y en la petición en curso"""
+    registro.observar(HISTOGRAMAS_CATEGORIA[categoria], (), segundos)
+    tiempos = tiempos_peticion.get()
+    if tiempos is not None:
+        tiempos[categoria] = tiempos.get(categoria, 0.0) + segundos
+
+
+@contextmanager
+def medir(categoria: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        acumular(categoria, time.perf_counter() - inicio)
+
+
+def instrumentar_motor(engine):
+    """Mide cada sentencia SQL con los eventos de cursor de SQLAlchemy"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conexion, cursor, sentencia, parametros, contexto, executemany):
+        conexion.info.setdefault("_inicio_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conexion, cursor, sentencia, parametros, contexto, executemany):
+        inicio = conexion.info["_inicio_consulta"].pop()
+        acumular("db", time.perf_counter() - inicio)
+
+
+def server_timing(total: float, tiempos: dict) -> str:
+    """Valor de la cabecera Server-Timing (milisegundos)"""
+    partes = [f"app;dur={total * 1000:.2f}"]
+    partes.extend(f"{categoria};dur={segundos * 1000:.2f}" for categoria, segundos in tiempos.items())
+    return ", ".join(partes)
@@ -0,0 +1,253 @@
+"""
+Modelo de dominio por estudiante y señal, actualizado en línea.
+
+Cada celda (estudiante, señal) guarda una precisión y un tiempo de respuesta
+con decaimiento exponencial, más el número de intentos. El estado vive en
+arreglos NumPy indexados por fila de estudiante e ID de señal (ver
+simbolos.py), así que registrar un intento y consultar a un estudiante son
+O(1) / O(señales) sin recorrer el historial de intentos_senal.
+
+El estado se carga desde la tabla maestria_senal al arrancar y las celdas
+modificadas se persisten periódicamente con un upsert. Con varios workers
+cada uno solo ve sus propios intentos, así que no se guarda el valor
+absoluto sino el cambio desde el último guardado: una media exponencial
+tras k observaciones es afín en el valor anterior (v' = v * (1 - α)^k + s),
+y el upsert aplica ese factor y esa suma sobre lo que haya en la tabla.
+Así los guardados de distintos workers se componen en lugar de pisarse.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from simbolos import senales
+
+PRECISION_INICIAL = 0.5   # Prior para señales nunca vistas
+ALFA_POR_DEFECTO = 0.3    # Peso de la observación más reciente
+EPOCA = datetime(1970, 1, 1)
+
+
+def a_segundos(fecha: datetime) -> float:
+    """datetime UTC sin zona (como los de la BD) -> segundos desde la época"""
+    return (fecha - EPOCA).total_seconds() if fecha else 0.0
+
+
+def a_fecha(segundos: float) -> datetime:
+    return EPOCA + timedelta(seconds=float(segundos))
+
+
+def dificultad_desde_dominio(precision: float, tiempo: float) -> int:
+    """Misma regla con la que se generó el dataset del modelo (dataset.py)"""
+    if precision >= 0.8 and tiempo < 4:
+        return 2
+    if precision >= 0.5:
+        return 1
+    return 0
+
+
+class AlmacenMaestria:
+    """Estado de dominio en arreglos densos (estudiantes x señales)"""
+
+    def __init__(self, alfa: float = ALFA_POR_DEFECTO, capacidad_estudiantes: int = 64, capacidad_senales: int = 32):
+        self.alfa = alfa
+        self._filas = {}  # estudiante_id -> fila
+        self._lock = threading.Lock()
+        self._reservar(capacidad_estudiantes, capacidad_senales)
+
+    def _reservar(self, n_estudiantes: int, n_senales: int):
+        """Crea o agranda los arreglos conservando los datos existentes"""
+        anteriores = getattr(self, "precision", None)
+        forma = (n_estudiantes, n_senales)
+
+        nuevos = {
+            "precision": np.full(forma, PRECISION_INICIAL, dtype=np.float32),
+            "tiempo": np.zeros(forma, dtype=np.float32),
+            "intentos": np.zeros(forma, dtype=np.int32),
+            "ultima": np.zeros(forma, dtype=np.float64),  # epoch en segundos
+            "sucio": np.zeros(forma, dtype=bool),
+            # Cambio desde el último guardado: v_guardado * factor + suma, y los intentos nuevos
+            "factor_precision": np.ones(forma, dtype=np.float64),
+            "suma_precision": np.zeros(forma, dtype=np.float64),
+            "factor_tiempo": np.ones(forma, dtype=np.float64),
+            "suma_tiempo": np.zeros(forma, dtype=np.float64),
+            "intentos_nuevos": np.zeros(forma, dtype=np.int32),
+        }
+        if anteriores is not None:
+            f, c = anteriores.shape
+            for nombre, arreglo in nuevos.items():
+                arreglo[:f, :c] = getattr(self, nombre)
+        for nombre, arreglo in nuevos.items():
+            setattr(self, nombre, arreglo)
+
+    def _fila(self, estudiante_id: int) -> int:
+        fila = self._filas.get(estudiante_id)
+        if fila is None:
+            fila = len(self._filas)
+            self._filas[estudiante_id] = fila
+        return fila
+
+    def _celda(self, estudiante_id: int, nombre_senal: str):
+        """Fila y columna de la celda, agrandando los arreglos si hace falta"""
+        fila = self._fila(estudiante_id)
+        columna = senales.id(nombre_senal)
+        f, c = self.precision.shape
+        if fila >= f or columna >= c:
+            self._reservar(f if fila < f else (fila + 1) * 2, c if columna < c else (columna + 1) * 2)
+        return fila, columna
+
+    def registrar(self, estudiante_id: int, nombre_senal: str, fue_correcta: bool,
+                  tiempo_respuesta: float, timestamp: float = None):
+        """Actualización en línea con un nuevo intento"""
+        with self._lock:
+            fila, columna = self._celda(estudiante_id, nombre_senal)
+            alfa = self.alfa
+            n = self.intentos[fila, columna]
+
+            self.precision[fila, columna] += alfa * (float(fue_correcta) - self.precision[fila, columna])
+            if n == 0:
+                self.tiempo[fila, columna] = tiempo_respuesta
+            else:
+                self.tiempo[fila, columna] += alfa * (tiempo_respuesta - self.tiempo[fila, columna])
+            self.intentos[fila, columna] = n + 1
+            self.ultima[fila, columna] = timestamp or a_segundos(datetime.utcnow())
+            self.sucio[fila, columna] = True
+
+            self.factor_precision[fila, columna] *= 1 - alfa
+            self.suma_precision[fila, columna] = (1 - alfa) * self.suma_precision[fila, columna] + alfa * float(fue_correcta)
+            self.factor_tiempo[fila, columna] *= 1 - alfa
+            self.suma_tiempo[fila, columna] = (1 - alfa) * self.suma_tiempo[fila, columna] + alfa * tiempo_respuesta
+            self.intentos_nuevos[fila, columna] += 1
+
+    def obtener(self, estudiante_id: int) -> dict:
+        """Estado de todas las señales vistas por el estudiante"""
+        fila = self._filas.get(estudiante_id)
+        if fila is None:
+            return {}
+
+        with self._lock:
+            n_senales = min(len(senales), self.precision.shape[1])
+            intentos = self.intentos[fila, :n_senales].copy()
+            precision = self.precision[fila, :n_senales].copy()
+            tiempo = self.tiempo[fila, :n_senales].copy()
+
+        return {
+            senales.nombre(c): {
+                "precision": round(float(precision[c]), 3),
+                "tiempo_promedio": round(float(tiempo[c]), 2),
+                "intentos": int(intentos[c]),
+            }
+            for c in np.flatnonzero(intentos)
+        }
+
+    def recomendar(self, estudiante_id: int, k: int = 5) -> dict:
+        """Señales más débiles y dificultad sugerida para la siguiente ronda"""
+        estado = self.obtener(estudiante_id)
+        if not estado:
+            return {"senales_sugeridas": [], "dificultad_sugerida": 0, "precision_media": PRECISION_INICIAL}
+
+        debiles = sorted(estado, key=lambda s: (estado[s]["precision"], -estado[s]["tiempo_promedio"]))
+        precision_media = sum(e["precision"] for e in estado.values()) / len(estado)
+        tiempo_medio = sum(e["tiempo_promedio"] for e in estado.values()) / len(estado)
+
+        return {
+            "senales_sugeridas": debiles[:k],
+            "dificultad_sugerida": dificultad_desde_dominio(precision_media, tiempo_medio),
+            "precision_media": round(precision_media, 3),
+        }
+
+    def celdas(self):
+        """Itera (estudiante_id, señal, precisión, intentos, última) de las celdas con datos"""
+        with self._lock:
+            estudiantes = {fila: est for est, fila in self._filas.items()}
+            datos = [(estudiantes[f], senales.nombre(c), float(self.precision[f, c]),
+                      int(self.intentos[f, c]), float(self.ultima[f, c]))
+                     for f, c in np.argwhere(self.intentos > 0)]
+        return iter(datos)
+
+    # ---------- Persistencia ----------
+
+    def cargar(self, db):
+        """Reconstruye el estado desde la tabla maestria_senal"""
+        from database import MaestriaSenal
+
+        for fila in db.query(MaestriaSenal).all():
+            with self._lock:
+                f, c = self._celda(fila.estudiante_id, fila.nombre_senal)
+                self.precision[f, c] = fila.precision
+                self.tiempo[f, c] = fila.tiempo_promedio
+                self.intentos[f, c] = fila.intentos
+                self.ultima[f, c] = a_segundos(fila.ultima_actualizacion)
+
+    _DELTAS = ("factor_precision", "suma_precision", "factor_tiempo", "suma_tiempo", "intentos_nuevos")
+
+    def guardar(self, db) -> int:
+        """Persiste el cambio de las celdas modificadas desde el último guardado"""
+        from database import MaestriaSenal, upsert
+
+        with self._lock:
+            estudiantes = {fila: est for est, fila in self._filas.items()}
+            celdas = np.argwhere(self.sucio)
+            f, c = celdas[:, 0], celdas[:, 1]
+            deltas = {nombre: getattr(self, nombre)[f, c].copy() for nombre in self._DELTAS}
+            filas = [{
+                "estudiante_id": estudiantes[fi],
+                "nombre_senal": senales.nombre(ci),
+                # Valores absolutos: se usan si la fila aún no existe
+                "precision": float(self.precision[fi, ci]),
+                "tiempo_promedio": float(self.tiempo[fi, ci]),
+                "intentos": int(deltas["intentos_nuevos"][n]),
+                "ultima_actualizacion": a_fecha(self.ultima[fi, ci]),
+                "factor_precision": float(deltas["factor_precision"][n]),
+                "suma_precision": float(deltas["suma_precision"][n]),
+                "factor_tiempo": float(deltas["factor_tiempo"][n]),
+                "suma_tiempo": float(deltas["suma_tiempo"][n]),
+            } for n, (fi, ci) in enumerate(celdas.tolist())]
+            self._reiniciar_deltas(f, c)
+
+        try:
+            upsert(db, MaestriaSenal.__table__, filas, ["estudiante_id", "nombre_senal"], _acumular)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                # Lo guardado va antes que lo registrado mientras tanto: componer ambos cambios
+                self.suma_precision[f, c] += deltas["suma_precision"] * self.factor_precision[f, c]
+                self.factor_precision[f, c] *= deltas["factor_precision"]
+                self.suma_tiempo[f, c] += deltas["suma_tiempo"] * self.factor_tiempo[f, c]
+                self.factor_tiempo[f, c] *= deltas["factor_tiempo"]
+                self.intentos_nuevos[f, c] += deltas["intentos_nuevos"]
+                self.sucio[f, c] = True
+            raise
+        return len(filas)
+
+    def _reiniciar_deltas(self, f, c):
+        self.sucio[f, c] = False
+        self.factor_precision[f, c] = 1.0
+        self.suma_precision[f, c] = 0.0
+        self.factor_tiempo[f, c] = 1.0
+        self.suma_tiempo[f, c] = 0.0
+        self.intentos_nuevos[f, c] = 0
+
+
+def _acumular(sentencia) -> dict:
+    """SET del upsert de maestria_senal: aplica el cambio sobre el valor guardado"""
+    from sqlalchemy import bindparam, case
+
+    guardada = sentencia.table.c
+    nueva = sentencia.excluded
+    return {
+        "precision": guardada.precision * bindparam("factor_precision") + bindparam("suma_precision"),
+        # Sin intentos guardados el tiempo no tiene valor previo (el primero se toma tal cual)
+        "tiempo_promedio": case(
+            (guardada.intentos == 0, nueva.tiempo_promedio),
+            else_=guardada.tiempo_promedio * bindparam("factor_tiempo") + bindparam("suma_tiempo"),
+        ),
+        "intentos": guardada.intentos + nueva.intentos,
+        "ultima_actualizacion": case(
+            (nueva.ultima_actualizacion > guardada.ultima_actualizacion, nueva.ultima_actualizacion),
+            else_=guardada.ultima_actualizacion,
+        ),
+    }
+
+
+maestria = AlmacenMaestria()
@@ -0,0 +1,117 @@
+"""
+Bosque de decisión aplanado y compartido entre procesos.
+
+El RandomForest de 'modelo_dificultad.pkl' se convierte a arreglos NumPy
+planos (un nodo por fila) que se guardan como .npy y se abren con
+mmap_mode="r". Así todos los workers leen las mismas páginas del caché
+del sistema operativo en lugar de mantener cada uno su propia copia.
+"""
+import os
+import numpy as np
+
+DIRECTORIO_PLANO = os.getenv("MODELO_PLANO_DIR", "modelo_dificultad_plano")
+
+# Un nodo por fila: hoja si izquierdo == -1
+NODO_DTYPE = np.dtype([
+    ("caracteristica", np.int32),
+    ("umbral", np.float64),
+    ("izquierdo", np.int32),
+    ("derecho", np.int32),
+])
+
+
+def aplanar_bosque(modelo):
+    """Convierte un RandomForestClassifier en arreglos planos"""
+    estimadores = modelo.estimators_
+    n_clases = len(modelo.classes_)
+    total_nodos = sum(e.tree_.node_count for e in estimadores)
+
+    nodos = np.zeros(total_nodos, dtype=NODO_DTYPE)
+    valores = np.zeros((total_nodos, n_clases), dtype=np.float64)
+    raices = np.zeros(len(estimadores), dtype=np.int32)
+
+    desplazamiento = 0
+    for i, estimador in enumerate(estimadores):
+        arbol = estimador.tree_
+        n = arbol.node_count
+        hoja = arbol.children_left == -1
+
+        bloque = nodos[desplazamiento:desplazamiento + n]
+        bloque["caracteristica"] = np.where(hoja, 0, arbol.feature)
+        bloque["umbral"] = arbol.threshold
+        bloque["izquierdo"] = np.where(hoja, -1, arbol.children_left + desplazamiento)
+        bloque["derecho"] = np.where(hoja, -1, arbol.children_right + desplazamiento)
+
+        # Normalizar a probabilidades por hoja (sklearn < 1.4 guarda conteos)
+        conteos = arbol.value[:, 0, :]
+        sumas = conteos.sum(axis=1, keepdims=True)
+        valores[desplazamiento:desplazamiento + n] = conteos / np.where(sumas == 0, 1, sumas)
+
+        raices[i] = desplazamiento
+        desplazamiento += n
+
+    clases = np.asarray(modelo.classes_, dtype=np.int64)
+    return nodos, valores, raices, clases
+
+
+def exportar_modelo_plano(ruta_pkl: str = "modelo_dificultad.pkl", directorio: str = DIRECTORIO_PLANO) -> bool:
+    """Genera los .npy del bosque si no existen o si el .pkl es más reciente"""
+    marca = os.path.join(directorio, "nodos.npy")
+    if not os.path.exists(ruta_pkl):
+        return os.path.exists(marca)
+    if os.path.exists(marca) and os.path.getmtime(marca) >= os.path.getmtime(ruta_pkl):
+        return True
+
+    import joblib
+    nodos, valores, raices, clases = aplanar_bosque(joblib.load(ruta_pkl))
+
+    os.makedirs(directorio, exist_ok=True)
+    np.save(os.path.join(directorio, "valores.npy"), valores)
+    np.save(os.path.join(directorio, "raices.npy"), raices)
+    np.save(os.path.join(directorio, "clases.npy"), clases)
+    # nodos.npy se escribe al final: su presencia indica exportación completa
+    np.save(marca, nodos)
+    print(f"Modelo aplanado exportado en '{directorio}' ({len(nodos)} nodos)")
+    return True
+
+
+class BosquePlano:
+    """Evaluador vectorizado del bosque aplanado (compatible con model.predict)"""
+
+    def __init__(self, nodos, valores, raices, clases):
+        self.nodos = nodos
+        self.valores = valores
+        self.raices = raices
+        self.classes_ = clases
+        self._caracteristica = nodos["caracteristica"]
+        self._umbral = nodos["umbral"]
+        self._izquierdo = nodos["izquierdo"]
+        self._derecho = nodos["derecho"]
+
+    @classmethod
+    def cargar(cls, directorio: str = DIRECTORIO_PLANO):
+        """Abre los arreglos en modo memoria compartida (solo lectura)"""
+        abrir = lambda nombre: np.load(os.path.join(directorio, nombre), mmap_mode="r")
+        return cls(abrir("nodos.npy"), abrir("valores.npy"), abrir("raices.npy"), abrir("clases.npy"))
+
+    def hojas(self, X) -> np.ndarray:
+        """Índice de hoja alcanzado por cada fila de X en cada árbol: (n_filas, n_arboles)"""
+        # sklearn compara en float32 contra umbrales float64
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        filas = np.arange(X.shape[0])[:, None]
+        actual = np.broadcast_to(self.raices, (X.shape[0], len(self.raices))).copy()
+
+        while True:
+            izquierdo = self._izquierdo[actual]
+            activos = izquierdo != -1
+            if not activos.any():
+                return actual
+            valor = X[filas, self._caracteristica[actual]]
+            siguiente = np.where(valor <= self._umbral[actual], izquierdo, self._derecho[actual])
+            actual = np.where(activos, siguiente, actual)
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self.valores[self.hojas(X)].mean(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        return np.asarray(self.classes_)[self.predict_proba(X).argmax(axis=1)]
@@ -0,0 +1,211 @@
+"""
+Exportación del bosque de dificultad para evaluarlo en el visor, sin red.
+
+El RandomForest (o el BosquePlano de modelo_compartido) se publica como una
+tabla de nodos en JSON con columnas paralelas, versionada por su contenido:
+
+    formato            "bosque-plano"
+    version_formato    1
+    version            primeros 16 hex de la suma de control (también es el ETag)
+    suma_control       "sha256:<hex>" de la disposición canónica (ver abajo)
+    caracteristicas    orden de las columnas de entrada
+    clases             dificultad de cada posición del vector de probabilidades
+    raices             nodo raíz de cada árbol
+    caracteristica, umbral, izquierdo, derecho    una entrada por nodo
+    valores            probabilidades por hoja, aplanadas (n_hojas x n_clases)
+    paridad            entradas con la clase y probabilidades que da el servidor
+
+Un nodo es hoja si izquierdo < 0; sus probabilidades son la fila
+(-izquierdo - 1) de valores. Evaluación (igual que sklearn):
+
+    x_i = (double)(float)entrada_i           // sklearn compara en float32
+    p = 0
+    para cada raíz r:
+        n = r
+        mientras izquierdo[n] >= 0:
+            n = x[caracteristica[n]] <= umbral[n] ? izquierdo[n] : derecho[n]
+        p += valores[-izquierdo[n] - 1]
+    clase = clases[primer índice máximo de p]
+
+La suma de control es SHA-256 sobre, en este orden y en little-endian:
+caracteristica (int32), umbral (float64), izquierdo (int32), derecho
+(int32), valores (float64), raices (int32) y clases (int64). El cliente
+la recalcula con los números ya leídos del JSON, así que también detecta
+umbrales que no sobrevivieron al parseo. Después debe reproducir la clase
+de cada entrada de paridad (y sus probabilidades con tolerancia 1e-9).
+
+    python modelo_portatil.py exportar [--pkl modelo_dificultad.pkl] [--salida modelo_dificultad.json]
+    python modelo_portatil.py verificar modelo_dificultad.json
+"""
+import argparse
+import hashlib
+import json
+import sys
+
+import numpy as np
+
+from modelo_compartido import aplanar_bosque
+
+FORMATO = "bosque-plano"
+VERSION_FORMATO = 1
+CARACTERISTICAS = ("zona", "senales_mostradas", "aciertos", "errores", "tiempo_promedio")
+N_PARIDAD = 256
+TOLERANCIA = 1e-9
+
+
+def _arreglos(modelo):
+    """(nodos, valores, raices, clases) de un RandomForest o de un BosquePlano"""
+    if hasattr(modelo, "estimators_"):
+        return aplanar_bosque(modelo)
+    return (np.asarray(modelo.nodos), np.asarray(modelo.valores),
+            np.asarray(modelo.raices), np.asarray(modelo.classes_))
+
+
+def suma_control(caracteristica, umbral, izquierdo, derecho, valores, raices, clases) -> str:
+    h = hashlib.sha256()
+    for arreglo, tipo in ((caracteristica, "<i4"), (umbral, "<f8"), (izquierdo, "<i4"), (derecho, "<i4"),
+                          (valores, "<f8"), (raices, "<i4"), (clases, "<i8")):
+        h.update(np.ascontiguousarray(arreglo, dtype=tipo).tobytes())
+    return "sha256:" + h.hexdigest()
+
+
+def _entradas_paridad(caracteristica, umbral, hoja, n: int, semilla: int = 0) -> np.ndarray:
+    """Mitad al azar dentro del rango de los umbrales; mitad con una columna
+    justo en un umbral (y sus vecinos float32) para probar <= y el redondeo"""
+    rng = np.random.default_rng(semilla)
+    n_car = len(CARACTERISTICAS)
+    bajo, alto = np.zeros(n_car), np.ones(n_car)
+    for c in range(n_car):
+        u = umbral[~hoja & (caracteristica == c)]
+        if u.size:
+            bajo[c], alto[c] = u.min() - 1, u.max() + 1
+    X = rng.uniform(bajo, alto, size=(n, n_car))
+
+    internos = np.flatnonzero(~hoja)
+    if internos.size:
+        mitad = np.arange(n // 2, n)
+        elegidos = rng.choice(internos, size=mitad.size)
+        base = umbral[elegidos].astype(np.float32)
+        desvio = rng.integers(-1, 2, size=mitad.size)
+        cerca = np.where(desvio < 0, np.nextafter(base, np.float32(-np.inf)),
+                         np.where(desvio > 0, np.nextafter(base, np.float32(np.inf)), base))
+        X[mitad, caracteristica[elegidos]] = cerca
+    return X
+
+
+def construir(modelo, n_paridad: int = N_PARIDAD) -> dict:
+    """Paquete exportable del modelo cargado, con su conjunto de paridad"""
+    nodos, valores_nodo, raices, clases = _arreglos(modelo)
+    hoja = nodos["izquierdo"] == -1
+    indice_hoja = np.cumsum(hoja) - 1
+
+    caracteristica = np.where(hoja, 0, nodos["caracteristica"]).astype(np.int32)
+    umbral = np.where(hoja, 0.0, nodos["umbral"]).astype(np.float64)
+    izquierdo = np.where(hoja, -1 - indice_hoja, nodos["izquierdo"]).astype(np.int32)
+    derecho = np.where(hoja, -1, nodos["derecho"]).astype(np.int32)
+    valores = np.ascontiguousarray(valores_nodo[hoja], dtype=np.float64)
+    raices = np.asarray(raices, dtype=np.int32)
+    clases = np.asarray(clases, dtype=np.int64)
+
+    suma = suma_control(caracteristica, umbral, izquierdo, derecho, valores, raices, clases)
+    paquete = {
+        "formato": FORMATO,
+        "version_formato": VERSION_FORMATO,
+        "version": suma.split(":")[1][:16],
+        "suma_control": suma,
+        "caracteristicas": list(CARACTERISTICAS),
+        "clases": clases.tolist(),
+        "n_arboles": len(raices),
+        "n_nodos": len(caracteristica),
+        "raices": raices.tolist(),
+        "caracteristica": caracteristica.tolist(),
+        "umbral": umbral.tolist(),
+        "izquierdo": izquierdo.tolist(),
+        "derecho": derecho.tolist(),
+        "valores": valores.ravel().tolist(),
+    }
+
+    # Las probabilidades esperadas salen del algoritmo del cliente (así el cuerpo
+    # depende solo de la versión); las clases deben coincidir con las del servidor
+    X = _entradas_paridad(caracteristica, umbral, hoja, n_paridad)
+    esperadas = np.asarray(modelo.predict(X))
+    paquete["paridad"] = []
+    for fila, clase in zip(X.tolist(), esperadas.tolist()):
+        p = evaluar(paquete, fila)
+        if paquete["clases"][int(np.argmax(p))] != clase:
+            raise ValueError(f"La evaluación exportada no reproduce el modelo en {fila}")
+        paquete["paridad"].append({"x": fila, "clase": int(clase), "probabilidades": p})
+    return paquete
+
+
+# ============== EVALUACIÓN DE REFERENCIA ==============
+
+def evaluar(paquete: dict, x) -> list:
+    """Probabilidades de una entrada, con el mismo algoritmo que el cliente"""
+    caracteristica, umbral = paquete["caracteristica"], paquete["umbral"]
+    izquierdo, derecho = paquete["izquierdo"], paquete["derecho"]
+    valores, n_clases = paquete["valores"], len(paquete["clases"])
+    x = [float(np.float32(v)) for v in x]
+
+    p = [0.0] * n_clases
+    for n in paquete["raices"]:
+        while izquierdo[n] >= 0:
+            n = izquierdo[n] if x[caracteristica[n]] <= umbral[n] else derecho[n]
+        fila = (-izquierdo[n] - 1) * n_clases
+        for k in range(n_clases):
+            p[k] += valores[fila + k]
+    return [v / len(paquete["raices"]) for v in p]
+
+
+def verificar(paquete: dict) -> list:
+    """Lista de problemas (vacía si la suma de control y toda la paridad coinciden)"""
+    problemas = []
+    if paquete.get("formato") != FORMATO or paquete.get("version_formato") != VERSION_FORMATO:
+        return [f"Formato no soportado: {paquete.get('formato')} v{paquete.get('version_formato')}"]
+
+    suma = suma_control(*(np.asarray(paquete[c]) for c in
+                          ("caracteristica", "umbral", "izquierdo", "derecho", "valores", "raices", "clases")))
+    if suma != paquete["suma_control"]:
+        problemas.append(f"Suma de control distinta: {suma} != {paquete['suma_control']}")
+
+    for i, caso in enumerate(paquete["paridad"]):
+        p = evaluar(paquete, caso["x"])
+        clase = paquete["clases"][max(range(len(p)), key=p.__getitem__)]
+        if clase != caso["clase"] or max(abs(a - b) for a, b in zip(p, caso["probabilidades"])) > TOLERANCIA:
+            problemas.append(f"Paridad {i}: clase {clase} (esperada {caso['clase']})")
+    return problemas
+
+
+# ============== CLI ==============
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="comando", required=True)
+    exp = sub.add_parser("exportar", help="Escribe el paquete JSON del modelo")
+    exp.add_argument("--pkl", default="modelo_dificultad.pkl")
+    exp.add_argument("--salida", default="modelo_dificultad.json")
+    exp.add_argument("--paridad", type=int, default=N_PARIDAD, help="Entradas del conjunto de paridad")
+    ver = sub.add_parser("verificar", help="Comprueba suma de control y paridad de un paquete")
+    ver.add_argument("archivo")
+    args = parser.parse_args()
+
+    if args.comando == "exportar":
+        import joblib
+        paquete = construir(joblib.load(args.pkl), args.paridad)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(paquete, f, separators=(",", ":"))
+        print(f"Modelo {paquete['version']} exportado en '{args.salida}' "
+              f"({paquete['n_arboles']} árboles, {paquete['n_nodos']} nodos, {len(paquete['paridad'])} casos de paridad)")
+        return
+
+    with open(args.archivo, encoding="utf-8") as f:
+        paquete = json.load(f)
+    problemas = verificar(paquete)
+    for problema in problemas[:20]:
+        print(problema)
+    print(f"Modelo {paquete.get('version')}: " + ("OK" if not problemas else f"{len(problemas)} problemas"))
+    sys.exit(1 if problemas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Herramientas de diagnóstico en vivo (solo administradores).
+
+- Muestreador de pilas: cada pocos milisegundos toma las pilas de todos los
+  hilos (sys._current_frames) y las acumula en formato "collapsed stacks",
+  compatible con flamegraph.pl / speedscope. En modo "cpu" se descartan las
+  muestras cuyo frame superior es una espera (select, wait, sleep, ...), lo
+  que aproxima el tiempo de CPU sin instrumentar el intérprete.
+- Registro de consultas lentas: sentencias SQL por encima de un umbral con
+  su plan (EXPLAIN QUERY PLAN en SQLite, EXPLAIN en PostgreSQL).
+- Diferencias de memoria con tracemalloc entre una instantánea base y la actual.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+
+# Funciones que indican que el hilo está esperando y no usando CPU
+FUNCIONES_ESPERA = {"select", "poll", "epoll", "wait", "acquire", "sleep", "accept", "recv", "recv_into"}
+
+
+# ============== MUESTREADOR DE PILAS ==============
+
+def _pila(frame) -> list:
+    pila = []
+    while frame is not None:
+        codigo = frame.f_code
+        pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+        frame = frame.f_back
+    pila.reverse()
+    return pila
+
+
+class Muestreador:
+    """Acumula pilas de todos los hilos en un hilo aparte"""
+
+    def __init__(self, intervalo: float = 0.005, modo: str = "wall"):
+        self.intervalo = intervalo
+        self.modo = modo
+        self.muestras = Counter()
+        self.total = 0
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _tomar_muestra(self, propio: int, nombres: dict):
+        for hilo_id, frame in sys._current_frames().items():
+            if hilo_id == propio:
+                continue
+            if self.modo == "cpu" and frame.f_code.co_name in FUNCIONES_ESPERA:
+                continue
+            pila = _pila(frame)
+            self.muestras[";".join([nombres.get(hilo_id, str(hilo_id))] + pila)] += 1
+        self.total += 1
+
+    def _bucle(self):
+        propio = threading.get_ident()
+        while not self._detener.is_set():
+            nombres = {h.ident: h.name for h in threading.enumerate()}
+            self._tomar_muestra(propio, nombres)
+            self._detener.wait(self.intervalo)
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, name="muestreador", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> str:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        """Una línea por pila: 'hilo;frame;frame;... conteo'"""
+        return "\n".join(f"{pila} {n}" for pila, n in self.muestras.most_common()) + "\n"
+
+
+def perfilar(segundos: float, intervalo: float = 0.005, modo: str = "wall") -> str:
+    """Muestrea durante 'segundos' (bloqueante: llamar desde un hilo)"""
+    muestreador = Muestreador(intervalo, modo)
+    muestreador.iniciar()
+    time.sleep(segundos)
+    return muestreador.detener()
+
+
+class PerfilesRecientes:
+    """Perfiles por petición, accesibles por ID (se guardan los últimos N)"""
+
+    def __init__(self, maximo: int = 20):
+        self.maximo = maximo
+        self._perfiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, collapsed: str) -> str:
+        perfil_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._perfiles[perfil_id] = collapsed
+            while len(self._perfiles) > self.maximo:
+                self._perfiles.popitem(last=False)
+        return perfil_id
+
+    def obtener(self, perfil_id: str):
+        with self._lock:
+            return self._perfiles.get(perfil_id)
+
+
+perfiles_recientes = PerfilesRecientes()
+
+
+# ============== CONSULTAS LENTAS ==============
+
+class RegistroConsultasLentas:
+    """Últimas sentencias SQL que superaron el umbral, con su plan de ejecución"""
+
+    def __init__(self, umbral_ms: float = 100.0, maximo: int = 200):
+        self.umbral_ms = umbral_ms
+        self.consultas = deque(maxlen=maximo)
+
+    def instrumentar(self, engine):
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _antes(conexion, cursor, sentencia, parametros, contexto, executemany):
+            conexion.info.setdefault("_inicio_lenta", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _despues(conexion, cursor, sentencia, parametros, contexto, executemany):
+            duracion_ms = (time.perf_counter() - conexion.info["_inicio_lenta"].pop()) * 1000
+            if duracion_ms < self.umbral_ms:
+                return
+            self.consultas.append({
+                "timestamp": datetime.utcnow().isoformat(),
+                "duracion_ms": round(duracion_ms, 2),
+                "sentencia": sentencia,
+                "parametros": repr(parametros)[:500],
+                "plan": None if executemany else self._plan(conexion, cursor, sentencia, parametros),
+            })
+
+    def _plan(self, conexion, cursor, sentencia: str, parametros):
+        """Plan de ejecución de la sentencia (solo SELECT)"""
+        if not sentencia.lstrip().upper().startswith("SELECT"):
+            return None
+        dialecto = conexion.dialect.name
+        prefijo = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}.get(dialecto)
+        if prefijo is None:
+            return None
+        try:
+            explicacion = conexion.connection.cursor()
+            explicacion.execute(prefijo + sentencia, parametros)
+            filas = explicacion.fetchall()
+            explicacion.close()
+            return [" | ".join(str(c) for c in fila) for fila in filas]
+        except Exception as e:
+            return [f"No se pudo obtener el plan: {e}"]
+
+
+consultas_lentas = RegistroConsultasLentas(float(os.getenv("CONSULTA_LENTA_MS", "100")))
+
+
+# ============== MEMORIA (tracemalloc) ==============
+
+class DiferenciasMemoria:
+    """Compara instantáneas de tracemalloc contra una base"""
+
+    def __init__(self):
+        self._base = None
+
+    @property
+    def activo(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def iniciar(self, marcos: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(marcos)
+        self._base = self._instantanea()
+
+    @staticmethod
+    def _instantanea():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+
+    def detener(self):
+        tracemalloc.stop()
+        self._base = None
+
+    def diferencia(self, top: int = 20, agrupar: str = "lineno", reiniciar_base: bool = False) -> dict:
+        if not tracemalloc.is_tracing() or self._base is None:
+            raise RuntimeError("tracemalloc no está activo")
+        actual = self._instantanea()
+        estadisticas = actual.compare_to(self._base, agrupar)
+        actual_total, pico = tracemalloc.get_traced_memory()
+        if reiniciar_base:
+            self._base = actual
+        return {
+            "memoria_actual_kb": round(actual_total / 1024, 1),
+            "pico_kb": round(pico / 1024, 1),
+            "diferencias": [{
+                "ubicacion": str(e.traceback[0]) if agrupar != "traceback" else [str(f) for f in e.traceback],
+                "diferencia_kb": round(e.size_diff / 1024, 1),
+                "total_kb": round(e.size / 1024, 1),
+                "diferencia_bloques": e.count_diff,
+            } for e in estadisticas[:top]],
+        }
+
+
+memoria = DiferenciasMemoria()
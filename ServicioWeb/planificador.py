@@ -0,0 +1,145 @@
+"""
+Planificador de repaso espaciado: qué señales mostrar a continuación.
+
+Cada estudiante tiene una cola de prioridad (heap) de señales ordenada por
+vencimiento y debilidad:
+
+    prioridad = vence - PESO_DEBILIDAD * debilidad
+
+Un acierto duplica el intervalo de repaso de la señal (estilo Leitner) y un
+error lo reinicia. Al reprogramar una señal no se busca su entrada anterior
+en el heap: se incrementa su versión y se inserta una entrada nueva; las
+entradas con versión vieja se descartan al salir del heap (borrado perezoso).
+
+Las colas solo se crean con la ingesta (o al sembrar desde maestria): para
+un estudiante sin cola, siguientes() responde con el orden por defecto sin
+guardar nada, así que consultar ids arbitrarios no ocupa memoria.
+"""
+import heapq
+import threading
+import time
+
+from simbolos import senales
+
+INTERVALO_BASE = 60.0          # segundos hasta el primer repaso tras un error
+INTERVALO_MAXIMO = 7 * 86400.0
+PESO_DEBILIDAD = 600.0         # segundos que adelanta una debilidad de 1.0
+ALFA_DEBILIDAD = 0.3
+DEBILIDAD_INICIAL = 0.5
+BONO_CONFUSION = 0.1           # refuerzo extra cuando llega un error detallado
+RACHA_MAXIMA = 16              # con más aciertos seguidos el intervalo ya es INTERVALO_MAXIMO
+
+
+class _ColaEstudiante:
+    __slots__ = ("heap", "version", "racha", "debilidad", "vence", "conocidas", "obsoletas")
+
+    def __init__(self):
+        self.heap = []          # (prioridad, id_senal, version)
+        self.version = []
+        self.racha = []
+        self.debilidad = []
+        self.vence = []
+        self.conocidas = 0      # señales de la tabla global ya incorporadas
+        self.obsoletas = 0
+
+
+class Planificador:
+    """Colas de repaso por estudiante con borrado perezoso"""
+
+    def __init__(self):
+        self._colas = {}
+        self._lock = threading.Lock()
+
+    def _cola(self, estudiante_id: int) -> _ColaEstudiante:
+        cola = self._colas.get(estudiante_id)
+        if cola is None:
+            cola = self._colas[estudiante_id] = _ColaEstudiante()
+        # Incorporar señales que aparecieron desde la última vez (vencen ya)
+        total = len(senales)
+        if cola.conocidas < total:
+            ahora = time.time()
+            for id_senal in range(cola.conocidas, total):
+                cola.version.append(0)
+                cola.racha.append(0)
+                cola.debilidad.append(DEBILIDAD_INICIAL)
+                cola.vence.append(ahora)
+                heapq.heappush(cola.heap, (ahora - PESO_DEBILIDAD * DEBILIDAD_INICIAL, id_senal, 0))
+            cola.conocidas = total
+        return cola
+
+    def _reprogramar(self, cola: _ColaEstudiante, id_senal: int):
+        cola.version[id_senal] += 1
+        cola.obsoletas += 1
+        prioridad = cola.vence[id_senal] - PESO_DEBILIDAD * cola.debilidad[id_senal]
+        heapq.heappush(cola.heap, (prioridad, id_senal, cola.version[id_senal]))
+
+        # Compactar cuando las entradas obsoletas dominan el heap
+        if cola.obsoletas > 2 * cola.conocidas + 16:
+            cola.heap = [e for e in cola.heap if e[2] == cola.version[e[1]]]
+            heapq.heapify(cola.heap)
+            cola.obsoletas = 0
+
+    def registrar_intento(self, estudiante_id: int, nombre_senal: str, fue_correcta: bool, ahora: float = None):
+        """Actualiza racha, debilidad y vencimiento de la señal"""
+        ahora = ahora or time.time()
+        senales.id(nombre_senal)
+        with self._lock:
+            cola = self._cola(estudiante_id)
+            i = senales.id(nombre_senal)
+
+            cola.racha[i] = min(cola.racha[i] + 1, RACHA_MAXIMA) if fue_correcta else 0
+            cola.debilidad[i] += ALFA_DEBILIDAD * ((0.0 if fue_correcta else 1.0) - cola.debilidad[i])
+            intervalo = min(INTERVALO_BASE * (2 ** cola.racha[i]), INTERVALO_MAXIMO)
+            cola.vence[i] = ahora + intervalo
+            self._reprogramar(cola, i)
+
+    def registrar_confusion(self, estudiante_id: int, nombre_senal: str):
+        """Un error detallado (confusión, tiempo agotado) refuerza la debilidad"""
+        senales.id(nombre_senal)
+        with self._lock:
+            cola = self._cola(estudiante_id)
+            i = senales.id(nombre_senal)
+            cola.debilidad[i] = min(1.0, cola.debilidad[i] + BONO_CONFUSION)
+            self._reprogramar(cola, i)
+
+    def siguientes(self, estudiante_id: int, k: int = 5, ahora: float = None) -> list:
+        """Las k señales más prioritarias, sin consumirlas"""
+        ahora = ahora or time.time()
+        with self._lock:
+            if estudiante_id not in self._colas:
+                # Sin historial todas vencen ya con la misma debilidad: gana el ID de señal
+                return [{"senal": senales.nombre(i), "vence_en": 0.0, "debilidad": DEBILIDAD_INICIAL}
+                        for i in range(min(k, len(senales)))]
+            cola = self._cola(estudiante_id)
+            heap = cola.heap
+            elegidas = []
+
+            while heap and len(elegidas) < k:
+                entrada = heapq.heappop(heap)
+                if entrada[2] != cola.version[entrada[1]]:
+                    cola.obsoletas -= 1
+                    continue
+                elegidas.append(entrada)
+
+            for entrada in elegidas:
+                heapq.heappush(heap, entrada)
+
+            return [{
+                "senal": senales.nombre(i),
+                "vence_en": round(max(0.0, cola.vence[i] - ahora), 1),
+                "debilidad": round(cola.debilidad[i], 3),
+            } for _, i, _ in elegidas]
+
+    def sembrar(self, estudiante_id: int, nombre_senal: str, precision: float, intentos: int, ultima: float):
+        """Estado inicial aproximado desde maestria (el planificador no se persiste)"""
+        senales.id(nombre_senal)
+        with self._lock:
+            cola = self._cola(estudiante_id)
+            i = senales.id(nombre_senal)
+            cola.debilidad[i] = 1.0 - precision
+            cola.racha[i] = min(intentos, round(precision * 4), RACHA_MAXIMA)
+            cola.vence[i] = ultima + min(INTERVALO_BASE * (2 ** cola.racha[i]), INTERVALO_MAXIMO)
+            self._reprogramar(cola, i)
+
+
+planificador = Planificador()
@@ -0,0 +1,147 @@
+"""
+Prueba de carga del modo multi-worker.
+
+Levanta el servicio con 1, 2, 4... workers (hasta el número de núcleos) en
+un directorio temporal con su propia base de datos, lo satura con procesos
+cliente que mezclan /predecir e /intentos sobre conexiones persistentes, y
+muestra el throughput obtenido para cada cantidad de workers.
+
+Uso:
+    python prueba_carga.py [--duracion 10] [--clientes 16] [--workers 1,2,4]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def _peticion(conexion, metodo: str, ruta: str, cuerpo: dict = None):
+    datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+    conexion.request(metodo, ruta, body=datos, headers={"Content-Type": "application/json"})
+    respuesta = conexion.getresponse()
+    contenido = respuesta.read()
+    return respuesta.status, contenido
+
+
+def _cliente(puerto: int, sesion_id: int, duracion: float, resultados):
+    """Proceso cliente: alterna predicciones e intentos durante 'duracion' segundos"""
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+    completadas = fallidas = 0
+    fin = time.perf_counter() + duracion
+    n = 0
+
+    while time.perf_counter() < fin:
+        n += 1
+        if n % 2:
+            aciertos = n % 6
+            estado, _ = _peticion(conexion, "POST", "/predecir", {
+                "zona": 1 + n % 4, "senales_mostradas": 5, "aciertos": aciertos,
+                "errores": 5 - aciertos, "tiempo_promedio": 2.0 + n % 7
+            })
+        else:
+            estado, _ = _peticion(conexion, "POST", "/intentos", {
+                "sesion_id": sesion_id, "nombre_senal": f"Senal_{n % 20}",
+                "respuesta_usuario": f"Senal_{(n + 1) % 20}", "fue_correcta": n % 3 == 0,
+                "tiempo_respuesta": 3.5, "zona": 1, "ronda": n % 6
+            })
+        if estado == 200:
+            completadas += 1
+        else:
+            fallidas += 1
+
+    conexion.close()
+    resultados.put((completadas, fallidas))
+
+
+def _esperar_servicio(puerto: int, limite: float = 60.0):
+    inicio = time.time()
+    while time.time() - inicio < limite:
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=2)
+            estado, _ = _peticion(conexion, "GET", "/health")
+            conexion.close()
+            if estado == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("El servicio no respondió a tiempo")
+
+
+def medir(workers: int, clientes: int, duracion: float, puerto: int) -> dict:
+    """Mide el throughput del servicio con una cantidad dada de workers"""
+    temporal = tempfile.mkdtemp(prefix="carga_")
+    shutil.copy(os.path.join(DIRECTORIO, "modelo_dificultad.pkl"), temporal)
+
+    entorno = dict(os.environ, SERVICIO_WORKERS=str(workers), SERVICIO_PUERTO=str(puerto),
+                   PYTHONUNBUFFERED="1", ADMISION_ACTIVA="0")
+    entorno.pop("ESCRITOR_SOCKET", None)
+    entorno.pop("MODELO_PLANO_DIR", None)
+    servidor = subprocess.Popen(
+        [sys.executable, os.path.join(DIRECTORIO, "servicio.py")],
+        cwd=temporal, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    try:
+        _esperar_servicio(puerto)
+        conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=10)
+        _, contenido = _peticion(conexion, "POST", "/sesiones", {"estudiante_id": 1})
+        sesion_id = json.loads(contenido)["sesion_id"]
+        conexion.close()
+
+        resultados = multiprocessing.Queue()
+        procesos = [
+            multiprocessing.Process(target=_cliente, args=(puerto, sesion_id, duracion, resultados))
+            for _ in range(clientes)
+        ]
+        for p in procesos:
+            p.start()
+        totales = [resultados.get() for _ in procesos]
+        for p in procesos:
+            p.join()
+
+        completadas = sum(t[0] for t in totales)
+        fallidas = sum(t[1] for t in totales)
+        return {
+            "workers": workers,
+            "peticiones": completadas,
+            "fallidas": fallidas,
+            "rps": completadas / duracion,
+        }
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=15)
+        shutil.rmtree(temporal, ignore_errors=True)
+
+
+def main():
+    nucleos = os.cpu_count() or 1
+    por_defecto = [w for w in (1, 2, 4, 8, 16) if w <= nucleos] or [1]
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duracion", type=float, default=10.0)
+    parser.add_argument("--clientes", type=int, default=max(8, 2 * nucleos))
+    parser.add_argument("--workers", default=",".join(map(str, por_defecto)))
+    parser.add_argument("--puerto", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"Núcleos: {nucleos} | Clientes: {args.clientes} | Duración: {args.duracion}s\n")
+    print(f"{'Workers':>8} {'Peticiones':>11} {'Fallidas':>9} {'Req/s':>10} {'Escala':>7}")
+
+    base = None
+    for workers in (int(w) for w in args.workers.split(",")):
+        r = medir(workers, args.clientes, args.duracion, args.puerto)
+        base = base or r["rps"]
+        print(f"{r['workers']:>8} {r['peticiones']:>11} {r['fallidas']:>9} "
+              f"{r['rps']:>10.1f} {r['rps'] / base:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
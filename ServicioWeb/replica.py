@@ -0,0 +1,191 @@
+"""
+Réplica de solo lectura para analítica, panel y exportaciones (solo SQLite).
+
+Cada REPLICA_INTERVALO_S segundos se copia la base principal con la API de
+backup de SQLite (en un solo paso: con WAL no frena a los escritores) a un
+archivo temporal, que luego reemplaza a REPLICA_RUTA con os.replace. Las
+consultas de la réplica abren el archivo con immutable=1: sin bloqueos ni
+-wal/-shm, y cada petición ve una foto fija aunque llegue una copia nueva
+mientras tanto. Si la base no cambió desde la última copia (mismo tamaño y
+mtime de la base y su -wal) no se copia, solo se renueva la marca de tiempo.
+
+Los endpoints que usan get_db_lectura / get_async_db_lectura leen de la
+réplica mientras su edad no supere REPLICA_FRESCURA_MAX_S (o el valor,
+menor, que pida el cliente en X-Frescura-Max-S); si no, de la principal.
+La respuesta lleva X-Datos-Origen (replica | principal) y X-Datos-Edad-S.
+
+REPLICA_ACTIVA=1 la activa. Con varios workers la copia es compartida: un
+flock sobre REPLICA_RUTA.lock deja copiar a un solo proceso a la vez, y la
+huella de la base copiada se guarda en REPLICA_RUTA.huella para que los demás
+adopten esa copia en lugar de repetirla.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from fastapi import Request
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import instrumentacion
+from snapshots import bloqueo
+from database import engine, DATABASE_URL, SessionLocal, AsyncSessionLocal, _es_sqlite
+
+ACTIVA = os.getenv("REPLICA_ACTIVA", "0") == "1"
+RUTA = os.path.abspath(os.getenv("REPLICA_RUTA", "metricas_replica.db"))
+INTERVALO = float(os.getenv("REPLICA_INTERVALO_S", "30"))
+FRESCURA_MAXIMA = float(os.getenv("REPLICA_FRESCURA_MAX_S", "120"))
+
+instrumentacion.registro.describir("replica_copias_total", "counter", "Copias de la base a la réplica por resultado")
+instrumentacion.registro.describir("replica_copia_segundos", "histogram", "Duración de cada copia con la API de backup")
+instrumentacion.registro.describir("replica_lecturas_total", "counter", "Sesiones de lectura por origen")
+
+
+class Replica:
+    def __init__(self, ruta: str = RUTA, frescura_maxima: float = FRESCURA_MAXIMA):
+        self.ruta = ruta
+        self.frescura_maxima = frescura_maxima
+        self.activa = ACTIVA and _es_sqlite(DATABASE_URL)
+        self.copiada_en = None          # time.time() al empezar la última copia válida
+        self._huella = None
+        self._lock = threading.Lock()
+        self._sesiones = None
+        self._sesiones_async = None
+        self._motor = None
+        self._motor_async = None
+
+    def _huella_origen(self):
+        origen = engine.url.database
+        return [
+            [os.stat(ruta).st_size, os.stat(ruta).st_mtime_ns] if os.path.exists(ruta) else None
+            for ruta in (origen, origen + "-wal")
+        ]
+
+    def _huella_copia(self):
+        """Huella de la base cuando se hizo la copia que hay en disco (de cualquier worker)"""
+        try:
+            with open(self.ruta + ".huella") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _guardar_huella(self, huella):
+        temporal = f"{self.ruta}.huella.{os.getpid()}.tmp"
+        with open(temporal, "w") as f:
+            json.dump(huella, f)
+        os.replace(temporal, self.ruta + ".huella")
+
+    def actualizar(self):
+        """Copia la base principal si cambió; la llama la tarea periódica"""
+        if not self.activa:
+            return
+        with self._lock, bloqueo(self.ruta):
+            inicio = time.time()
+            huella = self._huella_origen()
+            if huella == self._huella_copia() and os.path.exists(self.ruta):
+                # Nadie escribió desde la última copia, la hiciera este worker u otro
+                self.copiada_en = inicio
+                self._abrir(huella)
+                instrumentacion.registro.incrementar("replica_copias_total", (("resultado", "sin_cambios"),))
+                return
+
+            temporal = f"{self.ruta}.{os.getpid()}.tmp"
+            t = time.perf_counter()
+            origen = sqlite3.connect(engine.url.database)
+            destino = sqlite3.connect(temporal)
+            try:
+                origen.backup(destino)
+                # La copia hereda el modo WAL; immutable=1 necesita un archivo autocontenido
+                destino.execute("PRAGMA journal_mode=DELETE")
+            except Exception:
+                destino.close()
+                os.remove(temporal)
+                instrumentacion.registro.incrementar("replica_copias_total", (("resultado", "error"),))
+                raise
+            finally:
+                destino.close()
+                origen.close()
+            os.replace(temporal, self.ruta)
+            self._guardar_huella(huella)
+            instrumentacion.registro.observar("replica_copia_segundos", (), time.perf_counter() - t)
+            instrumentacion.registro.incrementar("replica_copias_total", (("resultado", "copiada"),))
+
+            self.copiada_en = inicio
+            self._abrir(huella)
+
+    def _abrir(self, huella):
+        """Apunta los motores a la copia en disco si no la usan ya"""
+        if self._motor is not None and huella == self._huella:
+            return
+        self._huella = huella
+        if self._motor is None:
+            self._crear_motores()
+        else:
+            # Las conexiones abiertas siguen viendo la copia anterior hasta devolverse
+            self._motor.dispose(close=False)
+            if self._motor_async is not None:
+                self._motor_async.sync_engine.dispose(close=False)
+
+    def _crear_motores(self):
+        url = f"sqlite:///file:{self.ruta}?immutable=1&uri=true"
+        self._motor = create_engine(url, connect_args={"check_same_thread": False})
+        instrumentacion.instrumentar_motor(self._motor)
+        self._sesiones = sessionmaker(autocommit=False, autoflush=False, bind=self._motor)
+        if AsyncSessionLocal is not None:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+            self._motor_async = create_async_engine(f"sqlite+aiosqlite:///file:{self.ruta}?immutable=1&uri=true")
+            instrumentacion.instrumentar_motor(self._motor_async.sync_engine)
+            self._sesiones_async = async_sessionmaker(self._motor_async, expire_on_commit=False, class_=AsyncSession)
+
+    def edad(self):
+        return None if self.copiada_en is None else time.time() - self.copiada_en
+
+    def elegir(self, request, asincrona: bool = False):
+        """Fábrica de sesiones a usar (réplica o principal); anota origen y edad en la petición"""
+        limite = self.frescura_maxima
+        pedido = request.headers.get("x-frescura-max-s")
+        if pedido:
+            try:
+                limite = min(limite, float(pedido))
+            except ValueError:
+                pass
+        edad = self.edad()
+        fabrica = self._sesiones_async if asincrona else self._sesiones
+        if edad is not None and edad <= limite and fabrica is not None:
+            request.state.datos_origen, request.state.datos_edad = "replica", edad
+        else:
+            fabrica = AsyncSessionLocal if asincrona else SessionLocal
+            request.state.datos_origen, request.state.datos_edad = "principal", 0.0
+        instrumentacion.registro.incrementar("replica_lecturas_total", (("origen", request.state.datos_origen),))
+        return fabrica
+
+    def resumen(self) -> dict:
+        edad = self.edad()
+        return {
+            "activa": self.activa,
+            "edad_s": round(edad, 1) if edad is not None else None,
+            "frescura_max_s": self.frescura_maxima,
+            "bytes": os.path.getsize(self.ruta) if self.activa and os.path.exists(self.ruta) else 0,
+        }
+
+
+replica = Replica()
+
+
+def get_db_lectura(request: Request):
+    """Como get_db, pero de la réplica si está al día"""
+    db = replica.elegir(request)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db_lectura(request: Request):
+    fabrica = replica.elegir(request, asincrona=True)
+    if fabrica is None:
+        raise RuntimeError("Motor asíncrono no disponible (instala aiosqlite o asyncpg)")
+    async with fabrica() as db:
+        yield db
@@ -0,0 +1,123 @@
+"""
+Compresión de respuestas y serialización JSON rápida.
+
+- MiddlewareCompresion comprime con brotli (si está instalado) o gzip según
+  Accept-Encoding, solo cuando el cuerpo supera COMPRESION_MINIMO_BYTES.
+  Reutiliza los "responders" de Starlette, así que las respuestas en
+  streaming se comprimen trozo a trozo y text/event-stream nunca se toca.
+- RespuestaRapida serializa con orjson (datetime, numpy y claves no string
+  incluidos) y, al devolverse directamente desde un endpoint, evita el paso
+  por jsonable_encoder. Sin orjson cae a json.dumps.
+"""
+import json
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MINIMO_BYTES = int(os.getenv("COMPRESION_MINIMO_BYTES", "1024"))
+NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "6"))
+CALIDAD_BROTLI = int(os.getenv("COMPRESION_CALIDAD_BROTLI", "4"))
+
+# Además de text/event-stream (que Starlette ya excluye): contenido ya comprimido
+TIPOS_EXCLUIDOS = ("application/gzip", "application/zip", "image/")
+
+
+# ============== SERIALIZACIÓN ==============
+
+def a_json(contenido, indentar: bool = False) -> bytes:
+    if orjson is not None:
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indentar:
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(contenido, default=str, option=opciones)
+    return json.dumps(contenido, default=str, ensure_ascii=False,
+                      indent=2 if indentar else None).encode("utf-8")
+
+
+class RespuestaRapida(JSONResponse):
+    """JSONResponse con orjson; devolverla tal cual para saltarse jsonable_encoder"""
+
+    def render(self, content) -> bytes:
+        return a_json(content)
+
+
+# ============== COMPRESIÓN ==============
+
+class _ExcluirComprimidos:
+    """Marca como excluidos los tipos de TIPOS_EXCLUIDOS al recibir la cabecera"""
+
+    async def send_with_compression(self, message):
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            tipo = Headers(raw=message["headers"]).get("content-type", "")
+            self.content_type_is_excluded |= tipo.startswith(TIPOS_EXCLUIDOS)
+
+
+class _Gzip(_ExcluirComprimidos, GZipResponder):
+    pass
+
+
+class _Brotli(_ExcluirComprimidos, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, calidad: int):
+        super().__init__(app, minimum_size)
+        self.compresor = brotli.Compressor(quality=calidad)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        datos = self.compresor.process(body)
+        return datos + (self.compresor.flush() if more_body else self.compresor.finish())
+
+
+def codificaciones_aceptadas(cabecera: str) -> set:
+    """Codificaciones de Accept-Encoding con q > 0"""
+    aceptadas = set()
+    for parte in cabecera.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                if float(parametros[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if nombre:
+            aceptadas.add(nombre)
+    return aceptadas
+
+
+class MiddlewareCompresion:
+    """Elige brotli > gzip > sin comprimir según lo que acepte el cliente"""
+
+    def __init__(self, app, minimo: int = MINIMO_BYTES, nivel_gzip: int = NIVEL_GZIP,
+                 calidad_brotli: int = CALIDAD_BROTLI):
+        self.app = app
+        self.minimo = minimo
+        self.nivel_gzip = nivel_gzip
+        self.calidad_brotli = calidad_brotli
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        aceptadas = codificaciones_aceptadas(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in aceptadas:
+            responder = _Brotli(self.app, self.minimo, self.calidad_brotli)
+        elif "gzip" in aceptadas:
+            responder = _Gzip(self.app, self.minimo, compresslevel=self.nivel_gzip)
+        else:
+            responder = IdentityResponder(self.app, self.minimo)
+        await responder(scope, receive, send)
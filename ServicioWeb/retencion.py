@@ -0,0 +1,302 @@
+"""
+Retención de eventos crudos (intentos_senal y errores_detallados).
+
+Los eventos más antiguos que RETENCION_DIAS se procesan por lotes:
+1. Se escriben en un archivo JSON Lines comprimido (gzip) dentro de
+   RETENCION_DIRECTORIO, un archivo por tabla y ejecución, que sigue
+   siendo exportable desde /admin/retencion/archivos. Cada lote queda como
+   .pendiente hasta que su borrado hace commit.
+2. En una sola transacción se acumulan en resumen_senal_sesion (una fila por
+   sesión y señal) y se borran de la tabla caliente.
+3. Entre lotes se duerme RETENCION_PAUSA_MS para no acaparar el escritor de
+   SQLite mientras llegan intentos en vivo.
+
+Con varios workers todos tienen la tarea periódica, pero un flock sobre
+RETENCION_DIRECTORIO/.retencion.lock hace que solo uno la ejecute a la vez;
+los demás la saltan.
+
+Al terminar se ejecuta ANALYZE y, si la base tiene auto_vacuum=INCREMENTAL,
+PRAGMA incremental_vacuum para devolver las páginas libres al sistema.
+"""
+import fcntl
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from database import SessionLocal, IntentoSenal, ErrorDetallado, ResumenSenalSesion, upsert
+
+DIAS = int(os.getenv("RETENCION_DIAS", "180"))
+TAMANO_LOTE = int(os.getenv("RETENCION_LOTE", "2000"))
+PAUSA = float(os.getenv("RETENCION_PAUSA_MS", "200")) / 1000
+DIRECTORIO = os.getenv("RETENCION_DIRECTORIO", "archivo")
+
+TABLAS = {"intentos_senal": IntentoSenal, "errores_detallados": ErrorDetallado}
+COLUMNAS_INTENTO = ("id", "sesion_id", "secuencia", "timestamp", "nombre_senal", "respuesta_usuario",
+                    "fue_correcta", "tiempo_respuesta", "zona", "ronda", "dificultad")
+COLUMNAS_ERROR = ("id", "sesion_id", "secuencia", "timestamp", "nombre_senal", "respuesta_usuario", "tipo_error",
+                  "tiempo_respuesta", "zona", "dificultad", "intentos_previos", "feedback_generado")
+
+
+def _fila(objeto, columnas) -> dict:
+    fila = {c: getattr(objeto, c) for c in columnas}
+    if fila["timestamp"] is not None:
+        fila["timestamp"] = fila["timestamp"].isoformat()
+    return fila
+
+
+class _Archivo:
+    """Archivo .jsonl.gz de una tabla para una ejecución (se crea al primer lote).
+
+    Cada lote se escribe primero en <ruta>.<tamaño>.pendiente y solo pasa al
+    archivo después del commit del borrado: un lote que falla no queda
+    archivado dos veces. <tamaño> es lo que medía el archivo antes del lote, así
+    que repetir la publicación tras una caída no duplica nada.
+    """
+
+    def __init__(self, directorio: str, tabla: str, sello: str):
+        self.ruta = os.path.join(directorio, f"{tabla}_{sello}.jsonl.gz")
+        self._pendiente = None
+
+    def escribir(self, filas: list):
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        tamano = os.path.getsize(self.ruta) if os.path.exists(self.ruta) else 0
+        self._pendiente = f"{self.ruta}.{tamano}.pendiente"
+        # Un miembro gzip por lote: si el proceso muere a mitad, los anteriores siguen legibles
+        datos = "".join(json.dumps(f, ensure_ascii=False) + "\n" for f in filas).encode("utf-8")
+        with open(self._pendiente, "wb") as f:
+            f.write(gzip.compress(datos))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def confirmar(self):
+        """Tras el commit: el lote pendiente pasa al archivo"""
+        if self._pendiente is not None:
+            _publicar(self._pendiente)
+            self._pendiente = None
+
+    def descartar(self):
+        """Tras un rollback: el lote sigue en la base y no se archiva"""
+        if self._pendiente is not None:
+            os.remove(self._pendiente)
+            self._pendiente = None
+
+
+def _publicar(pendiente: str):
+    """Añade un lote pendiente a su archivo (idempotente) y lo borra"""
+    ruta, tamano, _ = pendiente.rsplit(".", 2)
+    with open(pendiente, "rb") as f:
+        datos = f.read()
+    with open(ruta, "ab") as f:
+        f.truncate(int(tamano))
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(pendiente)
+
+
+def _ids_pendiente(pendiente: str) -> list:
+    with gzip.open(pendiente, "rt", encoding="utf-8") as f:
+        return [json.loads(linea)["id"] for linea in f if linea.strip()]
+
+
+class Retencion:
+    """Archiva, resume y borra eventos crudos antiguos"""
+
+    def __init__(self, dias: int = DIAS, tamano_lote: int = TAMANO_LOTE,
+                 pausa: float = PAUSA, directorio: str = DIRECTORIO):
+        self.dias = dias
+        self.tamano_lote = tamano_lote
+        self.pausa = pausa
+        self.directorio = directorio
+        self.ultima_ejecucion = None
+        self._lock = threading.Lock()  # una sola ejecución a la vez en este proceso
+
+    @property
+    def en_curso(self) -> bool:
+        return self._lock.locked()
+
+    def ejecutar(self, detener: threading.Event = None) -> dict:
+        """Procesa todos los eventos anteriores al corte; devuelve un resumen de la ejecución"""
+        if not self._lock.acquire(blocking=False):
+            return {"mensaje": "Ya hay una ejecución en curso"}
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            with open(os.path.join(self.directorio, ".retencion.lock"), "a") as cerrojo:
+                try:
+                    fcntl.flock(cerrojo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return {"mensaje": "Ya hay una ejecución en curso en otro proceso"}
+                # El flock se libera al cerrar el archivo
+                return self._ejecutar(detener)
+        finally:
+            self._lock.release()
+
+    def _ejecutar(self, detener) -> dict:
+        inicio = time.time()
+        corte = datetime.utcnow() - timedelta(days=self.dias)
+        sello = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+
+        resultado = {"corte": corte.isoformat()}
+        self._recuperar_pendientes()
+        resultado["intentos_archivados"] = self._procesar(
+            IntentoSenal, COLUMNAS_INTENTO, corte, _Archivo(self.directorio, "intentos_senal", sello), detener)
+        resultado["errores_archivados"] = self._procesar(
+            ErrorDetallado, COLUMNAS_ERROR, corte, _Archivo(self.directorio, "errores_detallados", sello), detener)
+        if resultado["intentos_archivados"] or resultado["errores_archivados"]:
+            resultado["paginas_liberadas"] = self._mantenimiento()
+        resultado["duracion_segundos"] = round(time.time() - inicio, 2)
+        self.ultima_ejecucion = resultado
+        return resultado
+
+    def _procesar(self, modelo, columnas, corte: datetime, archivo: _Archivo, detener) -> int:
+        total = 0
+        ultimo_id = 0
+        while detener is None or not detener.is_set():
+            db = SessionLocal()
+            try:
+                lote = db.query(modelo).filter(
+                    modelo.timestamp < corte, modelo.id > ultimo_id
+                ).order_by(modelo.id).limit(self.tamano_lote).all()
+                if not lote:
+                    break
+
+                # Primero al pendiente (con fsync), después el borrado y, con el commit hecho,
+                # al archivo: nunca se pierde ni se duplica un evento
+                ids = [e.id for e in lote]
+                archivo.escribir([_fila(e, columnas) for e in lote])
+                self._acumular_resumen(db, modelo, lote)
+                db.query(modelo).filter(modelo.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+                cantidad, ultimo_id = len(ids), ids[-1]
+            except Exception:
+                db.rollback()
+                archivo.descartar()
+                raise
+            finally:
+                db.close()
+            archivo.confirmar()
+
+            total += cantidad
+            if cantidad < self.tamano_lote:
+                break
+            time.sleep(self.pausa)
+        return total
+
+    def _recuperar_pendientes(self):
+        """Lotes de una ejecución que murió entre el fsync y la publicación:
+        si sus filas ya no están en la base el borrado se confirmó y se publican;
+        si siguen, el lote no se aplicó y se descarta"""
+        for nombre in sorted(os.listdir(self.directorio)):
+            if not nombre.endswith(".pendiente"):
+                continue
+            pendiente = os.path.join(self.directorio, nombre)
+            modelo = next((m for tabla, m in TABLAS.items() if nombre.startswith(tabla + "_")), None)
+            ids = _ids_pendiente(pendiente) if modelo is not None else []
+            db = SessionLocal()
+            try:
+                quedan = bool(ids) and db.query(modelo.id).filter(modelo.id.in_(ids)).first() is not None
+            finally:
+                db.close()
+            if ids and not quedan:
+                print(f"[retencion] lote pendiente publicado: {nombre}")
+                _publicar(pendiente)
+            else:
+                print(f"[retencion] lote no confirmado descartado: {nombre}")
+                os.remove(pendiente)
+
+    @staticmethod
+    def _acumular_resumen(db, modelo, lote: list):
+        """Suma el lote a resumen_senal_sesion dentro de la transacción del borrado"""
+        parciales = {}
+        for e in lote:
+            clave = (e.sesion_id, e.nombre_senal)
+            r = parciales.get(clave)
+            if r is None:
+                r = parciales[clave] = {
+                    "intentos": 0, "aciertos": 0, "errores": 0, "tiempo_total": 0.0,
+                    "tiempo_minimo": None, "tiempo_maximo": None, "errores_detallados": 0,
+                    "primer_evento": e.timestamp, "ultimo_evento": e.timestamp,
+                }
+            if modelo is IntentoSenal:
+                r["intentos"] += 1
+                r["aciertos" if e.fue_correcta else "errores"] += 1
+                r["tiempo_total"] += e.tiempo_respuesta
+                r["tiempo_minimo"] = _min(r["tiempo_minimo"], e.tiempo_respuesta)
+                r["tiempo_maximo"] = _max(r["tiempo_maximo"], e.tiempo_respuesta)
+            else:
+                r["errores_detallados"] += 1
+            r["primer_evento"] = _min(r["primer_evento"], e.timestamp)
+            r["ultimo_evento"] = _max(r["ultimo_evento"], e.timestamp)
+
+        # Solo este trabajo escribe resúmenes y el flock deja una ejecución
+        # entre todos los procesos, así que leer y sumar es seguro
+        sesiones = {s for s, _ in parciales}
+        existentes = db.query(ResumenSenalSesion).filter(ResumenSenalSesion.sesion_id.in_(sesiones)).all()
+        for existente in existentes:
+            r = parciales.get((existente.sesion_id, existente.nombre_senal))
+            if r is None:
+                continue
+            for campo in ("intentos", "aciertos", "errores", "tiempo_total", "errores_detallados"):
+                r[campo] += getattr(existente, campo) or 0
+            for campo, combinar in (("tiempo_minimo", _min), ("tiempo_maximo", _max), ("primer_evento", _min)):
+                r[campo] = combinar(r[campo], getattr(existente, campo))
+            r["ultimo_evento"] = _max(r["ultimo_evento"], existente.ultimo_evento)
+
+        upsert(db, ResumenSenalSesion, [
+            {"sesion_id": s, "nombre_senal": n, **r} for (s, n), r in parciales.items()
+        ], ["sesion_id", "nombre_senal"])
+
+    @staticmethod
+    def _mantenimiento() -> int:
+        """ANALYZE y, en SQLite con auto_vacuum=INCREMENTAL, incremental_vacuum"""
+        from database import engine
+
+        liberadas = 0
+        with engine.connect() as conexion:
+            if engine.dialect.name == "sqlite":
+                if conexion.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+                    libres = conexion.execute(text("PRAGMA freelist_count")).scalar()
+                    # Cada paso del PRAGMA libera una sola página y execute() solo da
+                    # uno; executescript lo ejecuta hasta el final
+                    conexion.commit()
+                    conexion.connection.dbapi_connection.executescript("PRAGMA incremental_vacuum")
+                    liberadas = libres - conexion.execute(text("PRAGMA freelist_count")).scalar()
+                conexion.execute(text("ANALYZE"))
+            else:
+                conexion.execute(text("ANALYZE intentos_senal"))
+                conexion.execute(text("ANALYZE errores_detallados"))
+            conexion.commit()
+        return liberadas
+
+    # ---------- Archivos ----------
+
+    def archivos(self) -> list:
+        if not os.path.isdir(self.directorio):
+            return []
+        return [{
+            "nombre": nombre,
+            "bytes": os.path.getsize(os.path.join(self.directorio, nombre)),
+        } for nombre in sorted(os.listdir(self.directorio)) if nombre.endswith(".jsonl.gz")]
+
+    def ruta_archivo(self, nombre: str):
+        """Ruta de un archivo del directorio de retención (None si no existe o el nombre no es válido)"""
+        if os.path.basename(nombre) != nombre or not nombre.endswith(".jsonl.gz"):
+            return None
+        ruta = os.path.join(self.directorio, nombre)
+        return ruta if os.path.isfile(ruta) else None
+
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+retencion = Retencion()
@@ -1,7 +1,8 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import FileResponse, PlainTextResponse, Response, JSONResponse, StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, List
 import joblib
 import numpy as np
@@ -11,16 +12,48 @@ from datetime import datetime
 import json
 import csv
 import io
+import threading
+import asyncio
+import time
+import hmac
+import random
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
 from fastapi.staticfiles import StaticFiles
 
 # Importar módulo de base de datos
 from database import (
-    get_db, init_db, SessionLocal,
+    get_db, get_async_db, init_db, insertar_en_bloque, engine, async_engine, SessionLocal,
+    consulta_secuencias, separar_duplicados, buscar_estudiantes,
     Estudiante, Sesion, IntentoSenal, ErrorDetallado, 
-    AjusteDificultad, ConfiguracionEvaluacion
+    AjusteDificultad, ConfiguracionEvaluacion, ResumenSenalSesion
 )
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, case, union
+from sqlalchemy.exc import IntegrityError
+from escritor import ClienteEscritor
+from maestria import maestria
+from planificador import planificador
+from confusion import confusion
+from cuantiles import tiempos, ALFA as PRECISION_CUANTILES
+from simbolos import codigos, TablaLlena
+import importacion
+import instrumentacion
+from instrumentacion import medir
+import perfilado
+import admision
+from circuito import Circuito
+from difusion import difusor
+from replica import replica, get_db_lectura, get_async_db_lectura, INTERVALO as REPLICA_INTERVALO
+from bitacora import bitacora, como_fila, EV_INTENTO, EV_ERROR, EV_AJUSTE, EV_SESION_INICIO, EV_SESION_FIN
+from sesiones_activas import sesiones_activas, SesionActiva
+from retencion import retencion
+import formato_binario
+import modelo_portatil
+from canal_ws import ConexionVisor, conexiones
+from respuestas import MiddlewareCompresion, RespuestaRapida, a_json
 
 # Cargar variables de entorno
 load_dotenv()
@@ -31,7 +64,104 @@ app = FastAPI(
     version="2.0.0"
 )
 
-# CORS para Unity y Web
+# Compresión brotli/gzip de las respuestas grandes (umbral COMPRESION_MINIMO_BYTES)
+app.add_middleware(MiddlewareCompresion)
+
+# Métricas de latencia por ruta, tiempos de BD/modelo/LLM y cabecera Server-Timing
+instrumentacion.instrumentar_motor(engine)
+if async_engine is not None:
+    instrumentacion.instrumentar_motor(async_engine.sync_engine)
+
+# Límite de tasa por cliente/sesión y admisión por prioridad (ver admision.py).
+# Se declara antes que medir_peticion para que los rechazos también se midan.
+@app.middleware("http")
+async def controlar_admision(request: Request, call_next):
+    clase = admision.clasificar(request.method, request.url.path)
+    if clase is None:
+        return await call_next(request)
+    
+    claves = [admision.clave_cliente(request)]
+    sesion = admision.clave_sesion(request)
+    if sesion:
+        claves.append(sesion)
+    espera = admision.limitador.consumir(clase, claves)
+    if espera:
+        instrumentacion.registro.incrementar("admision_rechazos_total", (("clase", clase), ("motivo", "tasa")))
+        return JSONResponse(status_code=429, content={"detail": f"Demasiadas peticiones ({clase})"},
+                            headers={"Retry-After": admision.reintento(espera)})
+    
+    if not await admision.control.entrar(clase):
+        instrumentacion.registro.incrementar("admision_rechazos_total", (("clase", clase), ("motivo", "sobrecarga")))
+        return JSONResponse(status_code=429 if clase == "analitica" else 503,
+                            content={"detail": "Servicio saturado, reintente más tarde"},
+                            headers={"Retry-After": str(admision.REINTENTO_SOBRECARGA)})
+    try:
+        return await call_next(request)
+    finally:
+        admision.control.salir()
+
+@app.middleware("http")
+async def medir_peticion(request: Request, call_next):
+    registro = instrumentacion.registro
+    tiempos = {}
+    token = instrumentacion.tiempos_peticion.set(tiempos)
+    registro.incrementar("http_peticiones_en_curso")
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        response = await call_next(request)
+        estado = response.status_code
+        response.headers["Server-Timing"] = instrumentacion.server_timing(time.perf_counter() - inicio, tiempos)
+        return response
+    finally:
+        duracion = time.perf_counter() - inicio
+        ruta = request.scope.get("route")
+        ruta = ruta.path if ruta is not None else "sin_ruta"
+        registro.incrementar("http_peticiones_en_curso", valor=-1)
+        registro.incrementar("http_peticiones_total", (("ruta", ruta), ("metodo", request.method), ("estado", estado)))
+        registro.observar("http_duracion_segundos", (("ruta", ruta), ("metodo", request.method)), duracion)
+        instrumentacion.tiempos_peticion.reset(token)
+
+@app.middleware("http")
+async def informar_frescura(request: Request, call_next):
+    """Endpoints de lectura: de dónde salieron los datos y qué edad tienen (ver replica.py)"""
+    response = await call_next(request)
+    origen = getattr(request.state, "datos_origen", None)
+    if origen is not None:
+        response.headers["X-Datos-Origen"] = origen
+        response.headers["X-Datos-Edad-S"] = f"{request.state.datos_edad:.1f}"
+    return response
+
+# Diagnóstico en vivo: consultas lentas y perfil por petición (cabecera X-Perfil)
+perfilado.consultas_lentas.instrumentar(engine)
+if async_engine is not None:
+    perfilado.consultas_lentas.instrumentar(async_engine.sync_engine)
+
+def es_admin(token: Optional[str]) -> bool:
+    """Las herramientas de administración solo se habilitan si ADMIN_TOKEN está definido"""
+    esperado = os.getenv("ADMIN_TOKEN")
+    return bool(esperado and token and hmac.compare_digest(token, esperado))
+
+def requerir_admin(x_admin_token: Optional[str] = Header(None)):
+    if not es_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Acceso restringido a administradores")
+
+@app.middleware("http")
+async def perfil_por_peticion(request: Request, call_next):
+    if request.headers.get("x-perfil") != "1" or not es_admin(request.headers.get("x-admin-token")):
+        return await call_next(request)
+    
+    muestreador = perfilado.Muestreador(intervalo=0.001)
+    muestreador.iniciar()
+    try:
+        response = await call_next(request)
+    finally:
+        collapsed = muestreador.detener()
+    response.headers["X-Perfil-Id"] = perfilado.perfiles_recientes.guardar(collapsed)
+    return response
+
+# CORS para Unity y Web. Se registra al final para que sea el middleware más
+# externo: así también llevan cabeceras CORS los 429/503 de la admisión
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -40,20 +170,249 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tareas en segundo plano (hilos daemon que se detienen al apagar)
+_detener_tareas = threading.Event()
+
+def iniciar_tarea_periodica(nombre: str, intervalo: float, funcion):
+    """Ejecuta 'funcion' cada 'intervalo' segundos en un hilo aparte"""
+    def bucle():
+        while not _detener_tareas.wait(intervalo):
+            try:
+                funcion()
+            except Exception as e:
+                print(f"[{nombre}] Error: {e}")
+    
+    threading.Thread(target=bucle, name=nombre, daemon=True).start()
+
+def guardar_maestria():
+    db = SessionLocal()
+    try:
+        maestria.guardar(db)
+    finally:
+        db.close()
+
+def guardar_confusion():
+    if confusion.cambios:
+        confusion.guardar_parte()
+
+def guardar_cuantiles():
+    if tiempos.cambios:
+        tiempos.guardar_parte()
+
+def aplicar_retencion():
+    resultado = retencion.ejecutar(_detener_tareas)
+    if resultado.get("intentos_archivados") or resultado.get("errores_archivados"):
+        print(f"[retencion] {resultado}")
+
 # Inicializar base de datos al arrancar
 @app.on_event("startup")
 def startup_event():
     init_db()
     print("Base de datos inicializada")
+    bitacora.abrir()
+    
+    db = SessionLocal()
+    try:
+        maestria.cargar(db)
+    finally:
+        db.close()
+    for celda in maestria.celdas():
+        planificador.sembrar(*celda)
+    
+    def reconstruir_confusion():
+        db = SessionLocal()
+        try:
+            confusion.reconstruir(db)
+        finally:
+            db.close()
+        print("Matriz de confusión reconstruida desde intentos_senal")
+    confusion.cargar_snapshot(reconstruir=reconstruir_confusion)
+    
+    def reconstruir_cuantiles():
+        db = SessionLocal()
+        try:
+            tiempos.reconstruir(db)
+        finally:
+            db.close()
+        print("Percentiles de tiempo reconstruidos desde intentos_senal")
+    tiempos.cargar_snapshot(reconstruir=reconstruir_cuantiles)
+    
+    iniciar_tarea_periodica("maestria", float(os.getenv("MAESTRIA_INTERVALO_GUARDADO", "10")), guardar_maestria)
+    iniciar_tarea_periodica("confusion", float(os.getenv("CONFUSION_INTERVALO_SNAPSHOT", "60")), guardar_confusion)
+    iniciar_tarea_periodica("cuantiles", float(os.getenv("CUANTILES_INTERVALO_SNAPSHOT", "60")), guardar_cuantiles)
+    if os.getenv("RETENCION_INTERVALO", "86400") != "0":
+        iniciar_tarea_periodica("retencion", float(os.getenv("RETENCION_INTERVALO", "86400")), aplicar_retencion)
+    iniciar_tarea_periodica("sesiones", 60, sesiones_activas.purgar)
+    if escritor.activo:
+        difusor.conectar(escritor)
+    if replica.activa:
+        replica.actualizar()
+        iniciar_tarea_periodica("replica", REPLICA_INTERVALO, replica.actualizar)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    _detener_tareas.set()
+    guardar_maestria()
+    guardar_confusion()
+    guardar_cuantiles()
+    ia_client.guardar_pregenerado()
+    bitacora.cerrar()
 
 # Cargar modelo al iniciar
+# En modo multi-worker se usa el bosque aplanado en memoria compartida
+# (ver modelo_compartido.py) para no tener una copia por proceso
 try:
-    model = joblib.load("modelo_dificultad.pkl")
-    print("Modelo de dificultad cargado correctamente.")
+    if os.getenv("MODELO_PLANO_DIR"):
+        from modelo_compartido import BosquePlano
+        model = BosquePlano.cargar(os.environ["MODELO_PLANO_DIR"])
+        print("Modelo de dificultad (memoria compartida) cargado correctamente.")
+    else:
+        model = joblib.load("modelo_dificultad.pkl")
+        print("Modelo de dificultad cargado correctamente.")
 except Exception as e:
     model = None
     print(f"Advertencia: No se pudo cargar 'modelo_dificultad.pkl': {e}")
 
+# Cliente del proceso escritor (solo activo en modo multi-worker)
+escritor = ClienteEscritor()
+
+
+def guardar_registro(modelo, datos: dict, db: Session) -> tuple:
+    """Inserta una fila de métricas directamente o a través del escritor único.
+    Devuelve (id, duplicado); el escritor marca los reintentos de una secuencia ya guardada"""
+    if escritor.activo:
+        return escritor.insertar(modelo.__tablename__, datos)
+    
+    nuevo = modelo(**datos)
+    db.add(nuevo)
+    db.commit()
+    return nuevo.id, False
+
+
+def guardar_con_secuencia(modelo, datos: dict, db: Session, evento: tuple = None) -> tuple:
+    """Como guardar_registro, pero un reintento con la misma (sesion_id, secuencia)
+    devuelve el ID original en lugar de duplicar la fila. Devuelve (id, duplicado).
+    'evento' (tipo, datos) se anota en la bitácora antes de guardar una fila nueva"""
+    def existente():
+        if datos.get("secuencia") is None:
+            return None
+        return db.execute(consulta_secuencias(modelo, [datos])).first()
+    
+    fila = existente()
+    if fila is not None:
+        return fila.id, True
+    ids = anotar_antes([evento]) if evento is not None else []
+    try:
+        with resultado_anotado(ids):
+            return guardar_registro(modelo, datos, db)
+    except IntegrityError:
+        # Otro reintento llegó entre la consulta y el INSERT
+        db.rollback()
+        fila = existente()
+        if fila is None:
+            raise
+        return fila.id, True
+
+
+def buscar_sesion_activa(db: Session, sesion_id: int):
+    """Sesión del registro en memoria; solo en un fallo se lee la BD (None si no existe)"""
+    sesion = sesiones_activas.obtener(sesion_id)
+    if sesion is not None:
+        return sesion
+    fila = db.query(Sesion.estudiante_id, Sesion.dificultad_inicial, Sesion.completada).filter(
+        Sesion.id == sesion_id
+    ).first()
+    if fila is None:
+        return None
+    if fila.completada:
+        # Ya finalizada: se acepta el evento, pero no vuelve al registro
+        return SesionActiva(sesion_id, fila.estudiante_id, fila.dificultad_inicial)
+    return sesiones_activas.abrir(sesion_id, fila.estudiante_id, fila.dificultad_inicial)
+
+
+def evento_bitacora(tipo: int, evento, estudiante_id: int = None) -> tuple:
+    """(tipo, datos) de un evento de ingesta para la bitácora"""
+    datos = evento.model_dump()
+    if estudiante_id is not None:
+        datos["estudiante_id"] = estudiante_id
+    return tipo, datos
+
+
+def anotar_antes(eventos: list) -> list:
+    """Registro previo: anota [(tipo, datos)] en la bitácora y espera su fsync.
+    Se llama antes de escribir en la BD, así toda fila guardada está en la bitácora.
+    Devuelve los evento_id, que resultado_anotado() marca con el resultado de la BD"""
+    if not bitacora.abierta or not eventos:
+        return []
+    ids, posicion = [], 0
+    for tipo, datos in eventos:
+        datos["evento_id"] = bitacora.nuevo_id()
+        ids.append(datos["evento_id"])
+        posicion = bitacora.anotar(tipo, datos)
+    try:
+        bitacora.confirmar(posicion)
+    except RuntimeError:
+        bitacora.resolver(ids, aplicados=False)
+        raise
+    return ids
+
+
+@contextmanager
+def resultado_anotado(ids: list):
+    """Marca los eventos como confirmados si el bloque (la escritura en BD) termina
+    bien y como anulados si falla. Una conexión perdida con el escritor o una
+    cancelación no se marcan: no se sabe si hubo commit (quedan en duda)"""
+    try:
+        yield
+    except OSError:
+        raise
+    except Exception:
+        bitacora.resolver(ids, aplicados=False)
+        raise
+    bitacora.resolver(ids, aplicados=True)
+
+
+def aplicar_intento(estudiante_id: int, intento):
+    """Actualiza los almacenes en memoria con un intento ya guardado y lo difunde al panel"""
+    maestria.registrar(estudiante_id, intento.nombre_senal, intento.fue_correcta, intento.tiempo_respuesta)
+    planificador.registrar_intento(estudiante_id, intento.nombre_senal, intento.fue_correcta)
+    confusion.registrar(intento.nombre_senal, intento.respuesta_usuario, intento.fue_correcta,
+                        intento.dificultad, intento.zona)
+    tiempos.registrar(estudiante_id, intento.nombre_senal, intento.zona, intento.dificultad,
+                      intento.tiempo_respuesta)
+    sesiones_activas.registrar_intento(intento)
+    difusor.publicar("intentos", {
+        "sesion_id": intento.sesion_id,
+        "estudiante_id": estudiante_id,
+        "senal": intento.nombre_senal,
+        "correcta": intento.fue_correcta,
+        "tiempo": intento.tiempo_respuesta,
+        "zona": intento.zona
+    })
+
+
+def aplicar_error(estudiante_id: int, error):
+    planificador.registrar_confusion(estudiante_id, error.nombre_senal)
+    sesiones_activas.registrar_evento(error.sesion_id, zona=error.zona, dificultad=error.dificultad)
+    difusor.publicar("errores", {
+        "sesion_id": error.sesion_id,
+        "senal": error.nombre_senal,
+        "tipo_error": error.tipo_error
+    })
+
+
+def aplicar_ajuste(ajuste):
+    sesiones_activas.registrar_evento(ajuste.sesion_id, zona=ajuste.zona, ronda=ajuste.ronda,
+                                      dificultad=ajuste.dificultad_nueva)
+    difusor.publicar("ajustes", {
+        "sesion_id": ajuste.sesion_id,
+        "de": ajuste.dificultad_anterior,
+        "a": ajuste.dificultad_nueva,
+        "motivo": ajuste.motivo,
+        "zona": ajuste.zona,
+        "ronda": ajuste.ronda
+    })
+
 
 # ============== MODELOS PYDANTIC ==============
 
@@ -86,6 +445,7 @@ class FeedbackResponse(BaseModel):
     mnemotecnia: str
     mensaje_completo: str
     error_message: Optional[str] = None
+    origen: Optional[str] = None  # proveedor, cache, pregenerado o fallback
 
 # ===== NUEVOS MODELOS PARA MÉTRICAS =====
 
@@ -122,6 +482,7 @@ class IntentoCreate(BaseModel):
     zona: int = 0
     ronda: int = 0
     dificultad: int = 0
+    secuencia: Optional[int] = Field(default=None, ge=0)  # por sesión, para deduplicar reintentos
 
 class ErrorCreate(BaseModel):
     sesion_id: int
@@ -133,6 +494,24 @@ class ErrorCreate(BaseModel):
     dificultad: int = 0
     intentos_previos: int = 0
     feedback_generado: Optional[str] = None
+    secuencia: Optional[int] = Field(default=None, ge=0)
+
+class LoteIntentos(BaseModel):
+    intentos: List[IntentoCreate]
+
+class LoteErrores(BaseModel):
+    errores: List[ErrorCreate]
+
+class BloqueRespaldo(BaseModel):
+    """Trozo de un respaldo offline; todos los eventos llevan número de secuencia"""
+    intentos: List[IntentoCreate] = []
+    errores: List[ErrorCreate] = []
+
+MAX_SIMBOLOS_POR_REGISTRO = int(os.getenv("SIMBOLOS_MAX_POR_REGISTRO", "64"))
+MAX_NOMBRE_SIMBOLO = 100
+
+class RegistroSimbolos(BaseModel):
+    nombres: List[str] = Field(..., max_length=MAX_SIMBOLOS_POR_REGISTRO)
 
 class AjusteCreate(BaseModel):
     sesion_id: int
@@ -189,21 +568,117 @@ class MetricasSesionDetalladas(BaseModel):
 
 # ============== CLIENTE DE IA ==============
 
+instrumentacion.registro.describir("llm_feedback_total", "counter", "Feedback servido por origen")
+
 class IAClient:
-    """Cliente para comunicarse con Google Gemini"""
+    """Cliente para comunicarse con Google Gemini
+    
+    Las llamadas pasan por un interruptor de circuito (circuito.py). Si el
+    proveedor falla, tarda más de LLM_TIMEOUT_S o el circuito está abierto,
+    se responde al instante con, por orden de preferencia: el feedback ya
+    generado para la misma señal y respuesta, el último generado (o
+    pregenerado) para la señal, o el fallback genérico."""
     
     def __init__(self):
+        self.provider = os.getenv("AI_PROVIDER", "google")  # "google" o "stub" (pruebas/benchmarks)
         self.model = os.getenv("AI_MODEL", "gemini-1.5-flash")
         self.api_key = os.getenv("GOOGLE_API_KEY")
+        self.stub_latencia = float(os.getenv("AI_STUB_LATENCIA", "0.05"))
+        self.stub_tasa_error = float(os.getenv("AI_STUB_TASA_ERROR", "0"))
+        self.timeout = float(os.getenv("LLM_TIMEOUT_S", "10"))
+        self.circuito = Circuito("llm", "LLM_CIRCUITO")
+        
+        # Feedback bueno ya generado: por (señal, respuesta) con tope LRU, y el último por señal
+        self.cache_maximo = int(os.getenv("LLM_CACHE_MAX", "500"))
+        self._cache = OrderedDict()
+        self._por_senal = {}
+        self.ruta_pregenerado = os.getenv("FEEDBACK_PREGENERADO", "feedback_pregenerado.json")
+        self._cargar_pregenerado()
         
     async def generar_feedback(self, request: FeedbackRequest) -> FeedbackResponse:
+        if not self.circuito.permitir():
+            return self._respaldo(request, "Servicio de IA en pausa tras fallos recientes.")
+        
         prompt = self._construir_prompt(request)
+        inicio = time.perf_counter()
+        try:
+            with medir("llm"):
+                if self.provider == "stub":
+                    llamada = self._llamar_stub(prompt, request)
+                else:
+                    llamada = self._llamar_google(prompt, request)
+                respuesta = await asyncio.wait_for(llamada, self.timeout)
+        except asyncio.CancelledError:
+            # Se canceló la petición, no falló el proveedor; la sonda queda libre
+            self.circuito.liberar()
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            self.circuito.registrar(False, time.perf_counter() - inicio, error)
+            print(f"Error al llamar a IA: {error}")
+            return self._respaldo(request, "Servicio de IA no disponible.")
         
+        self.circuito.registrar(True, time.perf_counter() - inicio)
+        respuesta.origen = "proveedor"
+        self._recordar(request, respuesta)
+        instrumentacion.registro.incrementar("llm_feedback_total", (("origen", "proveedor"),))
+        return respuesta
+    
+    def _respaldo(self, request: FeedbackRequest, motivo: str) -> FeedbackResponse:
+        """Feedback sin llamar al proveedor"""
+        respuesta = self._cache.get((request.nombre_senal, request.respuesta_usuario))
+        if respuesta is not None:
+            respuesta = respuesta.model_copy(update={"origen": "cache"})
+        else:
+            fallback = self._generar_fallback(request)
+            base = self._por_senal.get(request.nombre_senal)
+            if base is not None:
+                # Significado, ejemplo y mnemotecnia son de la señal; el motivo depende de la respuesta
+                respuesta = base.model_copy(update={"motivo_error": fallback.motivo_error})
+            else:
+                respuesta = fallback.model_copy(update={"error_message": motivo, "origen": "fallback"})
+        instrumentacion.registro.incrementar("llm_feedback_total", (("origen", respuesta.origen),))
+        return respuesta
+    
+    def _recordar(self, request: FeedbackRequest, respuesta: FeedbackResponse):
+        clave = (request.nombre_senal, request.respuesta_usuario)
+        self._cache[clave] = respuesta
+        self._cache.move_to_end(clave)
+        if len(self._cache) > self.cache_maximo:
+            self._cache.popitem(last=False)
+        self._por_senal[request.nombre_senal] = respuesta.model_copy(update={"origen": "pregenerado"})
+    
+    def _cargar_pregenerado(self):
+        """Feedback por señal guardado en ejecuciones anteriores (o escrito a mano)"""
+        if not os.path.exists(self.ruta_pregenerado):
+            return
         try:
-            return await self._llamar_google(prompt, request)
+            with open(self.ruta_pregenerado, encoding="utf-8") as f:
+                for senal, campos in json.load(f).items():
+                    self._por_senal[senal] = FeedbackResponse(
+                        success=True,
+                        significado=campos.get("significado", ""),
+                        motivo_error=campos.get("motivo_error", ""),
+                        ejemplo_real=campos.get("ejemplo_real", ""),
+                        mnemotecnia=campos.get("mnemotecnia", ""),
+                        mensaje_completo=f"{campos.get('significado', '')} {campos.get('mnemotecnia', '')}",
+                        origen="pregenerado"
+                    )
+            print(f"Feedback pregenerado cargado para {len(self._por_senal)} señales")
         except Exception as e:
-            print(f"Error al llamar a IA: {e}")
-            return self._generar_fallback(request)
+            print(f"Advertencia: no se pudo leer {self.ruta_pregenerado}: {e}")
+    
+    def guardar_pregenerado(self):
+        if not self._por_senal:
+            return
+        datos = {
+            senal: r.model_dump(include={"significado", "ejemplo_real", "mnemotecnia"})
+            for senal, r in self._por_senal.items()
+        }
+        temporal = self.ruta_pregenerado + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, self.ruta_pregenerado)
     
     def _construir_prompt(self, request: FeedbackRequest) -> str:
         fue_tiempo_agotado = request.respuesta_usuario == "Tiempo agotado"
@@ -222,7 +697,7 @@ class IAClient:
 CONTEXTO DEL ERROR:
 {contexto_error}
 - Nivel de dificultad: {['Bajo', 'Medio', 'Alto'][min(request.nivel_dificultad, 2)]}
-- Intentos previos con esta señal: {request.intentos_previos}
+- Intentos previos con esta señal: {request.intentos_previos}{self._contexto_confusiones(request.nombre_senal)}
 
 INSTRUCCIONES:
 Genera una respuesta educativa y motivadora con EXACTAMENTE estos 4 elementos (mantenlos breves, máximo 2 oraciones cada uno):
@@ -243,47 +718,66 @@ Responde ÚNICAMENTE en formato JSON con esta estructura exacta:
     "mnemotecnia": "..."
 }}"""
 
+    def _contexto_confusiones(self, nombre_senal: str) -> str:
+        """Confusiones más frecuentes de todos los estudiantes con esta señal"""
+        fila = confusion.fila_normalizada(nombre_senal)["respuestas"]
+        frecuentes = [f"'{r}' ({p:.0%})" for r, p in fila.items() if r != nombre_senal][:3]
+        if not frecuentes:
+            return ""
+        return f"\n- Confusiones frecuentes de otros estudiantes con esta señal: {', '.join(frecuentes)}"
+
     async def _llamar_google(self, prompt: str, request: FeedbackRequest) -> FeedbackResponse:
-        try:
-            import google.genai as genai
-            import json
-            
-            if not self.api_key:
-                raise Exception("GOOGLE_API_KEY no encontrada")
-
-            client = genai.Client(api_key=self.api_key)
-            model_name = self.model if self.model else 'gemini-2.0-flash'
-            
-            response = client.models.generate_content(
-                model=model_name,
-                contents=prompt
-            )
-            
-            if not response.text:
-                raise Exception("Respuesta de Gemini vacía")
-
-            content = response.text
-            
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-            
-            data = json.loads(content.strip())
-            
-            return FeedbackResponse(
-                success=True,
-                significado=data.get("significado", ""),
-                motivo_error=data.get("motivo_error", ""),
-                ejemplo_real=data.get("ejemplo_real", ""),
-                mnemotecnia=data.get("mnemotecnia", ""),
-                mensaje_completo=f"{data.get('significado', '')} {data.get('mnemotecnia', '')}"
-            )
-            
-        except Exception as e:
-            print(f"--- ERROR EN GEMINI ---")
-            print(f"Detalle: {str(e)}")
-            return self._generar_fallback(request)
+        """Los errores se propagan para que el circuito los cuente"""
+        import google.genai as genai
+        
+        if not self.api_key:
+            raise Exception("GOOGLE_API_KEY no encontrada")
+
+        client = genai.Client(api_key=self.api_key)
+        model_name = self.model if self.model else 'gemini-2.0-flash'
+        
+        # generate_content es bloqueante: en un hilo para no frenar el event loop
+        response = await asyncio.to_thread(
+            client.models.generate_content,
+            model=model_name,
+            contents=prompt
+        )
+        
+        if not response.text:
+            raise Exception("Respuesta de Gemini vacía")
+
+        content = response.text
+        
+        if "```json" in content:
+            content = content.split("```json")[1].split("```")[0]
+        elif "```" in content:
+            content = content.split("```")[1].split("```")[0]
+        
+        data = json.loads(content.strip())
+        
+        return FeedbackResponse(
+            success=True,
+            significado=data.get("significado", ""),
+            motivo_error=data.get("motivo_error", ""),
+            ejemplo_real=data.get("ejemplo_real", ""),
+            mnemotecnia=data.get("mnemotecnia", ""),
+            mensaje_completo=f"{data.get('significado', '')} {data.get('mnemotecnia', '')}"
+        )
+
+    async def _llamar_stub(self, prompt: str, request: FeedbackRequest) -> FeedbackResponse:
+        """Proveedor local sin red: respuesta fija tras una latencia simulada
+        (AI_STUB_TASA_ERROR simula caídas para probar el circuito)"""
+        await asyncio.sleep(self.stub_latencia)
+        if self.stub_tasa_error and random.random() < self.stub_tasa_error:
+            raise Exception("Fallo simulado del proveedor de prueba")
+        return FeedbackResponse(
+            success=True,
+            significado=f"La señal '{request.nombre_senal}' indica una regla de tránsito.",
+            motivo_error="Respuesta generada por el proveedor de prueba.",
+            ejemplo_real="Ejemplo de prueba.",
+            mnemotecnia="Mnemotecnia de prueba.",
+            mensaje_completo=f"La señal '{request.nombre_senal}' indica una regla de tránsito."
+        )
 
     def _generar_fallback(self, request: FeedbackRequest) -> FeedbackResponse:
         fue_tiempo_agotado = request.respuesta_usuario == "Tiempo agotado"
@@ -316,12 +810,21 @@ async def root():
 async def health_check():
     return {
         "status": "healthy", 
-        "provider": "google", 
+        "provider": ia_client.provider, 
         "model": ia_client.model,
         "dificultad_model_loaded": model is not None,
-        "database": "sqlite"
+        "database": engine.dialect.name,
+        "circuito_llm": ia_client.circuito.resumen(),
+        "sesiones_activas": len(sesiones_activas),
+        "bitacora": bitacora.resumen(),
+        "replica": replica.resumen()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def exponer_metricas():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(instrumentacion.registro.exponer(), media_type="text/plain; version=0.0.4")
+
 @app.post("/predecir", response_model=Respuesta)
 def predecir_dificultad(datos: DatosJuego):
     print(f"\n{'='*60}")
@@ -346,7 +849,8 @@ def predecir_dificultad(datos: DatosJuego):
             datos.tiempo_promedio
         ]])
         
-        prediccion = int(model.predict(X)[0])
+        with medir("modelo"):
+            prediccion = int(model.predict(X)[0])
         descripciones = {0: "Baja", 1: "Media", 2: "Alta"}
         descripcion = descripciones.get(prediccion, "Desconocida")
         
@@ -379,6 +883,37 @@ async def generar_feedback(request: FeedbackRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============== MODELO PARA EVALUAR EN EL VISOR ==============
+
+instrumentacion.registro.describir("modelo_exportado_total", "counter", "Descargas del modelo de dificultad por resultado")
+_modelo_exportado = None     # (etag, cuerpo JSON) del modelo cargado; se arma en la primera petición
+_lock_modelo_exportado = threading.Lock()
+
+def modelo_exportado() -> tuple:
+    global _modelo_exportado
+    with _lock_modelo_exportado:
+        if _modelo_exportado is None:
+            paquete = modelo_portatil.construir(model)
+            _modelo_exportado = (f'"{paquete["version"]}"', a_json(paquete))
+            print(f"Modelo de dificultad {paquete['version']} preparado para exportar "
+                  f"({len(_modelo_exportado[1])} bytes)")
+        return _modelo_exportado
+
+@app.get("/modelo/dificultad")
+def exportar_modelo_dificultad(if_none_match: Optional[str] = Header(None)):
+    """Bosque aplanado con suma de control y conjunto de paridad (ver modelo_portatil.py).
+    Con If-None-Match igual a la versión vigente responde 304 sin cuerpo"""
+    if model is None:
+        raise HTTPException(status_code=404, detail="Modelo de dificultad no cargado")
+    etag, cuerpo = modelo_exportado()
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in (v.strip() for v in if_none_match.split(",")):
+        instrumentacion.registro.incrementar("modelo_exportado_total", (("resultado", "no_modificado"),))
+        return Response(status_code=304, headers=cabeceras)
+    instrumentacion.registro.incrementar("modelo_exportado_total", (("resultado", "completo"),))
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
+
+
 # ============== ENDPOINTS DE ESTUDIANTES ==============
 
 @app.post("/estudiantes", response_model=EstudianteResponse)
@@ -408,7 +943,7 @@ def crear_estudiante(estudiante: EstudianteCreate, db: Session = Depends(get_db)
     )
 
 @app.get("/estudiantes", response_model=List[EstudianteResponse])
-def listar_estudiantes(db: Session = Depends(get_db)):
+def listar_estudiantes(db: Session = Depends(get_db_lectura)):
     estudiantes = db.query(Estudiante).all()
     resultado = []
     
@@ -424,8 +959,67 @@ def listar_estudiantes(db: Session = Depends(get_db)):
     
     return resultado
 
+@app.get("/estudiantes/buscar")
+def buscar_estudiantes_panel(q: str = "", limite: int = Query(20, ge=1, le=100), desde: int = Query(0, ge=0),
+                             db: Session = Depends(get_db_lectura)):
+    """Búsqueda por prefijo en nombre e identificador, sin distinguir tildes ni mayúsculas"""
+    total, filas = buscar_estudiantes(db, q, limite, desde)
+    ids = [f.id for f in filas]
+    sesiones = dict(
+        db.query(Sesion.estudiante_id, func.count(Sesion.id))
+        .filter(Sesion.estudiante_id.in_(ids))
+        .group_by(Sesion.estudiante_id).all()
+    ) if ids else {}
+    return {
+        "total": total,
+        "desde": desde,
+        "limite": limite,
+        "resultados": [
+            {
+                "id": f.id,
+                "nombre": f.nombre,
+                "identificador": f.identificador,
+                "fecha_registro": f.fecha_registro,
+                "total_sesiones": sesiones.get(f.id, 0),
+            } for f in filas
+        ],
+    }
+
+@app.post("/estudiantes/importar")
+async def importar_estudiantes(request: Request, modo: str = Query("actualizar"), formato: Optional[str] = Query(None)):
+    """Alta masiva desde un CSV o JSON en el cuerpo (ver importacion.py)"""
+    if modo not in importacion.MODOS:
+        raise HTTPException(status_code=400, detail=f"modo debe ser uno de {', '.join(importacion.MODOS)}")
+    if formato not in (None, "csv", "json"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'csv' o 'json'")
+
+    # El cuerpo se vuelca a un archivo temporal (en disco si es grande) sin tenerlo entero en memoria
+    archivo = tempfile.SpooledTemporaryFile(max_size=importacion.MEMORIA_BYTES)
+    try:
+        recibidos = 0
+        async for trozo in request.stream():
+            recibidos += len(trozo)
+            if recibidos > importacion.MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"Máximo {importacion.MAX_BYTES} bytes por importación")
+            archivo.write(trozo)
+        archivo.seek(0)
+        formato = formato or importacion.detectar_formato(request.headers.get("content-type"), archivo)
+        inicio = time.perf_counter()
+        try:
+            informe = await asyncio.to_thread(importacion.importar_archivo, archivo, formato, modo)
+        except importacion.ImportacionRechazada as e:
+            raise HTTPException(status_code=e.estado, detail=e.informe)
+    finally:
+        archivo.close()
+
+    informe["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    print(f"Importación de estudiantes ({modo}): {informe['creados']} creados, "
+          f"{informe['actualizados']} actualizados, {informe['omitidos']} omitidos, {informe['invalidos']} inválidos")
+    return informe
+
 @app.get("/estudiantes/{identificador}")
 def obtener_estudiante(identificador: str, db: Session = Depends(get_db)):
+    # De la principal: un cliente lo consulta justo después de darlo de alta
     estudiante = db.query(Estudiante).filter(
         Estudiante.identificador == identificador
     ).first()
@@ -468,9 +1062,24 @@ def crear_sesion(sesion: SesionCreate, db: Session = Depends(get_db)):
     db.add(nueva)
     db.commit()
     db.refresh(nueva)
-    
+    sesiones_activas.abrir(nueva.id, nueva.estudiante_id, nueva.dificultad_inicial)
+    # Tras el commit (el id lo da la BD), pero en disco antes de entregar el id al cliente
+    bitacora.confirmar(bitacora.anotar(EV_SESION_INICIO, como_fila(nueva)))
+    
+    difusor.publicar("sesiones", {
+        "sesion_id": nueva.id,
+        "estudiante_id": nueva.estudiante_id,
+        "estudiante_nombre": estudiante.nombre,
+        "fecha_inicio": nueva.fecha_inicio,
+        "completada": False
+    })
     return {"sesion_id": nueva.id, "mensaje": "Sesión creada"}
 
+@app.get("/sesiones/activas")
+def listar_sesiones_activas():
+    """Sesiones abiertas en este worker con su zona, ronda, dificultad y contadores"""
+    return sesiones_activas.listar()
+
 @app.put("/sesiones/{sesion_id}")
 def actualizar_sesion(sesion_id: int, datos: SesionUpdate, db: Session = Depends(get_db)):
     sesion = db.query(Sesion).filter(Sesion.id == sesion_id).first()
@@ -515,7 +1124,17 @@ def actualizar_sesion(sesion_id: int, datos: SesionUpdate, db: Session = Depends
     sesion.datos_suficientes = total_intentos >= 1
     
     db.commit()
+    sesiones_activas.cerrar(sesion_id)
+    bitacora.confirmar(bitacora.anotar(EV_SESION_FIN, como_fila(sesion)))
     
+    difusor.publicar("sesiones", {
+        "sesion_id": sesion.id,
+        "estudiante_id": sesion.estudiante_id,
+        "completada": sesion.completada,
+        "aciertos": sesion.total_aciertos,
+        "errores": sesion.total_errores,
+        "datos_suficientes": sesion.datos_suficientes
+    })
     print(f"[DEBUG] Sesión {sesion_id} actualizada - Aciertos: {sesion.total_aciertos}, Errores: {sesion.total_errores}, Datos suficientes: {sesion.datos_suficientes}")
     
     return {
@@ -528,28 +1147,31 @@ def actualizar_sesion(sesion_id: int, datos: SesionUpdate, db: Session = Depends
     }
 
 @app.get("/sesiones")
-def listar_sesiones(
+async def listar_sesiones(
     estudiante_id: Optional[int] = None,
     completada: Optional[bool] = None,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Sesion)
+    # De la principal: el panel la recarga justo al enterarse de una sesión nueva
+    # Un solo JOIN en lugar de una consulta de estudiante por sesión
+    query = select(Sesion, Estudiante.nombre).outerjoin(
+        Estudiante, Estudiante.id == Sesion.estudiante_id
+    )
     
     if estudiante_id:
-        query = query.filter(Sesion.estudiante_id == estudiante_id)
+        query = query.where(Sesion.estudiante_id == estudiante_id)
     if completada is not None:
-        query = query.filter(Sesion.completada == completada)
+        query = query.where(Sesion.completada == completada)
     
-    sesiones = query.order_by(Sesion.fecha_inicio.desc()).limit(limit).all()
+    filas = (await db.execute(query.order_by(Sesion.fecha_inicio.desc()).limit(limit))).all()
     
     resultado = []
-    for s in sesiones:
-        estudiante = db.query(Estudiante).filter(Estudiante.id == s.estudiante_id).first()
+    for s, estudiante_nombre in filas:
         resultado.append({
             "id": s.id,
             "estudiante_id": s.estudiante_id,
-            "estudiante_nombre": estudiante.nombre if estudiante else "Desconocido",
+            "estudiante_nombre": estudiante_nombre or "Desconocido",
             "fecha_inicio": s.fecha_inicio,
             "fecha_fin": s.fecha_fin,
             "aciertos": s.total_aciertos,
@@ -563,57 +1185,52 @@ def listar_sesiones(
 
 # ============== ENDPOINT DE MÉTRICAS DETALLADAS (CASO DE USO 3) ==============
 
+# Campos de primer nivel que admite ?fields= (las partes no pedidas no se consultan)
+CAMPOS_METRICAS = (
+    "sesion_id", "estudiante_nombre", "fecha_inicio", "fecha_fin", "duracion_segundos",
+    "total_aciertos", "total_errores", "tasa_aciertos", "tiempo_promedio_respuesta",
+    "zonas_completadas", "dificultad_inicial", "dificultad_final", "completada",
+    "datos_suficientes", "errores_por_tipo", "tiempos_por_senal", "ajustes_dificultad",
+    "intentos", "paginacion_intentos"
+)
+
 @app.get("/sesiones/{sesion_id}/metricas")
-def obtener_metricas_sesion(sesion_id: int, db: Session = Depends(get_db)):
+def obtener_metricas_sesion(
+    sesion_id: int,
+    campos: Optional[str] = Query(None, alias="fields", description="Campos separados por comas"),
+    intentos_desde: int = Query(0, ge=0),
+    intentos_limite: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db_lectura)
+):
+    if campos is not None:
+        campos = [c.strip() for c in campos.split(",") if c.strip()]
+        desconocidos = [c for c in campos if c not in CAMPOS_METRICAS]
+        if desconocidos:
+            raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(desconocidos)}. "
+                                                        f"Válidos: {', '.join(CAMPOS_METRICAS)}")
+    
+    metricas = calcular_metricas_sesion(sesion_id, db, campos, intentos_desde, intentos_limite)
+    # orjson directo: evita jsonable_encoder, que recorre cada intento
+    return RespuestaRapida(metricas)
+
+def calcular_metricas_sesion(sesion_id: int, db: Session, campos: list = None,
+                             intentos_desde: int = 0, intentos_limite: int = None) -> dict:
+    """Métricas de una sesión; con 'campos' solo se calculan las partes pedidas"""
+    def pedido(campo):
+        return campos is None or campo in campos
+    
     sesion = db.query(Sesion).filter(Sesion.id == sesion_id).first()
     if not sesion:
         raise HTTPException(status_code=404, detail="Sesión no encontrada")
     
-    estudiante = db.query(Estudiante).filter(Estudiante.id == sesion.estudiante_id).first()
-    
-    # Obtener intentos
-    intentos = db.query(IntentoSenal).filter(IntentoSenal.sesion_id == sesion_id).all()
-    
-    # Obtener errores detallados
-    errores = db.query(ErrorDetallado).filter(ErrorDetallado.sesion_id == sesion_id).all()
-    
-    # Obtener ajustes de dificultad
-    ajustes = db.query(AjusteDificultad).filter(AjusteDificultad.sesion_id == sesion_id).all()
-    
-    # Calcular errores por tipo
-    errores_por_tipo = {}
-    for e in errores:
-        tipo = e.tipo_error
-        if tipo not in errores_por_tipo:
-            errores_por_tipo[tipo] = {"cantidad": 0, "senales": []}
-        errores_por_tipo[tipo]["cantidad"] += 1
-        errores_por_tipo[tipo]["senales"].append(e.nombre_senal)
-    
-    # Calcular tiempos por señal
-    tiempos_por_senal = {}
-    for i in intentos:
-        if i.nombre_senal not in tiempos_por_senal:
-            tiempos_por_senal[i.nombre_senal] = {"tiempos": [], "aciertos": 0, "errores": 0}
-        tiempos_por_senal[i.nombre_senal]["tiempos"].append(i.tiempo_respuesta)
-        if i.fue_correcta:
-            tiempos_por_senal[i.nombre_senal]["aciertos"] += 1
-        else:
-            tiempos_por_senal[i.nombre_senal]["errores"] += 1
-    
-    # Calcular promedios
-    for senal, data in tiempos_por_senal.items():
-        data["tiempo_promedio"] = sum(data["tiempos"]) / len(data["tiempos"]) if data["tiempos"] else 0
-        del data["tiempos"]  # No enviar lista completa
-    
     # Calcular tasa de aciertos
     total = sesion.total_aciertos + sesion.total_errores
     tasa_aciertos = sesion.total_aciertos / total if total > 0 else 0
     
     dificultades = {0: "Baja", 1: "Media", 2: "Alta"}
     
-    return {
+    metricas = {
         "sesion_id": sesion.id,
-        "estudiante_nombre": estudiante.nombre if estudiante else "Desconocido",
         "fecha_inicio": sesion.fecha_inicio,
         "fecha_fin": sesion.fecha_fin,
         "duracion_segundos": sesion.duracion_segundos,
@@ -626,9 +1243,58 @@ def obtener_metricas_sesion(sesion_id: int, db: Session = Depends(get_db)):
         "dificultad_final": dificultades.get(sesion.dificultad_final, "Desconocida"),
         "completada": sesion.completada,
         "datos_suficientes": sesion.datos_suficientes,
-        "errores_por_tipo": errores_por_tipo,
-        "tiempos_por_senal": tiempos_por_senal,
-        "ajustes_dificultad": [
+    }
+    
+    if pedido("estudiante_nombre"):
+        estudiante = db.query(Estudiante.nombre).filter(Estudiante.id == sesion.estudiante_id).first()
+        metricas["estudiante_nombre"] = estudiante.nombre if estudiante else "Desconocido"
+    
+    # Calcular errores por tipo
+    if pedido("errores_por_tipo"):
+        errores_por_tipo = {}
+        errores = db.query(ErrorDetallado.tipo_error, ErrorDetallado.nombre_senal).filter(
+            ErrorDetallado.sesion_id == sesion_id
+        ).order_by(ErrorDetallado.id).all()
+        for tipo, nombre_senal in errores:
+            if tipo not in errores_por_tipo:
+                errores_por_tipo[tipo] = {"cantidad": 0, "senales": []}
+            errores_por_tipo[tipo]["cantidad"] += 1
+            errores_por_tipo[tipo]["senales"].append(nombre_senal)
+        metricas["errores_por_tipo"] = errores_por_tipo
+    
+    # Tiempos por señal: agregados en SQL, sin traer cada intento
+    if pedido("tiempos_por_senal"):
+        tiempos_por_senal = {}
+        agregados = db.query(
+            IntentoSenal.nombre_senal,
+            func.count(IntentoSenal.id),
+            func.sum(case((IntentoSenal.fue_correcta, 1), else_=0)),
+            func.avg(IntentoSenal.tiempo_respuesta)
+        ).filter(IntentoSenal.sesion_id == sesion_id).group_by(
+            IntentoSenal.nombre_senal
+        ).order_by(func.min(IntentoSenal.id)).all()
+        for nombre_senal, cantidad, aciertos, tiempo_promedio in agregados:
+            tiempos_por_senal[nombre_senal] = {
+                "aciertos": int(aciertos or 0),
+                "errores": cantidad - int(aciertos or 0),
+                "tiempo_promedio": tiempo_promedio or 0
+            }
+        
+        # Sumar los eventos ya archivados por la retención (solo quedan resumidos)
+        resumenes = db.query(ResumenSenalSesion).filter(ResumenSenalSesion.sesion_id == sesion_id).all()
+        for r in resumenes:
+            data = tiempos_por_senal.setdefault(r.nombre_senal, {"aciertos": 0, "errores": 0, "tiempo_promedio": 0})
+            recientes = data["aciertos"] + data["errores"]
+            total_intentos = recientes + r.intentos
+            if total_intentos:
+                data["tiempo_promedio"] = (data["tiempo_promedio"] * recientes + r.tiempo_total) / total_intentos
+            data["aciertos"] += r.aciertos
+            data["errores"] += r.errores
+        metricas["tiempos_por_senal"] = tiempos_por_senal
+    
+    if pedido("ajustes_dificultad"):
+        ajustes = db.query(AjusteDificultad).filter(AjusteDificultad.sesion_id == sesion_id).all()
+        metricas["ajustes_dificultad"] = [
             {
                 "de": dificultades.get(a.dificultad_anterior, "?"),
                 "a": dificultades.get(a.dificultad_nueva, "?"),
@@ -638,8 +1304,17 @@ def obtener_metricas_sesion(sesion_id: int, db: Session = Depends(get_db)):
                 "ronda": a.ronda,
                 "timestamp": a.timestamp
             } for a in ajustes
-        ],
-        "intentos": [
+        ]
+    
+    # Intentos paginados por id (intentos_limite=None los trae todos)
+    if pedido("intentos"):
+        consulta = db.query(
+            IntentoSenal.nombre_senal, IntentoSenal.respuesta_usuario, IntentoSenal.fue_correcta,
+            IntentoSenal.tiempo_respuesta, IntentoSenal.zona, IntentoSenal.ronda
+        ).filter(IntentoSenal.sesion_id == sesion_id).order_by(IntentoSenal.id).offset(intentos_desde)
+        if intentos_limite is not None:
+            consulta = consulta.limit(intentos_limite)
+        metricas["intentos"] = [
             {
                 "senal": i.nombre_senal,
                 "respuesta": i.respuesta_usuario,
@@ -647,15 +1322,23 @@ def obtener_metricas_sesion(sesion_id: int, db: Session = Depends(get_db)):
                 "tiempo": i.tiempo_respuesta,
                 "zona": i.zona,
                 "ronda": i.ronda
-            } for i in intentos
+            } for i in consulta
         ]
-    }
+    
+    if pedido("paginacion_intentos") and (campos is not None or intentos_desde or intentos_limite is not None):
+        metricas["paginacion_intentos"] = {
+            "desde": intentos_desde,
+            "limite": intentos_limite,
+            "total": db.query(func.count(IntentoSenal.id)).filter(IntentoSenal.sesion_id == sesion_id).scalar()
+        }
+    
+    return {c: metricas[c] for c in (campos or CAMPOS_METRICAS) if c in metricas}
 
 
 # ============== EXPORTACIÓN DE MÉTRICAS (CASO DE USO 3) ==============
 
 @app.get("/sesiones/{sesion_id}/exportar")
-def exportar_metricas(sesion_id: int, formato: str = "json", db: Session = Depends(get_db)):
+def exportar_metricas(sesion_id: int, formato: str = "json", db: Session = Depends(get_db_lectura)):
     sesion = db.query(Sesion).filter(Sesion.id == sesion_id).first()
     if not sesion:
         raise HTTPException(status_code=404, detail="Sesión no encontrada")
@@ -669,7 +1352,7 @@ def exportar_metricas(sesion_id: int, formato: str = "json", db: Session = Depen
         )
     
     # Obtener métricas completas
-    metricas = obtener_metricas_sesion(sesion_id, db)
+    metricas = calcular_metricas_sesion(sesion_id, db)
     
     if formato.lower() == "csv":
         return exportar_csv(metricas, sesion_id)
@@ -677,10 +1360,8 @@ def exportar_metricas(sesion_id: int, formato: str = "json", db: Session = Depen
         return exportar_json(metricas, sesion_id)
 
 def exportar_json(metricas: dict, sesion_id: int):
-    contenido = json.dumps(metricas, indent=2, default=str, ensure_ascii=False)
-    
-    return StreamingResponse(
-        io.StringIO(contenido),
+    return Response(
+        a_json(metricas, indentar=True),
         media_type="application/json",
         headers={
             "Content-Disposition": f"attachment; filename=metricas_sesion_{sesion_id}.json"
@@ -736,10 +1417,8 @@ def exportar_csv(metricas: dict, sesion_id: int):
             f"{intento['tiempo']:.2f}", intento["zona"], intento["ronda"]
         ])
     
-    output.seek(0)
-    
-    return StreamingResponse(
-        output,
+    return Response(
+        output.getvalue(),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=metricas_sesion_{sesion_id}.csv"
@@ -749,18 +1428,55 @@ def exportar_csv(metricas: dict, sesion_id: int):
 
 # ============== ENDPOINTS DE REGISTRO (DESDE UNITY) ==============
 
+# Los endpoints de ingesta aceptan JSON o el formato binario de formato_binario.py
+async def leer_cuerpo(request: Request, modelo, tipo: int, campo_lote: str = None):
+    """Valida el cuerpo JSON con Pydantic o decodifica el binario según Content-Type"""
+    cuerpo = await request.body()
+    if request.headers.get("content-type", "").split(";")[0].strip() != formato_binario.TIPO_CONTENIDO:
+        try:
+            return modelo.model_validate_json(cuerpo)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+    
+    try:
+        filas = formato_binario.decodificar(cuerpo, tipo, request.headers.get("X-Simbolos-Version"))
+    except formato_binario.TablaDesactualizada as e:
+        raise HTTPException(status_code=409, detail=str(e),
+                            headers={"X-Simbolos-Version": formato_binario.version_tabla()})
+    except formato_binario.ErrorFormato as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if campo_lote is not None:
+        item = IntentoCreate if tipo == formato_binario.INTENTO else ErrorCreate
+        return modelo.model_construct(**{campo_lote: [item.model_construct(**f) for f in filas]})
+    if len(filas) != 1:
+        raise HTTPException(status_code=400, detail="Se esperaba exactamente un registro")
+    return modelo.model_construct(**filas[0])
+
+async def cuerpo_intento(request: Request) -> IntentoCreate:
+    return await leer_cuerpo(request, IntentoCreate, formato_binario.INTENTO)
+
+async def cuerpo_error(request: Request) -> ErrorCreate:
+    return await leer_cuerpo(request, ErrorCreate, formato_binario.ERROR)
+
+async def cuerpo_lote_intentos(request: Request) -> LoteIntentos:
+    return await leer_cuerpo(request, LoteIntentos, formato_binario.INTENTO, "intentos")
+
+async def cuerpo_lote_errores(request: Request) -> LoteErrores:
+    return await leer_cuerpo(request, LoteErrores, formato_binario.ERROR, "errores")
+
 @app.post("/intentos")
-def registrar_intento(intento: IntentoCreate, db: Session = Depends(get_db)):
+def registrar_intento(intento: IntentoCreate = Depends(cuerpo_intento), db: Session = Depends(get_db)):
     # NUEVO: Log de debug
     print(f"[DEBUG] Recibido intento - sesion_id: {intento.sesion_id}, senal: {intento.nombre_senal}, correcta: {intento.fue_correcta}")
     
-    # Verificar que la sesión existe
-    sesion = db.query(Sesion).filter(Sesion.id == intento.sesion_id).first()
+    # Verificar que la sesión existe (registro en memoria; la BD solo si no está)
+    sesion = buscar_sesion_activa(db, intento.sesion_id)
     if not sesion:
         print(f"[ERROR] Sesión {intento.sesion_id} no encontrada")
         raise HTTPException(status_code=404, detail=f"Sesión {intento.sesion_id} no encontrada")
     
-    nuevo = IntentoSenal(
+    nuevo_id, duplicado = guardar_con_secuencia(IntentoSenal, dict(
         sesion_id=intento.sesion_id,
         nombre_senal=intento.nombre_senal,
         respuesta_usuario=intento.respuesta_usuario,
@@ -768,27 +1484,32 @@ def registrar_intento(intento: IntentoCreate, db: Session = Depends(get_db)):
         tiempo_respuesta=intento.tiempo_respuesta,
         zona=intento.zona,
         ronda=intento.ronda,
-        dificultad=intento.dificultad
-    )
-    db.add(nuevo)
-    db.commit()
+        dificultad=intento.dificultad,
+        secuencia=intento.secuencia
+    ), db, evento_bitacora(EV_INTENTO, intento, sesion.estudiante_id))
+    
+    if duplicado:
+        print(f"[DEBUG] Intento duplicado (secuencia {intento.secuencia}), ID original: {nuevo_id}")
+        return {"mensaje": "Intento ya registrado", "id": nuevo_id, "duplicado": True}
+    
+    print(f"[DEBUG] Intento registrado con ID: {nuevo_id}")
     
-    print(f"[DEBUG] Intento registrado con ID: {nuevo.id}")
+    aplicar_intento(sesion.estudiante_id, intento)
     
-    return {"mensaje": "Intento registrado", "id": nuevo.id}
+    return {"mensaje": "Intento registrado", "id": nuevo_id}
 
 @app.post("/errores")
-def registrar_error(error: ErrorCreate, db: Session = Depends(get_db)):
+def registrar_error(error: ErrorCreate = Depends(cuerpo_error), db: Session = Depends(get_db)):
     # NUEVO: Log de debug
     print(f"[DEBUG] Recibido error - sesion_id: {error.sesion_id}, senal: {error.nombre_senal}, tipo: {error.tipo_error}")
     
     # Verificar que la sesión existe
-    sesion = db.query(Sesion).filter(Sesion.id == error.sesion_id).first()
+    sesion = buscar_sesion_activa(db, error.sesion_id)
     if not sesion:
         print(f"[ERROR] Sesión {error.sesion_id} no encontrada para error")
         raise HTTPException(status_code=404, detail=f"Sesión {error.sesion_id} no encontrada")
     
-    nuevo = ErrorDetallado(
+    nuevo_id, duplicado = guardar_con_secuencia(ErrorDetallado, dict(
         sesion_id=error.sesion_id,
         nombre_senal=error.nombre_senal,
         respuesta_usuario=error.respuesta_usuario,
@@ -797,31 +1518,457 @@ def registrar_error(error: ErrorCreate, db: Session = Depends(get_db)):
         zona=error.zona,
         dificultad=error.dificultad,
         intentos_previos=error.intentos_previos,
-        feedback_generado=error.feedback_generado
-    )
-    db.add(nuevo)
-    db.commit()
+        feedback_generado=error.feedback_generado,
+        secuencia=error.secuencia
+    ), db, evento_bitacora(EV_ERROR, error, sesion.estudiante_id))
     
-    print(f"[DEBUG] Error registrado con ID: {nuevo.id}")
+    if duplicado:
+        return {"mensaje": "Error ya registrado", "id": nuevo_id, "duplicado": True}
     
-    return {"mensaje": "Error registrado", "id": nuevo.id}
+    print(f"[DEBUG] Error registrado con ID: {nuevo_id}")
+    
+    aplicar_error(sesion.estudiante_id, error)
+    
+    return {"mensaje": "Error registrado", "id": nuevo_id}
+
+@app.post("/intentos/lote")
+async def registrar_intentos_lote(lote: LoteIntentos = Depends(cuerpo_lote_intentos), db: AsyncSession = Depends(get_async_db)):
+    """Ingesta masiva: COPY en PostgreSQL, executemany en SQLite"""
+    estudiantes = await validar_sesiones(db, {i.sesion_id for i in lote.intentos})
+    
+    nuevos, duplicados = await descartar_duplicados(db, IntentoSenal, lote.intentos)
+    ids = await asyncio.to_thread(anotar_antes, [evento_bitacora(EV_INTENTO, i, estudiantes[i.sesion_id]) for i in nuevos])
+    with resultado_anotado(ids):
+        if escritor.activo:
+            guardados = await guardar_en_escritor([(IntentoSenal, i) for i in nuevos])
+            duplicados += len(nuevos) - len(guardados)
+            nuevos = [i for _, i in guardados]
+            total = len(nuevos)
+        else:
+            total = await insertar_en_bloque(db, IntentoSenal, [i.model_dump() for i in nuevos])
+    
+    for i in nuevos:
+        aplicar_intento(estudiantes[i.sesion_id], i)
+    
+    return {"mensaje": "Intentos registrados", "total": total, "duplicados": duplicados}
+
+@app.post("/errores/lote")
+async def registrar_errores_lote(lote: LoteErrores = Depends(cuerpo_lote_errores), db: AsyncSession = Depends(get_async_db)):
+    estudiantes = await validar_sesiones(db, {e.sesion_id for e in lote.errores})
+    
+    nuevos, duplicados = await descartar_duplicados(db, ErrorDetallado, lote.errores)
+    ids = await asyncio.to_thread(anotar_antes, [evento_bitacora(EV_ERROR, e, estudiantes[e.sesion_id]) for e in nuevos])
+    with resultado_anotado(ids):
+        if escritor.activo:
+            guardados = await guardar_en_escritor([(ErrorDetallado, e) for e in nuevos])
+            duplicados += len(nuevos) - len(guardados)
+            nuevos = [e for _, e in guardados]
+            total = len(nuevos)
+        else:
+            total = await insertar_en_bloque(db, ErrorDetallado, [e.model_dump() for e in nuevos])
+    
+    for e in nuevos:
+        aplicar_error(estudiantes[e.sesion_id], e)
+    return {"mensaje": "Errores registrados", "total": total, "duplicados": duplicados}
+
+# Respaldo offline: el visor sube su backlog en trozos y reanuda desde la última secuencia confirmada
+MAX_EVENTOS_RESPALDO = int(os.getenv("RESPALDO_MAX_EVENTOS", "5000"))
+
+async def secuencia_confirmada(db: AsyncSession, sesion_id: int):
+    """Mayor n tal que todas las secuencias 0..n de la sesión están guardadas, entre
+    intentos y errores (None si falta la 0). Con MAX(secuencia) un evento que nunca
+    llegó quedaría tapado por los posteriores y el visor no lo reenviaría"""
+    secuencias = union(*(
+        select(modelo.secuencia.label("secuencia")).where(modelo.sesion_id == sesion_id, modelo.secuencia.isnot(None))
+        for modelo in (IntentoSenal, ErrorDetallado)
+    )).subquery()
+    # Distintas y ordenadas: el prefijo contiguo es donde la secuencia coincide con su posición
+    numeradas = select(
+        secuencias.c.secuencia,
+        (func.row_number().over(order_by=secuencias.c.secuencia) - 1).label("posicion")
+    ).subquery()
+    return await db.scalar(select(func.max(numeradas.c.secuencia)).where(numeradas.c.secuencia == numeradas.c.posicion))
+
+@app.get("/sesiones/{sesion_id}/respaldo")
+async def estado_respaldo(sesion_id: int, db: AsyncSession = Depends(get_async_db)):
+    await validar_sesiones(db, {sesion_id})
+    return {"sesion_id": sesion_id, "secuencia_confirmada": await secuencia_confirmada(db, sesion_id)}
+
+@app.post("/sesiones/{sesion_id}/respaldo")
+async def subir_respaldo(sesion_id: int, bloque: BloqueRespaldo, db: AsyncSession = Depends(get_async_db)):
+    """Sube un trozo del backlog offline en una sola transacción.
+    
+    Reenviar un trozo (p. ej. tras perder la conexión) es seguro: los eventos
+    cuya secuencia ya está guardada se descartan."""
+    eventos = bloque.intentos + bloque.errores
+    if len(eventos) > MAX_EVENTOS_RESPALDO:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_EVENTOS_RESPALDO} eventos por trozo")
+    if any(e.sesion_id != sesion_id for e in eventos):
+        raise HTTPException(status_code=400, detail="Todos los eventos deben ser de la sesión indicada")
+    if any(e.secuencia is None for e in eventos):
+        raise HTTPException(status_code=400, detail="Todos los eventos del respaldo necesitan 'secuencia'")
+    
+    estudiante_id = (await validar_sesiones(db, {sesion_id}))[sesion_id]
+    intentos, duplicados_intentos = await descartar_duplicados(db, IntentoSenal, bloque.intentos)
+    errores, duplicados_errores = await descartar_duplicados(db, ErrorDetallado, bloque.errores)
+    ids = await asyncio.to_thread(anotar_antes, [evento_bitacora(EV_INTENTO, i, estudiante_id) for i in intentos] +
+                                  [evento_bitacora(EV_ERROR, e, estudiante_id) for e in errores])
+    with resultado_anotado(ids):
+        if escritor.activo:
+            guardados = await guardar_en_escritor([(IntentoSenal, i) for i in intentos] +
+                                                  [(ErrorDetallado, e) for e in errores])
+            nuevos_intentos = [ev for modelo, ev in guardados if modelo is IntentoSenal]
+            nuevos_errores = [ev for modelo, ev in guardados if modelo is ErrorDetallado]
+            duplicados_intentos += len(intentos) - len(nuevos_intentos)
+            duplicados_errores += len(errores) - len(nuevos_errores)
+            intentos, errores = nuevos_intentos, nuevos_errores
+            # Cerrar la transacción de lectura para ver lo que confirmó el escritor
+            await db.commit()
+        else:
+            await insertar_en_bloque(db, IntentoSenal, [i.model_dump() for i in intentos], confirmar=False)
+            await insertar_en_bloque(db, ErrorDetallado, [e.model_dump() for e in errores], confirmar=False)
+            await db.commit()
+    
+    for i in intentos:
+        aplicar_intento(estudiante_id, i)
+    for e in errores:
+        aplicar_error(estudiante_id, e)
+    
+    return {
+        "insertados": len(intentos) + len(errores),
+        "duplicados": duplicados_intentos + duplicados_errores,
+        "secuencia_confirmada": await secuencia_confirmada(db, sesion_id)
+    }
+
+async def guardar_en_escritor(filas: list) -> list:
+    """Envía [(modelo ORM, evento)] al escritor único, que los confirma en una
+    sola transacción; devuelve los pares que no eran duplicados"""
+    _, duplicados = await asyncio.to_thread(
+        escritor.insertar_lote, [(modelo.__tablename__, evento.model_dump()) for modelo, evento in filas]
+    )
+    return [fila for fila, duplicado in zip(filas, duplicados) if not duplicado]
+
+async def descartar_duplicados(db: AsyncSession, modelo, eventos: list) -> tuple:
+    """Quita los eventos cuya (sesion_id, secuencia) ya está guardada o repetida en el lote"""
+    if not any(e.secuencia is not None for e in eventos):
+        return eventos, 0
+    filas = [{"sesion_id": e.sesion_id, "secuencia": e.secuencia, "evento": e} for e in eventos]
+    existentes = (await db.execute(consulta_secuencias(modelo, filas))).all()
+    nuevas, duplicadas = separar_duplicados(filas, existentes)
+    return [f["evento"] for f in nuevas], len(duplicadas)
+
+async def validar_sesiones(db: AsyncSession, sesion_ids: set) -> dict:
+    """Verifica que todas las sesiones existen; devuelve sesion_id -> estudiante_id.
+    Las que no están en el registro en memoria se buscan con una sola consulta"""
+    existentes = {}
+    for sesion_id in sesion_ids:
+        sesion = sesiones_activas.obtener(sesion_id)
+        if sesion is not None:
+            existentes[sesion_id] = sesion.estudiante_id
+    if len(existentes) < len(sesion_ids):
+        filas = (await db.execute(
+            select(Sesion.id, Sesion.estudiante_id, Sesion.dificultad_inicial, Sesion.completada)
+            .where(Sesion.id.in_(sesion_ids - existentes.keys()))
+        )).all()
+        for fila in filas:
+            existentes[fila.id] = fila.estudiante_id
+            if not fila.completada:
+                sesiones_activas.abrir(fila.id, fila.estudiante_id, fila.dificultad_inicial)
+    faltantes = sorted(sesion_ids - existentes.keys())
+    if faltantes:
+        raise HTTPException(status_code=404, detail=f"Sesiones no encontradas: {faltantes}")
+    return existentes
 
 @app.post("/ajustes")
 def registrar_ajuste(ajuste: AjusteCreate, db: Session = Depends(get_db)):
-    nuevo = AjusteDificultad(
-        sesion_id=ajuste.sesion_id,
-        dificultad_anterior=ajuste.dificultad_anterior,
-        dificultad_nueva=ajuste.dificultad_nueva,
-        motivo=ajuste.motivo,
-        tasa_aciertos=ajuste.tasa_aciertos,
-        tiempo_promedio=ajuste.tiempo_promedio,
-        zona=ajuste.zona,
-        ronda=ajuste.ronda
+    if buscar_sesion_activa(db, ajuste.sesion_id) is None:
+        raise HTTPException(status_code=404, detail=f"Sesión {ajuste.sesion_id} no encontrada")
+    
+    with resultado_anotado(anotar_antes([evento_bitacora(EV_AJUSTE, ajuste)])):
+        nuevo_id, _ = guardar_registro(AjusteDificultad, dict(
+            sesion_id=ajuste.sesion_id,
+            dificultad_anterior=ajuste.dificultad_anterior,
+            dificultad_nueva=ajuste.dificultad_nueva,
+            motivo=ajuste.motivo,
+            tasa_aciertos=ajuste.tasa_aciertos,
+            tiempo_promedio=ajuste.tiempo_promedio,
+            zona=ajuste.zona,
+            ronda=ajuste.ronda
+        ), db)
+    aplicar_ajuste(ajuste)
+    
+    return {"mensaje": "Ajuste registrado", "id": nuevo_id}
+
+
+# ============== FLUJO EN VIVO DEL PANEL ==============
+
+@app.get("/eventos")
+async def flujo_eventos(request: Request):
+    """Server-Sent Events con los deltas de la ingesta (ver difusion.py).
+    El panel usa EventSource, que reconecta solo y envía Last-Event-ID."""
+    return StreamingResponse(
+        difusor.flujo(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    db.add(nuevo)
-    db.commit()
+
+
+# ============== CANAL WEBSOCKET POR SESIÓN ==============
+
+# Eventos de telemetría que se guardan en lote: tipo -> (modelo Pydantic, modelo ORM)
+EVENTOS_WS = {
+    "intento": (IntentoCreate, IntentoSenal),
+    "error": (ErrorCreate, ErrorDetallado),
+    "ajuste": (AjusteCreate, AjusteDificultad),
+}
+TIPOS_BITACORA_WS = {"intento": EV_INTENTO, "error": EV_ERROR, "ajuste": EV_AJUSTE}
+
+def guardar_eventos_ws(conexion: ConexionVisor, eventos: list) -> list:
+    """Guarda un lote de eventos del canal en una transacción; devuelve los IDs en BD.
+    Los reenvíos con una secuencia ya guardada reciben el ID original y no se aplican de nuevo"""
+    ids = [None] * len(eventos)
+    duplicados = set()
+    db = SessionLocal()
+    try:
+        nuevas, repetidas = [], []
+        for tipo, (_, modelo) in EVENTOS_WS.items():
+            filas = [{"sesion_id": d.sesion_id, "secuencia": getattr(d, "secuencia", None), "indice": n}
+                     for n, (_, t, d) in enumerate(eventos) if t == tipo]
+            existentes = []
+            if hasattr(modelo, "secuencia") and any(f["secuencia"] is not None for f in filas):
+                existentes = db.execute(consulta_secuencias(modelo, filas)).all()
+            nuevas_tipo, duplicadas = separar_duplicados(filas, existentes)
+            for f, id_existente in duplicadas:
+                ids[f["indice"]] = id_existente
+                duplicados.add(f["indice"])
+                if id_existente is None:
+                    repetidas.append((f["indice"], modelo, (f["sesion_id"], f["secuencia"])))
+            nuevas += [(f["indice"], modelo, (f["sesion_id"], f["secuencia"])) for f in nuevas_tipo]
+        
+        ids_bitacora = anotar_antes([evento_bitacora(TIPOS_BITACORA_WS[eventos[indice][1]], eventos[indice][2],
+                                                     None if eventos[indice][1] == "ajuste" else conexion.estudiante_id)
+                                     for indice, _, _ in nuevas])
+        with resultado_anotado(ids_bitacora):
+            if escritor.activo:
+                # El escritor vuelve a deduplicar: otro worker pudo guardar la misma secuencia entre medio
+                ids_nuevas, duplicadas = escritor.insertar_lote(
+                    [(modelo.__tablename__, eventos[indice][2].model_dump()) for indice, modelo, _ in nuevas])
+                for (indice, _, _), id_nuevo, duplicado in zip(nuevas, ids_nuevas, duplicadas):
+                    ids[indice] = id_nuevo
+                    if duplicado:
+                        duplicados.add(indice)
+            else:
+                filas = [(indice, modelo(**eventos[indice][2].model_dump())) for indice, modelo, _ in nuevas]
+                db.add_all([fila for _, fila in filas])
+                db.commit()
+                for indice, fila in filas:
+                    ids[indice] = fila.id
+        
+        # Las repetidas dentro del lote reciben el ID de su primera aparición
+        originales = {(modelo, clave): ids[indice] for indice, modelo, clave in nuevas}
+        for indice, modelo, clave in repetidas:
+            ids[indice] = originales[(modelo, clave)]
+    finally:
+        db.close()
+    
+    for n, (_, tipo, datos) in enumerate(eventos):
+        if n in duplicados:
+            continue
+        if tipo == "intento":
+            aplicar_intento(conexion.estudiante_id, datos)
+        elif tipo == "error":
+            aplicar_error(conexion.estudiante_id, datos)
+        elif tipo == "ajuste":
+            aplicar_ajuste(datos)
+    return ids
+
+def configuracion_activa() -> dict:
+    db = SessionLocal()
+    try:
+        return obtener_configuracion(db)
+    finally:
+        db.close()
+
+async def responder_feedback(conexion: ConexionVisor, id_peticion, solicitud: FeedbackRequest):
+    # En una tarea aparte para que la latencia del LLM no frene el resto del canal
+    respuesta = await ia_client.generar_feedback(solicitud)
+    conexion.enviar({"id": id_peticion, "tipo": "feedback", "datos": respuesta})
+
+async def atender_mensaje_ws(conexion: ConexionVisor, mensaje: dict):
+    id_peticion = mensaje.get("id")
+    tipo = mensaje.get("tipo")
+    datos = mensaje.get("datos") or {}
+    conocido = tipo in EVENTOS_WS or tipo in ("predecir", "feedback", "configuracion", "ping")
+    instrumentacion.registro.incrementar("ws_mensajes_total", (("tipo", tipo if conocido else "desconocido"),))
     
-    return {"mensaje": "Ajuste registrado", "id": nuevo.id}
+    try:
+        if tipo in EVENTOS_WS:
+            evento = EVENTOS_WS[tipo][0].model_validate({**datos, "sesion_id": conexion.sesion_id})
+            conexion.encolar_evento(id_peticion, tipo, evento)
+        elif tipo == "predecir":
+            prediccion = await asyncio.to_thread(predecir_dificultad, DatosJuego.model_validate(datos))
+            conexion.enviar({"id": id_peticion, "tipo": "prediccion", "datos": prediccion})
+        elif tipo == "feedback":
+            conexion.lanzar(responder_feedback(conexion, id_peticion, FeedbackRequest.model_validate(datos)))
+        elif tipo == "configuracion":
+            conexion.enviar({"id": id_peticion, "tipo": "configuracion",
+                             "datos": await asyncio.to_thread(configuracion_activa)})
+        elif tipo == "ping":
+            conexion.enviar({"id": id_peticion, "tipo": "pong"})
+        else:
+            conexion.enviar({"id": id_peticion, "tipo": "error", "detalle": f"Tipo de mensaje desconocido: {tipo}"})
+    except ValidationError as e:
+        conexion.enviar({"id": id_peticion, "tipo": "error", "detalle": e.errors(include_url=False)})
+    except HTTPException as e:
+        conexion.enviar({"id": id_peticion, "tipo": "error", "detalle": e.detail})
+
+@app.websocket("/ws/sesiones/{sesion_id}")
+async def canal_sesion(websocket: WebSocket, sesion_id: int):
+    """Canal persistente del visor: telemetría con acks en lote, predicciones, feedback y configuración"""
+    def buscar_estudiante():
+        db = SessionLocal()
+        try:
+            sesion = buscar_sesion_activa(db, sesion_id)
+            return sesion.estudiante_id if sesion is not None else None
+        finally:
+            db.close()
+    
+    estudiante_id = await asyncio.to_thread(buscar_estudiante)
+    if estudiante_id is None:
+        await websocket.close(code=4404, reason="Sesión no encontrada")
+        return
+    
+    await websocket.accept()
+    conexion = ConexionVisor(websocket, sesion_id, estudiante_id)
+    anterior = conexiones.agregar(conexion)
+    if anterior is not None:
+        # Una conexión por sesión: la más reciente reemplaza a la anterior (p. ej. tras reconectar)
+        await anterior.websocket.close(code=4000, reason="Reemplazada por una conexión nueva")
+    
+    tareas = [asyncio.create_task(conexion.bucle_envio()),
+              asyncio.create_task(conexion.bucle_confirmaciones(guardar_eventos_ws))]
+    conexion.enviar({"id": None, "tipo": "configuracion", "datos": await asyncio.to_thread(configuracion_activa)})
+    
+    try:
+        while True:
+            texto = await websocket.receive_text()
+            try:
+                mensaje = json.loads(texto)
+            except json.JSONDecodeError:
+                mensaje = None
+            if not isinstance(mensaje, dict):
+                conexion.enviar({"id": None, "tipo": "error", "detalle": "Se esperaba un objeto JSON"})
+                continue
+            await atender_mensaje_ws(conexion, mensaje)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        conexiones.quitar(conexion)
+        # Guardar lo que quedó pendiente aunque ya no se pueda confirmar
+        await conexion.vaciar(guardar_eventos_ws)
+        for tarea in tareas:
+            tarea.cancel()
+        conexion.cerrar()
+
+
+# ============== TABLA DE SÍMBOLOS (FORMATO BINARIO) ==============
+
+@app.get("/simbolos")
+def obtener_simbolos():
+    """Nombres de señal por ID para codificar en el formato binario"""
+    return {"version": formato_binario.version_tabla(), "nombres": codigos.nombres()}
+
+@app.post("/simbolos")
+def registrar_simbolos(registro: RegistroSimbolos, x_sesion_id: Optional[int] = Header(None),
+                       x_admin_token: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """Registra nombres nuevos (señales o respuestas) y devuelve la tabla completa.
+    Solo desde una sesión abierta (X-Sesion-Id) o con X-Admin-Token: la tabla es
+    compartida, solo crece y tiene un máximo"""
+    if not es_admin(x_admin_token):
+        if x_sesion_id is None or buscar_sesion_activa(db, x_sesion_id) is None \
+                or sesiones_activas.obtener(x_sesion_id) is None:
+            raise HTTPException(status_code=403, detail="Registrar símbolos requiere X-Sesion-Id de una sesión abierta")
+    invalidos = [n for n in registro.nombres if not n or len(n) > MAX_NOMBRE_SIMBOLO or not n.isprintable()]
+    if invalidos:
+        raise HTTPException(status_code=400, detail=f"Nombres inválidos: {invalidos[:5]}")
+    try:
+        for nombre in registro.nombres:
+            codigos.id(nombre)
+    except TablaLlena as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return obtener_simbolos()
+
+
+# ============== DOMINIO POR ESTUDIANTE ==============
+
+@app.get("/maestria/{estudiante_id}")
+def obtener_maestria(estudiante_id: int, k: int = 5):
+    """Dominio por señal y sugerencia de señales/dificultad para el visor (sin recorrer historial)"""
+    return {
+        "estudiante_id": estudiante_id,
+        **maestria.recomendar(estudiante_id, k),
+        "senales": maestria.obtener(estudiante_id)
+    }
+
+
+@app.get("/confusion/top")
+def top_confusiones(k: int = 10, dificultad: Optional[int] = None, zona: Optional[int] = None):
+    """Pares (señal, respuesta) más confundidos, opcionalmente por dificultad y zona"""
+    return {"confusiones": confusion.top_confusiones(k, dificultad, zona)}
+
+@app.get("/confusion/senal/{nombre_senal}")
+def fila_confusion(nombre_senal: str, dificultad: Optional[int] = None, zona: Optional[int] = None):
+    """Distribución normalizada de respuestas dadas para una señal"""
+    return {"senal": nombre_senal, **confusion.fila_normalizada(nombre_senal, dificultad, zona)}
+
+def leer_percentiles(p: str) -> list:
+    """"50,90,99" -> [0.5, 0.9, 0.99]"""
+    try:
+        valores = [float(v) for v in p.split(",") if v.strip()]
+    except ValueError:
+        valores = []
+    if not valores or any(not 0 <= v <= 100 for v in valores):
+        raise HTTPException(status_code=400, detail="p debe ser una lista de percentiles entre 0 y 100, p. ej. 50,90,99")
+    return [v / 100 for v in valores]
+
+def nombrar_percentiles(valores: dict) -> dict:
+    return {f"p{q * 100:g}": segundos for q, segundos in valores.items()}
+
+@app.get("/tiempos/percentiles")
+def percentiles_tiempo(
+    p: str = "50,90,99",
+    senal: Optional[str] = None,
+    zona: Optional[int] = None,
+    dificultad: Optional[int] = None,
+    estudiante_id: Optional[int] = None
+):
+    """Percentiles del tiempo de respuesta fusionando los sketches que cumplen los filtros.
+    Por estudiante solo se puede filtrar además por señal"""
+    if estudiante_id is not None and (zona is not None or dificultad is not None):
+        raise HTTPException(status_code=400, detail="Con estudiante_id solo se admite el filtro senal")
+    resultado = tiempos.consultar(leer_percentiles(p), senal, zona, dificultad, estudiante_id)
+    return {
+        "filtros": {"senal": senal, "zona": zona, "dificultad": dificultad, "estudiante_id": estudiante_id},
+        "n": resultado["n"],
+        "percentiles": nombrar_percentiles(resultado["percentiles"]),
+        "error_relativo_max": PRECISION_CUANTILES
+    }
+
+@app.get("/tiempos/senales")
+def percentiles_por_senal(p: str = "50,90", zona: Optional[int] = None, dificultad: Optional[int] = None):
+    """Percentiles de tiempo de todas las señales (p. ej. para ordenar por lentitud en el panel)"""
+    return {
+        "senales": [
+            {**fila, "percentiles": nombrar_percentiles(fila["percentiles"])}
+            for fila in tiempos.por_senal(leer_percentiles(p), zona, dificultad)
+        ],
+        "error_relativo_max": PRECISION_CUANTILES
+    }
+
+@app.get("/planificador/{estudiante_id}/siguientes")
+def siguientes_senales(estudiante_id: int, k: int = Query(5, ge=1, le=100)):
+    """Próximas k señales a mostrar según repaso espaciado"""
+    return {"estudiante_id": estudiante_id, "senales": planificador.siguientes(estudiante_id, k)}
 
 
 # ============== ENDPOINTS DE CONFIGURACIÓN (CASO DE USO 4) ==============
@@ -903,29 +2050,34 @@ def actualizar_configuracion(datos: ConfiguracionUpdate, db: Session = Depends(g
     
     db.commit()
     
+    # Empujar la nueva configuración a los visores conectados por WebSocket
+    conexiones.difundir({"id": None, "tipo": "configuracion", "datos": obtener_configuracion(db)})
+    
     return {"mensaje": "Configuración actualizada exitosamente", "fecha": config.fecha_modificacion}
 
 
 # ============== ESTADÍSTICAS GLOBALES ==============
 
 @app.get("/estadisticas")
-def obtener_estadisticas_globales(db: Session = Depends(get_db)):
-    total_estudiantes = db.query(Estudiante).count()
-    total_sesiones = db.query(Sesion).count()
-    sesiones_completadas = db.query(Sesion).filter(Sesion.completada == True).count()
-    
-    # Promedios
-    avg_aciertos = db.query(func.avg(Sesion.total_aciertos)).scalar() or 0
-    avg_errores = db.query(func.avg(Sesion.total_errores)).scalar() or 0
-    avg_tiempo = db.query(func.avg(Sesion.tiempo_promedio_respuesta)).scalar() or 0
-    
-    # Errores más comunes
-    errores_comunes = db.query(
-        ErrorDetallado.nombre_senal,
-        func.count(ErrorDetallado.id).label("cantidad")
-    ).group_by(ErrorDetallado.nombre_senal).order_by(
-        func.count(ErrorDetallado.id).desc()
-    ).limit(5).all()
+async def obtener_estadisticas_globales(db: AsyncSession = Depends(get_async_db_lectura)):
+    total_estudiantes = await db.scalar(select(func.count(Estudiante.id)))
+    total_sesiones = await db.scalar(select(func.count(Sesion.id)))
+    sesiones_completadas = await db.scalar(
+        select(func.count(Sesion.id)).where(Sesion.completada == True)
+    )
+    
+    # Promedios (una sola consulta)
+    avg_aciertos, avg_errores, avg_tiempo = (await db.execute(select(
+        func.avg(Sesion.total_aciertos),
+        func.avg(Sesion.total_errores),
+        func.avg(Sesion.tiempo_promedio_respuesta)
+    ))).one()
+    avg_aciertos = avg_aciertos or 0
+    avg_errores = avg_errores or 0
+    avg_tiempo = avg_tiempo or 0
+    
+    # Errores más comunes (desde la matriz de confusión en memoria)
+    errores_comunes = confusion.errores_por_senal(5)
     
     return {
         "total_estudiantes": total_estudiantes,
@@ -941,6 +2093,78 @@ def obtener_estadisticas_globales(db: Session = Depends(get_db)):
     }
 
 
+# ============== DIAGNÓSTICO (SOLO ADMINISTRADORES) ==============
+
+@app.get("/admin/perfil", response_class=PlainTextResponse, dependencies=[Depends(requerir_admin)])
+async def perfil_muestreado(segundos: float = 5.0, modo: str = "wall", intervalo_ms: float = 5.0):
+    """Perfil muestreado de todos los hilos en formato collapsed stacks (flamegraph)"""
+    if modo not in ("wall", "cpu"):
+        raise HTTPException(status_code=400, detail="modo debe ser 'wall' o 'cpu'")
+    segundos = min(max(segundos, 0.1), 60.0)
+    collapsed = await asyncio.to_thread(perfilado.perfilar, segundos, max(intervalo_ms, 1.0) / 1000, modo)
+    return PlainTextResponse(collapsed)
+
+@app.get("/admin/perfil/{perfil_id}", response_class=PlainTextResponse, dependencies=[Depends(requerir_admin)])
+def perfil_de_peticion(perfil_id: str):
+    """Perfil de una petición hecha con las cabeceras X-Perfil: 1 y X-Admin-Token"""
+    collapsed = perfilado.perfiles_recientes.obtener(perfil_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return PlainTextResponse(collapsed)
+
+@app.get("/admin/consultas_lentas", dependencies=[Depends(requerir_admin)])
+def listar_consultas_lentas(umbral_ms: Optional[float] = None):
+    """Últimas consultas SQL lentas con su plan; 'umbral_ms' cambia el umbral en caliente"""
+    if umbral_ms is not None:
+        perfilado.consultas_lentas.umbral_ms = umbral_ms
+    return {
+        "umbral_ms": perfilado.consultas_lentas.umbral_ms,
+        "consultas": list(perfilado.consultas_lentas.consultas)[::-1]
+    }
+
+@app.post("/admin/memoria/iniciar", dependencies=[Depends(requerir_admin)])
+def iniciar_memoria(marcos: int = 10):
+    perfilado.memoria.iniciar(marcos)
+    return {"mensaje": "tracemalloc activo; instantánea base tomada"}
+
+@app.get("/admin/memoria/diferencia", dependencies=[Depends(requerir_admin)])
+def diferencia_memoria(top: int = 20, agrupar: str = "lineno", reiniciar_base: bool = False):
+    """Asignaciones que más crecieron desde la instantánea base"""
+    if agrupar not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="agrupar debe ser 'lineno', 'filename' o 'traceback'")
+    try:
+        return perfilado.memoria.diferencia(top, agrupar, reiniciar_base)
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/memoria/detener", dependencies=[Depends(requerir_admin)])
+def detener_memoria():
+    perfilado.memoria.detener()
+    return {"mensaje": "tracemalloc detenido"}
+
+@app.post("/admin/retencion", dependencies=[Depends(requerir_admin)])
+async def ejecutar_retencion():
+    """Ejecuta ahora la retención (archiva, resume y borra eventos antiguos)"""
+    return await asyncio.to_thread(retencion.ejecutar, _detener_tareas)
+
+@app.get("/admin/retencion", dependencies=[Depends(requerir_admin)])
+def estado_retencion():
+    return {
+        "dias": retencion.dias,
+        "en_curso": retencion.en_curso,
+        "ultima_ejecucion": retencion.ultima_ejecucion,
+        "archivos": retencion.archivos()
+    }
+
+@app.get("/admin/retencion/archivos/{nombre}", dependencies=[Depends(requerir_admin)])
+def descargar_archivo_retencion(nombre: str):
+    """Descarga un archivo .jsonl.gz con los eventos archivados"""
+    ruta = retencion.ruta_archivo(nombre)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    return FileResponse(ruta, media_type="application/gzip", filename=nombre)
+
+
 # ============== ARCHIVOS ESTÁTICOS ==============
 
 # Montar archivos estáticos para el panel web
@@ -955,4 +2179,26 @@ async def panel_instructor():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    puerto = int(os.getenv("SERVICIO_PUERTO", "8000"))
+    workers = int(os.getenv("SERVICIO_WORKERS", "1"))
+    
+    if workers > 1:
+        # Modo multi-worker: un proceso escritor único y el modelo compartido
+        # por memoria mapeada; los workers heredan la configuración por entorno
+        from escritor import iniciar_proceso_escritor, SOCKET_POR_DEFECTO
+        from modelo_compartido import exportar_modelo_plano, DIRECTORIO_PLANO
+        
+        ruta_socket = os.path.abspath(os.getenv("ESCRITOR_SOCKET", SOCKET_POR_DEFECTO))
+        proceso_escritor = iniciar_proceso_escritor(ruta_socket)
+        os.environ["ESCRITOR_SOCKET"] = ruta_socket
+        
+        if exportar_modelo_plano(directorio=DIRECTORIO_PLANO):
+            os.environ["MODELO_PLANO_DIR"] = os.path.abspath(DIRECTORIO_PLANO)
+        
+        try:
+            uvicorn.run("servicio:app", host="0.0.0.0", port=puerto, workers=workers)
+        finally:
+            proceso_escritor.terminate()
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=puerto)
@@ -0,0 +1,111 @@
+"""
+Registro en memoria de las sesiones abiertas.
+
+La ingesta valida la sesión contra este registro en lugar de consultar la
+tabla sesiones en cada evento; solo si no está (sesión de otro worker, o
+creada antes de reiniciar) se lee de la BD y se agrega. Cada sesión lleva
+además su estado de juego en curso (zona, ronda, dificultad y contadores).
+
+Una sesión entra al crearse (POST /sesiones) o en el primer evento que no
+la encuentra, y sale al finalizar (PUT /sesiones/{id}) o tras
+SESIONES_INACTIVIDAD_S segundos sin eventos. El registro es de cada worker.
+"""
+import os
+import threading
+import time
+
+import instrumentacion
+
+INACTIVIDAD = float(os.getenv("SESIONES_INACTIVIDAD_S", "1800"))
+
+instrumentacion.registro.describir("sesiones_activas_consultas_total", "counter",
+                                   "Búsquedas en el registro de sesiones activas por resultado")
+
+
+class SesionActiva:
+    """Estado compacto de una sesión en curso"""
+    __slots__ = ("sesion_id", "estudiante_id", "zona", "ronda", "dificultad",
+                 "intentos", "aciertos", "errores", "ultimo_evento")
+
+    def __init__(self, sesion_id: int, estudiante_id: int, dificultad: int = 0):
+        self.sesion_id = sesion_id
+        self.estudiante_id = estudiante_id
+        self.zona = 0
+        self.ronda = 0
+        self.dificultad = dificultad
+        self.intentos = 0
+        self.aciertos = 0
+        self.errores = 0
+        self.ultimo_evento = time.monotonic()
+
+    def como_dict(self) -> dict:
+        datos = {campo: getattr(self, campo) for campo in self.__slots__ if campo != "ultimo_evento"}
+        datos["inactiva_segundos"] = round(time.monotonic() - self.ultimo_evento, 1)
+        return datos
+
+
+class RegistroSesiones:
+    def __init__(self, inactividad: float = INACTIVIDAD):
+        self.inactividad = inactividad
+        self._sesiones = {}
+        self._lock = threading.Lock()
+
+    def abrir(self, sesion_id: int, estudiante_id: int, dificultad: int = 0) -> SesionActiva:
+        with self._lock:
+            sesion = self._sesiones.get(sesion_id)
+            if sesion is None:
+                sesion = self._sesiones[sesion_id] = SesionActiva(sesion_id, estudiante_id, dificultad)
+            return sesion
+
+    def obtener(self, sesion_id: int):
+        """La sesión si está abierta en este worker (None si hay que ir a la BD)"""
+        sesion = self._sesiones.get(sesion_id)
+        instrumentacion.registro.incrementar("sesiones_activas_consultas_total",
+                                             (("resultado", "acierto" if sesion is not None else "fallo"),))
+        return sesion
+
+    def cerrar(self, sesion_id: int):
+        with self._lock:
+            self._sesiones.pop(sesion_id, None)
+
+    def registrar_intento(self, intento):
+        sesion = self._sesiones.get(intento.sesion_id)
+        if sesion is None:
+            return
+        with self._lock:
+            sesion.zona, sesion.ronda, sesion.dificultad = intento.zona, intento.ronda, intento.dificultad
+            sesion.intentos += 1
+            if intento.fue_correcta:
+                sesion.aciertos += 1
+            else:
+                sesion.errores += 1
+            sesion.ultimo_evento = time.monotonic()
+
+    def registrar_evento(self, sesion_id: int, **estado):
+        """Errores y ajustes: solo actualizan el estado que traen (zona, dificultad...)"""
+        sesion = self._sesiones.get(sesion_id)
+        if sesion is None:
+            return
+        with self._lock:
+            for campo, valor in estado.items():
+                setattr(sesion, campo, valor)
+            sesion.ultimo_evento = time.monotonic()
+
+    def purgar(self) -> int:
+        """Quita las sesiones sin eventos durante 'inactividad' segundos"""
+        limite = time.monotonic() - self.inactividad
+        with self._lock:
+            inactivas = [s for s, sesion in self._sesiones.items() if sesion.ultimo_evento < limite]
+            for sesion_id in inactivas:
+                del self._sesiones[sesion_id]
+        return len(inactivas)
+
+    def listar(self) -> list:
+        with self._lock:
+            return [s.como_dict() for s in self._sesiones.values()]
+
+    def __len__(self):
+        return len(self._sesiones)
+
+
+sesiones_activas = RegistroSesiones()
@@ -0,0 +1,139 @@
+"""
+Tabla de símbolos para nombres de señales.
+
+Asigna a cada nombre de señal un ID entero denso (0, 1, 2, ...) para poder
+indexar arreglos NumPy por señal en lugar de usar diccionarios de strings.
+
+La tabla solo crece, así que un cliente que descargó los primeros n nombres
+puede seguir usando sus IDs; huella(n) permite comprobar que ese prefijo
+coincide con el del servidor (formato_binario.py).
+
+Hay dos tablas globales: senales, el eje de los arreglos por señal, que solo
+recibe valores de nombre_senal, y codigos, la del formato binario, donde
+también se registran las respuestas.
+
+codigos es una TablaPersistente: sus nombres se guardan en SIMBOLOS_RUTA (un
+nombre por línea) y todos los workers la comparten, así que la versión que
+publica GET /simbolos es la misma en cualquiera. Como las respuestas viajan
+como i16, admite como mucho SIMBOLOS_MAXIMO nombres (32767).
+"""
+import os
+import threading
+import zlib
+
+from snapshots import bloqueo
+
+RUTA = os.getenv("SIMBOLOS_RUTA", "simbolos_codigos.txt")
+MAXIMO = min(int(os.getenv("SIMBOLOS_MAXIMO", "32767")), 32767)
+
+
+class TablaLlena(ValueError):
+    """No caben más nombres en la tabla"""
+
+
+class TablaSimbolos:
+    """Mapa bidireccional nombre <-> ID entero, seguro entre hilos"""
+
+    def __init__(self, nombres=()):
+        self._ids = {}
+        self._nombres = []
+        self._huellas = [0]  # CRC32 acumulado de los primeros i nombres
+        self._lock = threading.Lock()
+        for nombre in nombres:
+            self.id(nombre)
+
+    def id(self, nombre: str) -> int:
+        """Devuelve el ID del nombre, registrándolo si es nuevo"""
+        existente = self._ids.get(nombre)
+        if existente is not None:
+            return existente
+        with self._lock:
+            existente = self._ids.get(nombre)
+            if existente is None:
+                existente = len(self._nombres)
+                self._nombres.append(nombre)
+                self._huellas.append(zlib.crc32(nombre.encode("utf-8") + b"\n", self._huellas[-1]))
+                self._ids[nombre] = existente
+            return existente
+
+    def buscar(self, nombre: str):
+        """ID del nombre o None si no está registrado"""
+        return self._ids.get(nombre)
+
+    def nombre(self, id_simbolo: int) -> str:
+        return self._nombres[id_simbolo]
+
+    def nombres(self) -> list:
+        return list(self._nombres)
+
+    def huella(self, n: int = None) -> int:
+        """CRC32 de los primeros n nombres (de todos si n es None)"""
+        return self._huellas[len(self._nombres) if n is None else n]
+
+    def __len__(self):
+        return len(self._nombres)
+
+    def __contains__(self, nombre):
+        return nombre in self._ids
+
+
+class TablaPersistente(TablaSimbolos):
+    """TablaSimbolos respaldada por un archivo compartido entre procesos.
+
+    Registrar un nombre nuevo toma un flock, carga lo que agregaron otros
+    procesos y recién entonces lo añade al final: el orden (y los IDs) del
+    archivo mandan. actualizar() trae los nombres nuevos sin bloquear."""
+
+    def __init__(self, ruta: str = RUTA, maximo: int = MAXIMO):
+        super().__init__()
+        self.ruta = ruta
+        self.maximo = maximo
+        self._leidos = 0  # bytes del archivo ya cargados
+
+    def actualizar(self):
+        """Carga los nombres que otros procesos agregaron al archivo"""
+        try:
+            if os.path.getsize(self.ruta) == self._leidos:
+                return
+            with open(self.ruta, "rb") as f:
+                f.seek(self._leidos)
+                datos = f.read()
+        except FileNotFoundError:
+            return
+        # Solo líneas completas: otro proceso puede estar escribiendo la última
+        completo = datos[:datos.rfind(b"\n") + 1]
+        for linea in completo.splitlines():
+            super().id(linea.decode("utf-8"))
+        self._leidos += len(completo)
+
+    def id(self, nombre: str) -> int:
+        existente = self._ids.get(nombre)
+        if existente is not None:
+            return existente
+        if not nombre or "\n" in nombre:
+            raise ValueError(f"Nombre de símbolo inválido: {nombre!r}")
+        with bloqueo(self.ruta):
+            self.actualizar()
+            existente = self._ids.get(nombre)
+            if existente is not None:
+                return existente
+            if len(self) >= self.maximo:
+                raise TablaLlena(f"La tabla de símbolos ya tiene {self.maximo} nombres")
+            linea = (nombre + "\n").encode("utf-8")
+            with open(self.ruta, "ab") as f:
+                # Una línea a medias es de un proceso que murió escribiendo
+                f.truncate(self._leidos)
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+            self._leidos += len(linea)
+            return super().id(nombre)
+
+
+# Tabla global de señales compartida por los módulos del servicio (maestría,
+# confusión, percentiles, planificador): cada ID es una señal
+senales = TablaSimbolos()
+
+# Códigos del formato binario: señales y respuestas comparten el espacio de
+# IDs, así que una respuesta como "Tiempo agotado" no debe entrar en senales
+codigos = TablaPersistente()
@@ -0,0 +1,471 @@
+"""
+Simulador de políticas de dificultad con estudiantes sintéticos.
+
+Reproduce el bucle del juego (GameManager / PerformanceTracker) para
+poblaciones grandes, con todos los estudiantes de un bloque avanzando a la
+vez como operaciones sobre arreglos NumPy:
+
+  - Cada sesión recorre --zonas zonas. Una zona termina cuando se jugaron
+    rondas_minimas_para_completar rondas y la tasa de aciertos de la ventana
+    reciente (últimos 5 intentos) llega a tasa_aciertos_minima, o al llegar a
+    rondas_por_zona. Al cambiar de zona la ventana se vacía.
+  - Una ronda muestra senales_dificultad_* señales distintas, cada una con
+    tiempo_dificultad_* segundos para responder.
+  - Tras cada ronda la política elige la dificultad siguiente con las mismas
+    entradas que /predecir: zona, señales de la dificultad actual y los
+    aciertos, errores y tiempo promedio de la ventana.
+
+Políticas:
+
+    modelo   el RandomForest de modelo_dificultad.pkl (o el bosque plano de
+             MODELO_PLANO_DIR), evaluado por lotes. Dos entradas que caen en
+             los mismos intervalos entre umbrales tienen la misma predicción,
+             así que se predice una sola fila por combinación de intervalos y
+             el resultado queda en una tabla densa indexada por esa
+             combinación: pasado el arranque casi no se llama al modelo
+    umbral   el fallback de /predecir (aciertos / señales mostradas)
+    fija     siempre dificultad_inicial (línea base)
+
+Modelo de estudiante (supuestos del simulador, no medidos):
+
+  - Habilidad por señal en escala logit: aptitud del estudiante + dificultad
+    propia de la señal + ruido. P(acierto) = sigmoide(habilidad - penalización
+    de la dificultad), que representa los distractores de Media y Alta.
+  - Tiempo de respuesta log-normal, más rápido cuanto mayor la habilidad.
+    Si supera el límite de la dificultad es tiempo agotado (error, con el
+    límite como tiempo registrado).
+  - Cada exposición sube la habilidad en tasa * (1 - p), el doble si fue un
+    error (se muestra retroalimentación). Entre sesiones se olvida una
+    fracción de lo aprendido.
+  - Una señal está dominada con P(acierto en Baja) >= --umbral-dominio; el
+    estudiante, cuando el promedio sobre todas sus señales llega a ese valor.
+
+La configuración parte de los valores por defecto de ConfiguracionEvaluacion
+(o de la activa en la base con --desde-bd) y se puede cambiar por opción.
+Todas las políticas ven las mismas poblaciones (mismas semillas por bloque).
+Los bloques se reparten entre --procesos procesos.
+
+Uso:
+    python simulador.py [--estudiantes 200000] [--sesiones 5] [--politicas modelo,umbral,fija]
+                        [--procesos 4] [--tiempos 12,8,5] [--json resultados.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from modelo_compartido import BosquePlano, aplanar_bosque
+
+N_DIFICULTADES = 3
+VENTANA = 5                 # PerformanceTracker.ventanaReciente
+PANEL_RESULTADO_S = 5.0     # GameManager.tiempoPanelResultado, entre rondas
+
+# Mismos valores por defecto que ConfiguracionEvaluacion
+CONFIGURACION_POR_DEFECTO = {
+    "senales": (3, 5, 7),
+    "tiempos": (12.0, 8.0, 5.0),
+    "dificultad_inicial": 0,
+    "rondas_por_zona": 6,
+    "rondas_minimas_para_completar": 4,
+    "tasa_aciertos_minima": 0.7,
+}
+
+# Parámetros de la población sintética
+PENALIZACION_DIFICULTAD = np.array([0.0, 0.4, 0.8])
+TIEMPO_MEDIANO_S = 3.5
+SENSIBILIDAD_TIEMPO = 0.25
+TASA_APRENDIZAJE = 0.15
+OLVIDO_ENTRE_SESIONES = 0.1
+
+
+def cargar_configuracion_bd() -> dict:
+    """Configuración activa de la base (ConfiguracionEvaluacion)"""
+    from database import SessionLocal, ConfiguracionEvaluacion
+    db = SessionLocal()
+    try:
+        config = db.query(ConfiguracionEvaluacion).filter(ConfiguracionEvaluacion.activa == True).first()
+        if config is None:
+            return dict(CONFIGURACION_POR_DEFECTO)
+        return {
+            "senales": (config.senales_dificultad_baja, config.senales_dificultad_media,
+                        config.senales_dificultad_alta),
+            "tiempos": (config.tiempo_dificultad_baja, config.tiempo_dificultad_media,
+                        config.tiempo_dificultad_alta),
+            "dificultad_inicial": config.dificultad_inicial,
+            "rondas_por_zona": config.rondas_por_zona,
+            "rondas_minimas_para_completar": config.rondas_minimas_para_completar,
+            "tasa_aciertos_minima": config.tasa_aciertos_minima,
+        }
+    finally:
+        db.close()
+
+
+# ============== POLÍTICAS ==============
+
+class PoliticaModelo:
+    """Bosque de dificultad evaluado por lotes, con caché por intervalos entre umbrales"""
+
+    MAX_TABLA = 1 << 26
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        nodos = modelo.nodos if isinstance(modelo, BosquePlano) else aplanar_bosque(modelo)[0]
+        hoja = np.asarray(nodos["izquierdo"]) == -1
+        caracteristica = np.asarray(nodos["caracteristica"])
+        umbral = np.asarray(nodos["umbral"])
+        # Umbrales ordenados por columna; el modelo compara en float32 (ver BosquePlano.hojas)
+        self.umbrales = [np.unique(umbral[~hoja & (caracteristica == c)]) for c in range(5)]
+        self.radices = [len(u) + 1 for u in self.umbrales]
+        combinaciones = int(np.prod(self.radices, dtype=np.float64))
+        self.tabla = np.full(combinaciones, -1, dtype=np.int8) if combinaciones <= self.MAX_TABLA else None
+
+    @classmethod
+    def cargar(cls):
+        if os.getenv("MODELO_PLANO_DIR"):
+            return cls(BosquePlano.cargar(os.environ["MODELO_PLANO_DIR"]))
+        import joblib
+        return cls(joblib.load("modelo_dificultad.pkl"))
+
+    def _predecir(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(self.modelo.predict(X), dtype=np.int64)
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        X32 = X.astype(np.float32).astype(np.float64)
+        clave = np.zeros(len(X), dtype=np.int64)
+        for c, umbrales in enumerate(self.umbrales):
+            clave = clave * self.radices[c] + np.searchsorted(umbrales, X32[:, c], side="left")
+
+        if self.tabla is None:
+            _, representantes, inversa = np.unique(clave, return_index=True, return_inverse=True)
+            return self._predecir(X[representantes])[inversa]
+
+        resultado = self.tabla[clave]
+        faltan = resultado < 0
+        if faltan.any():
+            nuevas, representantes = np.unique(clave[faltan], return_index=True)
+            self.tabla[nuevas] = self._predecir(X[faltan][representantes])
+            resultado = self.tabla[clave]
+        return resultado.astype(np.int64)
+
+
+def politica_umbral(X: np.ndarray) -> np.ndarray:
+    """Fallback de /predecir"""
+    tasa = X[:, 2] / np.maximum(X[:, 1], 1)
+    return np.where(tasa >= 0.8, 2, np.where(tasa >= 0.5, 1, 0))
+
+
+def crear_politica(nombre: str, configuracion: dict):
+    if nombre == "modelo":
+        return PoliticaModelo.cargar()
+    if nombre == "umbral":
+        return politica_umbral
+    if nombre == "fija":
+        inicial = configuracion["dificultad_inicial"]
+        return lambda X: np.full(len(X), inicial, dtype=np.int64)
+    raise ValueError(f"Política desconocida: {nombre}")
+
+
+# ============== SIMULACIÓN ==============
+
+def _sigmoide(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _ventana(ventana_ok, ventana_t, ventana_n, ok, t, validos):
+    """Agrega los intentos de la ronda a la ventana de los últimos VENTANA.
+    Devuelve la ventana nueva (ok, t) y sus intentos, aciertos y tiempo promedio"""
+    m = len(ok)
+    validos_v = np.arange(VENTANA)[None, :] >= VENTANA - ventana_n[:, None]
+    todos_ok = np.concatenate([ventana_ok, ok], axis=1)
+    todos_t = np.concatenate([ventana_t, t], axis=1)
+    todos_validos = np.concatenate([validos_v, validos], axis=1)
+
+    desde_final = np.cumsum(todos_validos[:, ::-1], axis=1)[:, ::-1]
+    conservar = todos_validos & (desde_final <= VENTANA)
+    aciertos = (todos_ok & conservar).sum(axis=1)
+    intentos = conservar.sum(axis=1)
+    tiempo_promedio = (todos_t * conservar).sum(axis=1) / np.maximum(intentos, 1)
+
+    nuevo_ok = np.zeros((m, VENTANA), dtype=bool)
+    nuevo_t = np.zeros((m, VENTANA))
+    filas, columnas = np.nonzero(conservar)
+    posicion = VENTANA - desde_final[filas, columnas]
+    nuevo_ok[filas, posicion] = todos_ok[filas, columnas]
+    nuevo_t[filas, posicion] = todos_t[filas, columnas]
+    return nuevo_ok, nuevo_t, intentos, aciertos, tiempo_promedio
+
+
+def simular_bloque(politica, configuracion: dict, n_estudiantes: int, n_senales: int, n_sesiones: int,
+                   n_zonas: int, umbral_dominio: float, semilla) -> dict:
+    """Simula n_sesiones sesiones de n_estudiantes; devuelve agregados sumables"""
+    semilla_poblacion, semilla_juego = semilla.spawn(2)
+    rng = np.random.default_rng(semilla_poblacion)
+    aptitud = rng.normal(0.0, 1.0, size=(n_estudiantes, 1))
+    dificultad_senal = rng.normal(0.0, 0.7, size=(1, n_senales))
+    habilidad_inicial = aptitud + dificultad_senal + rng.normal(0.0, 0.5, size=(n_estudiantes, n_senales))
+    tasa_aprendizaje = TASA_APRENDIZAJE * rng.lognormal(0.0, 0.4, size=n_estudiantes)
+    tiempo_base = TIEMPO_MEDIANO_S * rng.lognormal(0.0, 0.3, size=n_estudiantes)
+    habilidad = habilidad_inicial.copy()
+    rng = np.random.default_rng(semilla_juego)
+
+    senales_dif = np.asarray(configuracion["senales"], dtype=np.int64)
+    tiempos_dif = np.asarray(configuracion["tiempos"], dtype=np.float64)
+    max_senales = int(senales_dif.max())
+    rondas_max = configuracion["rondas_por_zona"]
+    rondas_min = configuracion["rondas_minimas_para_completar"]
+    tasa_min = configuracion["tasa_aciertos_minima"]
+    rondas_sesion = n_zonas * rondas_max
+
+    r = {
+        "estudiantes": n_estudiantes,
+        "sesiones": np.zeros(n_sesiones, dtype=np.int64),
+        "intentos": np.zeros(n_sesiones, dtype=np.int64),
+        "aciertos": np.zeros(n_sesiones, dtype=np.int64),
+        "agotados": np.zeros(n_sesiones, dtype=np.int64),
+        "rondas": np.zeros(n_sesiones, dtype=np.int64),
+        "duracion_s": np.zeros(n_sesiones),
+        "dominio": np.zeros(n_sesiones),
+        "dominados": np.zeros(n_sesiones, dtype=np.int64),
+        "rondas_por_dificultad": np.zeros((n_sesiones, N_DIFICULTADES), dtype=np.int64),
+        "aciertos_por_ronda": np.zeros(rondas_sesion, dtype=np.int64),
+        "intentos_por_ronda": np.zeros(rondas_sesion, dtype=np.int64),
+        "intentos_hasta_dominio": np.full(n_estudiantes, -1, dtype=np.int64),
+        "sesiones_hasta_dominio": np.full(n_estudiantes, -1, dtype=np.int64),
+    }
+    intentos_acumulados = np.zeros(n_estudiantes, dtype=np.int64)
+    dominado = np.zeros(n_estudiantes, dtype=bool)
+
+    for sesion in range(n_sesiones):
+        if sesion:
+            habilidad = habilidad_inicial + (habilidad - habilidad_inicial) * (1 - OLVIDO_ENTRE_SESIONES)
+        zona = np.zeros(n_estudiantes, dtype=np.int64)
+        ronda = np.zeros(n_estudiantes, dtype=np.int64)
+        ronda_sesion = np.zeros(n_estudiantes, dtype=np.int64)
+        dificultad = np.full(n_estudiantes, configuracion["dificultad_inicial"], dtype=np.int64)
+        ventana_ok = np.zeros((n_estudiantes, VENTANA), dtype=bool)
+        ventana_t = np.zeros((n_estudiantes, VENTANA))
+        ventana_n = np.zeros(n_estudiantes, dtype=np.int64)
+        ventana_aciertos = np.zeros(n_estudiantes, dtype=np.int64)
+        activos = np.arange(n_estudiantes)
+        r["sesiones"][sesion] = n_estudiantes
+
+        while activos.size:
+            # EvaluarCompletitudZona antes de cada ronda
+            tasa = ventana_aciertos[activos] / np.maximum(ventana_n[activos], 1)
+            ronda_a = ronda[activos]
+            completa = (ronda_a >= rondas_min) & ((tasa >= tasa_min) | (ronda_a >= rondas_max))
+            if completa.any():
+                cambian = activos[completa]
+                zona[cambian] += 1
+                ronda[cambian] = 0
+                ventana_n[cambian] = 0
+                ventana_aciertos[cambian] = 0
+                activos = activos[zona[activos] < n_zonas]
+                if not activos.size:
+                    break
+
+            # Ronda: señales distintas al azar, las primeras senales_dif[dificultad]
+            dif = dificultad[activos]
+            m = activos.size
+            cantidad = senales_dif[dif]
+            mostradas = np.argpartition(rng.random((m, n_senales)), max_senales - 1, axis=1)[:, :max_senales]
+            validos = np.arange(max_senales)[None, :] < cantidad[:, None]
+            h = habilidad[activos[:, None], mostradas]
+
+            p = _sigmoide(h - PENALIZACION_DIFICULTAD[dif][:, None])
+            t = tiempo_base[activos, None] * np.exp(-SENSIBILIDAD_TIEMPO * h) * rng.lognormal(0.0, 0.35, size=(m, max_senales))
+            limite = tiempos_dif[dif][:, None]
+            agotado = t > limite
+            ok = ~agotado & (rng.random((m, max_senales)) < p) & validos
+            t = np.where(agotado, limite, t)
+
+            ganancia = tasa_aprendizaje[activos, None] * (1 - p) * np.where(ok, 1.0, 2.0) * validos
+            habilidad[activos[:, None], mostradas] = h + ganancia
+
+            n_intentos = int(validos.sum())
+            r["intentos"][sesion] += n_intentos
+            r["aciertos"][sesion] += int(ok.sum())
+            r["agotados"][sesion] += int((agotado & validos).sum())
+            r["rondas"][sesion] += m
+            r["duracion_s"][sesion] += float((t * validos).sum()) + m * PANEL_RESULTADO_S
+            r["rondas_por_dificultad"][sesion] += np.bincount(dif, minlength=N_DIFICULTADES)
+            indice_ronda = np.minimum(ronda_sesion[activos], rondas_sesion - 1)
+            r["aciertos_por_ronda"] += np.bincount(indice_ronda, weights=ok.sum(axis=1), minlength=rondas_sesion).astype(np.int64)
+            r["intentos_por_ronda"] += np.bincount(indice_ronda, weights=cantidad, minlength=rondas_sesion).astype(np.int64)
+            intentos_acumulados[activos] += cantidad
+
+            nuevos = ~dominado[activos]
+            if nuevos.any():
+                candidatos = activos[nuevos]
+                logro = _sigmoide(habilidad[candidatos]).mean(axis=1) >= umbral_dominio
+                ahora = candidatos[logro]
+                dominado[ahora] = True
+                r["intentos_hasta_dominio"][ahora] = intentos_acumulados[ahora]
+                r["sesiones_hasta_dominio"][ahora] = sesion + 1
+
+            (ventana_ok[activos], ventana_t[activos], ventana_n[activos], ventana_aciertos[activos],
+             tiempo_promedio) = _ventana(ventana_ok[activos], ventana_t[activos], ventana_n[activos],
+                                         ok, t, validos)
+            ronda[activos] += 1
+            ronda_sesion[activos] += 1
+
+            # Misma entrada que AIServiceClient envía a /predecir
+            aciertos_v = ventana_aciertos[activos]
+            X = np.column_stack([zona[activos], cantidad, aciertos_v, ventana_n[activos] - aciertos_v,
+                                 tiempo_promedio]).astype(np.float64)
+            dificultad[activos] = np.clip(politica(X), 0, N_DIFICULTADES - 1)
+
+        r["dominio"][sesion] = float(_sigmoide(habilidad).mean(axis=1).sum())
+        r["dominados"][sesion] = int(dominado.sum())
+    return r
+
+
+# ============== REPARTO EN PROCESOS ==============
+
+_politicas = {}
+
+
+def _ejecutar_bloque(tarea):
+    nombre, configuracion, n_estudiantes, opciones, semilla = tarea
+    if nombre not in _politicas:
+        _politicas[nombre] = crear_politica(nombre, configuracion)
+    return simular_bloque(_politicas[nombre], configuracion, n_estudiantes, semilla=semilla, **opciones)
+
+
+def _sumar(total: dict, parcial: dict) -> dict:
+    if not total:
+        return parcial
+    for clave, valor in parcial.items():
+        if clave.endswith("_hasta_dominio"):
+            total[clave] = np.concatenate([total[clave], valor])
+        else:
+            total[clave] = total[clave] + valor
+    return total
+
+
+def simular(nombre: str, configuracion: dict, estudiantes: int, bloque: int, procesos: int,
+            semilla: int, **opciones) -> dict:
+    tamanos = [min(bloque, estudiantes - i) for i in range(0, estudiantes, bloque)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+    tareas = [(nombre, configuracion, n, opciones, s) for n, s in zip(tamanos, semillas)]
+    total = {}
+    if procesos <= 1:
+        for tarea in tareas:
+            total = _sumar(total, _ejecutar_bloque(tarea))
+        return total
+    with multiprocessing.Pool(procesos) as pool:
+        for parcial in pool.imap_unordered(_ejecutar_bloque, tareas):
+            total = _sumar(total, parcial)
+    return total
+
+
+# ============== INFORME ==============
+
+def resumir(r: dict) -> dict:
+    sesiones = int(r["sesiones"].sum())
+    intentos = int(r["intentos"].sum())
+    rondas_dif = r["rondas_por_dificultad"].sum(axis=0)
+    hasta = r["intentos_hasta_dominio"]
+    logrado = hasta[hasta >= 0]
+    sesiones_hasta = r["sesiones_hasta_dominio"]
+    return {
+        "sesiones": sesiones,
+        "intentos": intentos,
+        "tasa_aciertos": round(int(r["aciertos"].sum()) / max(intentos, 1), 4),
+        "tasa_agotados": round(int(r["agotados"].sum()) / max(intentos, 1), 4),
+        "rondas_por_sesion": round(int(r["rondas"].sum()) / max(sesiones, 1), 2),
+        "minutos_por_sesion": round(float(r["duracion_s"].sum()) / max(sesiones, 1) / 60, 2),
+        "rondas_por_dificultad": (rondas_dif / max(int(rondas_dif.sum()), 1)).round(4).tolist(),
+        "curva_por_sesion": [
+            {
+                "sesion": i + 1,
+                "tasa_aciertos": round(int(r["aciertos"][i]) / max(int(r["intentos"][i]), 1), 4),
+                "dominio_medio": round(float(r["dominio"][i]) / r["estudiantes"], 4),
+                "fraccion_dominada": round(int(r["dominados"][i]) / r["estudiantes"], 4),
+            }
+            for i in range(len(r["sesiones"]))
+        ],
+        "curva_por_ronda": (r["aciertos_por_ronda"] / np.maximum(r["intentos_por_ronda"], 1)).round(4).tolist(),
+        "dominio": {
+            "fraccion": round(logrado.size / max(hasta.size, 1), 4),
+            "intentos_p50": int(np.percentile(logrado, 50)) if logrado.size else None,
+            "intentos_p90": int(np.percentile(logrado, 90)) if logrado.size else None,
+            "sesiones_p50": int(np.percentile(sesiones_hasta[sesiones_hasta >= 0], 50)) if logrado.size else None,
+        },
+    }
+
+
+def imprimir(resultados: dict):
+    print(f"\n{'política':<10}{'sesiones':>11}{'aciertos':>10}{'agotados':>10}{'rondas':>8}{'min':>7}"
+          f"{'% B/M/A':>16}{'dominio':>9}{'int. p50':>10}{'int. p90':>10}")
+    for nombre, res in resultados.items():
+        reparto = "/".join(f"{100 * f:.0f}" for f in res["rondas_por_dificultad"])
+        d = res["dominio"]
+        print(f"{nombre:<10}{res['sesiones']:>11,}{res['tasa_aciertos']:>10.1%}{res['tasa_agotados']:>10.1%}"
+              f"{res['rondas_por_sesion']:>8.1f}{res['minutos_por_sesion']:>7.1f}{reparto:>16}"
+              f"{d['fraccion']:>9.1%}{d['intentos_p50'] if d['intentos_p50'] is not None else '-':>10}"
+              f"{d['intentos_p90'] if d['intentos_p90'] is not None else '-':>10}")
+
+    print("\nCurva de aprendizaje (tasa de aciertos / dominio medio por sesión):")
+    for nombre, res in resultados.items():
+        print(f"  {nombre:<8} " + "  ".join(f"{c['tasa_aciertos']:.2f}/{c['dominio_medio']:.2f}"
+                                            for c in res["curva_por_sesion"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--estudiantes", type=int, default=200_000)
+    parser.add_argument("--sesiones", type=int, default=5, help="Sesiones por estudiante")
+    parser.add_argument("--politicas", default="modelo,umbral,fija")
+    parser.add_argument("--zonas", type=int, default=4)
+    parser.add_argument("--senales", type=int, default=20, help="Señales distintas del juego")
+    parser.add_argument("--umbral-dominio", type=float, default=0.9)
+    parser.add_argument("--bloque", type=int, default=50_000, help="Estudiantes por bloque (unidad de reparto)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--desde-bd", action="store_true", help="Partir de la ConfiguracionEvaluacion activa")
+    parser.add_argument("--tiempos", help="Segundos por señal en Baja,Media,Alta (ej. 12,8,5)")
+    parser.add_argument("--senales-por-dificultad", help="Señales por ronda en Baja,Media,Alta (ej. 3,5,7)")
+    parser.add_argument("--dificultad-inicial", type=int)
+    parser.add_argument("--rondas-por-zona", type=int)
+    parser.add_argument("--rondas-minimas", type=int)
+    parser.add_argument("--tasa-minima", type=float)
+    parser.add_argument("--json", help="Guardar los resultados completos en este archivo")
+    args = parser.parse_args()
+
+    configuracion = cargar_configuracion_bd() if args.desde_bd else dict(CONFIGURACION_POR_DEFECTO)
+    if args.tiempos:
+        configuracion["tiempos"] = tuple(float(v) for v in args.tiempos.split(","))
+    if args.senales_por_dificultad:
+        configuracion["senales"] = tuple(int(v) for v in args.senales_por_dificultad.split(","))
+    for opcion, clave in (("dificultad_inicial", "dificultad_inicial"), ("rondas_por_zona", "rondas_por_zona"),
+                          ("rondas_minimas", "rondas_minimas_para_completar"), ("tasa_minima", "tasa_aciertos_minima")):
+        if getattr(args, opcion) is not None:
+            configuracion[clave] = getattr(args, opcion)
+    if max(configuracion["senales"]) > args.senales:
+        parser.error("--senales debe ser al menos la mayor cantidad de señales por ronda")
+    print(f"Configuración: {configuracion}")
+
+    opciones = {"n_senales": args.senales, "n_sesiones": args.sesiones, "n_zonas": args.zonas,
+                "umbral_dominio": args.umbral_dominio}
+    resultados = {}
+    for nombre in args.politicas.split(","):
+        inicio = time.perf_counter()
+        r = simular(nombre, configuracion, args.estudiantes, args.bloque, args.procesos, args.semilla, **opciones)
+        resultados[nombre] = resumir(r)
+        duracion = time.perf_counter() - inicio
+        print(f"{nombre}: {resultados[nombre]['sesiones']:,} sesiones en {duracion:.1f}s "
+              f"({resultados[nombre]['sesiones'] / duracion:,.0f} sesiones/s, {args.procesos} procesos)")
+
+    imprimir(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"configuracion": configuracion, "opciones": opciones, "resultados": resultados}, f, indent=2)
+        print(f"\nResultados en '{args.json}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Snapshots .npz compartidos entre varios workers.
+
+Cada proceso guarda solo lo que sumó desde que cargó, en su propia parte
+(<raiz>.<pid>.npz); el estado completo es la base (<ruta>) más todas las
+partes. Así ningún worker pisa los conteos de otro.
+
+Al cargar, con un flock sobre <ruta>.lock, se suman la base y todas las
+partes, y las partes de procesos que ya terminaron se funden en la base y
+se borran. Si no hay base se reconstruye desde la BD una sola vez: el
+primer worker la escribe y los demás la cargan.
+
+Los almacenes (confusion.py, cuantiles.py) implementan:
+    _leer(ruta)              datos del archivo, o None si no sirve
+    _sumar_archivo(datos)    suma esos datos al estado en memoria
+    _fijar_base()            lo que hay en memoria ya está persistido
+    guardar_snapshot(ruta)   escribe el estado completo
+"""
+import fcntl
+import glob
+import os
+from contextlib import contextmanager
+
+
+def ruta_parte(ruta: str, pid: int = None) -> str:
+    raiz, extension = os.path.splitext(ruta)
+    return f"{raiz}.{pid or os.getpid()}{extension}"
+
+
+def partes(ruta: str) -> list:
+    """[(ruta_parte, pid)] de todos los procesos"""
+    raiz, extension = os.path.splitext(ruta)
+    resultado = []
+    for parte in glob.glob(glob.escape(raiz) + ".*" + extension):
+        pid = parte[len(raiz) + 1:len(parte) - len(extension)]
+        if pid.isdigit():
+            resultado.append((parte, int(pid)))
+    return resultado
+
+
+def proceso_vivo(pid: int) -> bool:
+    """Una parte con nuestro propio pid es de un proceso anterior (aún no escribimos)"""
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def bloqueo(ruta: str):
+    with open(ruta + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def cargar(almacen, ruta: str, reconstruir=None) -> bool:
+    """Base + partes en el almacén. Sin base llama a reconstruir() (si se da)
+    y escribe el resultado como base. True si había snapshot"""
+    with bloqueo(ruta):
+        base = almacen._leer(ruta) if os.path.exists(ruta) else None
+        if base is None and reconstruir is None:
+            return False
+
+        vivas, terminadas = [], []
+        for parte, pid in partes(ruta):
+            (vivas if proceso_vivo(pid) else terminadas).append(parte)
+
+        if base is None:
+            # La BD ya incluye lo de las partes terminadas
+            reconstruir()
+        else:
+            almacen._sumar_archivo(base)
+            for parte in terminadas:
+                datos = almacen._leer(parte)
+                if datos is not None:
+                    almacen._sumar_archivo(datos)
+        if base is None or terminadas:
+            almacen.guardar_snapshot(ruta)
+        for parte in terminadas:
+            os.remove(parte)
+
+        for parte in vivas:
+            datos = almacen._leer(parte)
+            if datos is not None:
+                almacen._sumar_archivo(datos)
+        almacen._fijar_base()
+    return base is not None